@@ -0,0 +1,119 @@
+"""Aggregati mensili per la pagina analisi, aggiornati ad ogni salvataggio.
+
+Per ogni (anno, mese, tipo) tiene numero fatture, imponibile, IVA, totale e
+le scadenze ordinate: cambiare mese o anno nei selettori è una lettura di
+dizionario e il conteggio delle scadute una ricerca binaria.
+"""
+import threading
+from bisect import bisect_left, insort
+from datetime import date
+
+import archivio
+from archivio import data_fattura
+from importi import centesimi, euro
+
+
+class Cella:
+    # importi in centesimi interi: le somme e sottrazioni ad ogni salvataggio non accumulano errori
+    __slots__ = ("numero", "imponibile", "iva", "totale", "scadenze")
+
+    def __init__(self):
+        self.numero = 0
+        self.imponibile = 0
+        self.iva = 0
+        self.totale = 0
+        self.scadenze = []  # ordinali delle date di scadenza, ordinati
+
+    def somma(self, fattura, segno):
+        self.numero += segno
+        self.imponibile += segno * centesimi(fattura.get("imponibile"))
+        self.iva += segno * centesimi(fattura.get("iva"))
+        self.totale += segno * centesimi(fattura.get("totale"))
+        scadenza = data_fattura(fattura.get("scadenza"))
+        if scadenza is not None:
+            if segno > 0:
+                insort(self.scadenze, scadenza.toordinal())
+            else:
+                i = bisect_left(self.scadenze, scadenza.toordinal())
+                if i < len(self.scadenze) and self.scadenze[i] == scadenza.toordinal():
+                    del self.scadenze[i]
+
+    def riepilogo(self, oggi):
+        scadute = bisect_left(self.scadenze, oggi.toordinal())
+        return {
+            "numero": self.numero,
+            "imponibile": euro(self.imponibile),
+            "iva": euro(self.iva),
+            "totale": euro(self.totale),
+            "scadute": scadute,
+            "in_scadenza": len(self.scadenze) - scadute,
+        }
+
+
+class IndiceAggregati:
+    def __init__(self):
+        self._celle = {}
+        self._lock = threading.Lock()
+
+    def ricostruisci(self, dati):
+        celle = {}
+        for tipo in archivio.TIPI:
+            for fattura in dati.get(tipo, []):
+                self._somma(celle, tipo, fattura, 1)
+        with self._lock:
+            self._celle = celle
+
+    def aggiorna(self, tipo, vecchia, nuova):
+        with self._lock:
+            if vecchia is not None:
+                self._somma(self._celle, tipo, vecchia, -1)
+            if nuova is not None:
+                self._somma(self._celle, tipo, nuova, 1)
+
+    @staticmethod
+    def _somma(celle, tipo, fattura, segno):
+        data = data_fattura(fattura.get("data"))
+        if data is None:
+            return
+        chiave = (data.year, data.month, tipo)
+        cella = celle.get(chiave)
+        if cella is None:
+            cella = celle[chiave] = Cella()
+        cella.somma(fattura, segno)
+
+    def mese(self, anno, mese, tipo, oggi=None):
+        cella = self._celle.get((anno, mese, tipo)) or Cella()
+        return cella.riepilogo(oggi or date.today())
+
+    def anno(self, anno, tipo, oggi=None):
+        """Riepiloghi dei 12 mesi dell'anno"""
+        return [self.mese(anno, mese, tipo, oggi) for mese in range(1, 13)]
+
+
+_indice = None
+_lock_indice = threading.Lock()
+
+
+def indice_aggregati(anno=None):
+    """Indice condiviso dal processo, registrato sull'archivio alla prima chiamata;
+    con anno viene aperto solo quell'anno (vedi archivio.apri_anno)"""
+    global _indice
+    with _lock_indice:
+        if _indice is None:
+            indice = IndiceAggregati()
+            archivio.registra_indice(indice)
+            _indice = indice
+    # eventuali modifiche di altri processi arrivano all'indice tramite la rilettura
+    if anno is None:
+        archivio.carica_dati()
+    else:
+        archivio.apri_anno(anno)
+    return _indice
+
+
+def riepilogo_mese(anno, mese, tipo, oggi=None):
+    return indice_aggregati(anno).mese(anno, mese, tipo, oggi)
+
+
+def andamento_anno(anno, tipo, oggi=None):
+    return indice_aggregati(anno).anno(anno, tipo, oggi)
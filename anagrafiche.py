@@ -0,0 +1,136 @@
+"""Ricerca di clienti e fornitori per P.IVA e ragione sociale.
+
+L'indice tiene per categoria un dizionario P.IVA normalizzata -> anagrafica
+(doppioni in O(1)) e l'elenco ordinato dei suffissi della ragione sociale
+che iniziano a inizio parola: l'autocompletamento è una ricerca binaria sul
+prefisso digitato, che trova "Mario Rossi Srl" sia da "mar" sia da "rossi s".
+"""
+import threading
+from bisect import bisect_left
+
+import archivio
+
+
+def chiave_piva(piva):
+    """Stessa normalizzazione di valida_piva: senza prefisso IT, spazi e in maiuscolo"""
+    return str(piva or "").upper().replace("IT", "").replace(" ", "").strip()
+
+
+def _suffissi(ragione_sociale):
+    """Suffissi a inizio parola: Mario Rossi Srl -> mario rossi srl, rossi srl, srl"""
+    parole = str(ragione_sociale or "").lower().split()
+    return {" ".join(parole[i:]) for i in range(len(parole))}
+
+
+class _Categoria:
+    __slots__ = ("per_piva", "voci", "chiavi", "posizioni")
+
+    def __init__(self):
+        self.per_piva = {}
+        self.voci = []
+        self.chiavi = []     # suffissi ordinati
+        self.posizioni = []  # posizione in voci dell'anagrafica di ogni suffisso
+
+    def aggiungi(self, anagrafica, ordina=True):
+        posizione = len(self.voci)
+        self.voci.append(anagrafica)
+        piva = chiave_piva(anagrafica.get("piva"))
+        if piva:
+            self.per_piva.setdefault(piva, anagrafica)
+        for suffisso in _suffissi(anagrafica.get("ragione_sociale")):
+            if ordina:
+                i = bisect_left(self.chiavi, suffisso)
+                self.chiavi.insert(i, suffisso)
+                self.posizioni.insert(i, posizione)
+            else:
+                self.chiavi.append(suffisso)
+                self.posizioni.append(posizione)
+
+    def cerca(self, testo, limite):
+        testo = " ".join(str(testo).lower().split())
+        trovate, viste = [], set()
+        i = bisect_left(self.chiavi, testo)
+        while i < len(self.chiavi) and len(trovate) < limite and self.chiavi[i].startswith(testo):
+            posizione = self.posizioni[i]
+            if posizione not in viste:
+                viste.add(posizione)
+                trovate.append(self.voci[posizione])
+            i += 1
+        return trovate
+
+
+class IndiceAnagrafiche:
+    def __init__(self):
+        self._categorie = {}
+        self._lock = threading.Lock()
+
+    def ricostruisci(self, dati):
+        categorie = {}
+        for nome, anagrafiche in dati.items():
+            categoria = categorie[nome] = _Categoria()
+            for anagrafica in anagrafiche:
+                categoria.aggiungi(anagrafica, ordina=False)
+            if categoria.chiavi:
+                ordine = sorted(range(len(categoria.chiavi)), key=categoria.chiavi.__getitem__)
+                categoria.chiavi = [categoria.chiavi[i] for i in ordine]
+                categoria.posizioni = [categoria.posizioni[i] for i in ordine]
+        with self._lock:
+            self._categorie = categorie
+
+    def aggiorna(self, nome, vecchia, nuova):
+        # le anagrafiche si possono solo aggiungere (vedi FileCache.accoda)
+        if nuova is not None:
+            with self._lock:
+                self._categorie.setdefault(nome, _Categoria()).aggiungi(nuova)
+
+    def per_piva(self, nome, piva):
+        categoria = self._categorie.get(nome)
+        return categoria.per_piva.get(chiave_piva(piva)) if categoria else None
+
+    def cerca(self, nome, testo, limite=10):
+        categoria = self._categorie.get(nome)
+        if categoria is None or not str(testo).strip():
+            return []
+        return categoria.cerca(testo, limite)
+
+
+_indice = None
+_lock_indice = threading.Lock()
+
+
+def indice_anagrafiche():
+    """Indice condiviso dal processo, registrato sull'archivio alla prima chiamata"""
+    global _indice
+    with _lock_indice:
+        if _indice is None:
+            indice = IndiceAnagrafiche()
+            archivio.registra_indice_anagrafiche(indice)
+            _indice = indice
+    archivio.carica_anagrafiche()
+    return _indice
+
+
+def categoria_tipo(tipo):
+    """Fatture attive -> clienti, passive -> fornitori"""
+    return "clienti" if tipo == "Attiva" else "fornitori"
+
+
+def cerca(categoria, testo, limite=10):
+    """Anagrafiche la cui ragione sociale ha una parola che inizia con testo"""
+    return indice_anagrafiche().cerca(categoria, testo, limite)
+
+
+def per_piva(categoria, piva):
+    return indice_anagrafiche().per_piva(categoria, piva)
+
+
+def esiste(categoria, piva):
+    return per_piva(categoria, piva) is not None
+
+
+def aggiungi(categoria, anagrafica):
+    """Salva la nuova anagrafica; False se la P.IVA è già presente (anche se
+    salvata nel frattempo da un'altra sessione) o se la scrittura fallisce"""
+    indice = indice_anagrafiche()
+    return archivio.aggiungi_anagrafica(
+        categoria, anagrafica, lambda: indice.per_piva(categoria, anagrafica.get("piva")) is None)
@@ -0,0 +1,217 @@
+"""Analisi vettoriale di ricavi, costi e scadenze con pandas.
+
+Un DataFrame tipizzato per tipo (date datetime64, importi float) viene
+costruito una volta per versione dell'archivio; filtri per mese, scadute e
+fasce di anzianità sono poi operazioni su colonne, senza cicli Python.
+Somme e confronti sugli importi usano le colonne int64 in centesimi (*_cent),
+esatte anche su milioni di righe.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+import archivio
+import profilo
+from importi import centesimi, centesimi_array, euro
+
+COLONNE = ["numero", "cliente_fornitore", "piva", "imponibile", "iva_perc", "iva",
+           "totale", "pagamento", "note", "data", "scadenza", "timestamp", "id"]
+# Ordine delle colonne nella tabella paginata dello storico
+COLONNE_ARCHIVIO = ["data", "numero", "cliente_fornitore", "piva", "imponibile", "iva_perc",
+                    "iva", "totale", "pagamento", "note", "scadenza", "timestamp"]
+FASCE = ["0-30", "31-60", "61-90", "90+"]
+IMPORTI = ("imponibile", "iva", "totale")
+TESTI = ("numero", "cliente_fornitore", "piva", "note", "timestamp", "id")
+
+_cache = {"versione": None, "frame": {}}
+_lock = threading.Lock()
+
+
+def parse_date(valori):
+    """Serie di stringhe dd/mm/yyyy (o ISO) -> datetime64, NaT se non valide"""
+    date = pd.to_datetime(valori, format="%d/%m/%Y", errors="coerce")
+    altre = date.isna() & valori.notna() & (valori != "")
+    if altre.any():
+        date[altre] = pd.to_datetime(valori[altre], errors="coerce")
+    return date
+
+
+def costruisci_frame(fatture):
+    df = pd.DataFrame.from_records(fatture, columns=COLONNE) if fatture else pd.DataFrame(columns=COLONNE)
+    for colonna in ("imponibile", "iva_perc", "iva", "totale"):
+        df[colonna] = pd.to_numeric(df[colonna], errors="coerce").fillna(0.0).astype("float64")
+    for colonna in IMPORTI:
+        df[f"{colonna}_cent"] = centesimi_array(df[colonna].to_numpy())
+    df["data"] = parse_date(df["data"].astype("object"))
+    df["scadenza"] = parse_date(df["scadenza"].astype("object"))
+    # anno*100+mese: il filtro per mese diventa un confronto tra interi
+    df["periodo"] = (df["data"].dt.year * 100 + df["data"].dt.month).fillna(0).astype("int32")
+    # campi di testo mancanti (fatture vecchie senza note o timestamp) -> "": una colonna
+    # con NaN o tipi misti non si può ordinare con argsort in pagina_archivio
+    for colonna in TESTI:
+        df[colonna] = df[colonna].fillna("").astype(str)
+    df["pagamento"] = df["pagamento"].astype("category")
+    df["piva_norm"] = normalizza_piva(df["piva"])
+    return df
+
+
+def normalizza_piva(valori):
+    """Stessa normalizzazione di valida_piva: senza prefisso IT, spazi e in maiuscolo"""
+    return (valori.fillna("").astype(str).str.upper()
+            .str.replace("IT", "", regex=False).str.replace(" ", "", regex=False))
+
+
+def _in_cache(chiave, costruisci):
+    """Frame memorizzato per la versione corrente dell'archivio"""
+    versione = archivio.versione_dati()
+    with _lock:
+        if _cache["versione"] != versione:
+            _cache["versione"] = versione
+            _cache["frame"] = {}
+        if chiave not in _cache["frame"]:
+            with profilo.fase(f"DataFrame {' '.join(str(c) for c in chiave if c is not None)}"):
+                _cache["frame"][chiave] = costruisci()
+        return _cache["frame"][chiave]
+
+
+def _fatture(tipo, anno):
+    with profilo.fase("caricamento fatture"):
+        return archivio.carica_dati()[tipo] if anno is None else archivio.carica_anno(anno)[tipo]
+
+
+def frame_fatture(tipo, anno=None):
+    """DataFrame tipizzato delle fatture del tipo (di tutto l'archivio o dell'anno),
+    ricostruito solo se l'archivio cambia"""
+    return _in_cache(("analisi", tipo, anno), lambda: costruisci_frame(_fatture(tipo, anno)))
+
+
+def formatta_date(valori):
+    """Serie di date in formati misti -> stringhe dd/mm/yyyy (invariate se non interpretabili)"""
+    stringhe = valori.fillna("").astype(str)
+    # quasi tutte sono già dd/mm/yyyy: si convertono solo le altre
+    da_convertire = ~stringhe.str.contains("/", regex=False) & (stringhe != "")
+    if da_convertire.any():
+        date = pd.to_datetime(stringhe[da_convertire], errors="coerce")
+        stringhe[da_convertire] = date.dt.strftime("%d/%m/%Y").where(date.notna(), stringhe[da_convertire])
+    return stringhe
+
+
+def costruisci_storico(fatture):
+    """Tabella dell'archivio come mostrata ed esportata dalla pagina storico"""
+    df = pd.DataFrame.from_records(fatture)
+    df = df.drop(columns=["id"], errors="ignore")
+    for colonna in ("data", "scadenza"):
+        if colonna in df:
+            df[colonna] = formatta_date(df[colonna].astype("object"))
+    if "pagamento" in df:
+        df["pagamento"] = df["pagamento"].astype("category")
+    # gli importi restano float64: in float32 i centesimi si perdono oltre ~100.000 €
+    for colonna in ("imponibile", "iva_perc", "iva", "totale"):
+        if colonna in df:
+            df[colonna] = pd.to_numeric(df[colonna], errors="coerce")
+    return df
+
+
+def frame_storico(tipo, anno=None):
+    return _in_cache(("storico", tipo, anno), lambda: costruisci_storico(_fatture(tipo, anno)))
+
+
+def somma_importi(df, colonna="totale"):
+    """Somma esatta della colonna di importi di un frame tipizzato, in euro"""
+    return euro(df[f"{colonna}_cent"].to_numpy().sum())
+
+
+def filtra_mese(df, mese, anno):
+    return df[df["periodo"].to_numpy() == anno * 100 + mese]
+
+
+def giorni_scaduto(df, oggi):
+    """Giorni trascorsi dalla scadenza (<= 0 se non ancora scaduta) e maschera delle fatture con scadenza"""
+    scadenze = df["scadenza"].to_numpy().astype("datetime64[D]")
+    valide = ~np.isnat(scadenze)
+    giorni = np.zeros(len(scadenze), dtype="int64")
+    giorni[valide] = (np.datetime64(oggi, "D") - scadenze[valide]).astype("int64")
+    return giorni, valide
+
+
+def _indice_fascia(giorni):
+    """1-30 -> 0, 31-60 -> 1, 61-90 -> 2, oltre -> 3"""
+    return np.searchsorted([30, 60, 90], giorni, side="left")
+
+
+def classifica_scadenze(df, oggi):
+    """Aggiunge giorni_scaduto, scaduta e fascia (anzianità dello scaduto)"""
+    giorni, valide = giorni_scaduto(df, oggi)
+    scaduta = valide & (giorni > 0)
+    fascia = pd.Categorical.from_codes(np.where(scaduta, _indice_fascia(giorni), -1), categories=FASCE)
+    return df.assign(giorni_scaduto=np.where(valide, giorni, 0), scaduta=scaduta, fascia=fascia)
+
+
+def dividi_scadenze(df, oggi):
+    """(scadute, in scadenza) tra le fatture con data di scadenza"""
+    classificate = classifica_scadenze(df[df["scadenza"].notna().to_numpy()], oggi)
+    scadute = classificate["scaduta"].to_numpy()
+    return classificate[scadute], classificate[~scadute]
+
+
+def fasce_anzianita(df, oggi):
+    """Numero e totale delle scadute per fascia 0-30/31-60/61-90/90+ giorni"""
+    giorni, valide = giorni_scaduto(df, oggi)
+    scadute = valide & (giorni > 0)
+    fasce = _indice_fascia(giorni[scadute])
+    # bincount somma in float64: sui centesimi interi è esatta fino a 2**53
+    cent = np.bincount(fasce, weights=df["totale_cent"].to_numpy()[scadute], minlength=len(FASCE))
+    return pd.DataFrame({
+        "numero": np.bincount(fasce, minlength=len(FASCE)),
+        "totale": cent / 100,
+    }, index=pd.Index(FASCE, name="fascia"))
+
+
+# ---------- archivio paginato ----------
+def filtra_archivio(df, dal=None, al=None, controparte="", piva="", pagamenti=None,
+                    importo_min=None, importo_max=None):
+    """Applica i filtri della pagina storico al frame tipizzato (frame_fatture)"""
+    # prima i filtri numerici su array, poi quelli testuali solo sulle righe rimaste
+    maschera = np.ones(len(df), dtype=bool)
+    if dal is not None:
+        maschera &= df["data"].to_numpy() >= np.datetime64(dal)
+    if al is not None:
+        maschera &= df["data"].to_numpy() < np.datetime64(al) + np.timedelta64(1, "D")
+    if importo_min is not None:
+        maschera &= df["totale_cent"].to_numpy() >= centesimi(importo_min)
+    if importo_max is not None:
+        maschera &= df["totale_cent"].to_numpy() <= centesimi(importo_max)
+    if pagamenti:
+        maschera &= df["pagamento"].isin(pagamenti).to_numpy()
+    posizioni = np.flatnonzero(maschera)
+    if piva:
+        piva = piva.replace("IT", "").replace(" ", "").strip().upper()
+        trovate = df["piva_norm"].to_numpy()[posizioni].astype(str)
+        posizioni = posizioni[np.char.startswith(trovate, piva)]
+    if controparte:
+        nomi = df["cliente_fornitore"].iloc[posizioni]
+        posizioni = posizioni[nomi.str.contains(controparte.strip(), case=False, regex=False,
+                                                na=False).to_numpy(dtype=bool)]
+    return df if len(posizioni) == len(df) else df.iloc[posizioni]
+
+
+def pagina_archivio(df, ordina_per="data", crescente=False, pagina=1, righe=50):
+    """(righe della pagina pronte da mostrare, numero di pagine)"""
+    pagine = max(1, -(-len(df) // righe))
+    pagina = min(max(pagina, 1), pagine)
+    if ordina_per in df:
+        # argsort stabile + slice: si ordina solo la colonna chiave, non tutto il frame
+        colonna = df[ordina_per]
+        # categorie (pagamento): si ordinano i codici, -1 per i mancanti
+        chiave = colonna.cat.codes.to_numpy() if colonna.dtype == "category" else colonna.to_numpy()
+        ordine = np.argsort(chiave, kind="stable")
+        if not crescente:
+            ordine = ordine[::-1]
+        posizioni = ordine[(pagina - 1) * righe:pagina * righe]
+    else:
+        posizioni = np.arange((pagina - 1) * righe, min(pagina * righe, len(df)))
+    visibili = df.iloc[posizioni][COLONNE_ARCHIVIO].copy()
+    for colonna in ("data", "scadenza"):
+        visibili[colonna] = visibili[colonna].dt.strftime("%d/%m/%Y").fillna("")
+    return visibili, pagine
@@ -0,0 +1,666 @@
+"""Archivio fatture e anagrafiche condiviso tra le sessioni Streamlit.
+
+Lo script principale viene rieseguito ad ogni rerun, mentre i moduli importati
+restano in memoria: lo stato tenuto qui è quindi unico per processo.
+
+Modalità di salvataggio delle fatture (variabile INVOICEPRO_ARCHIVIO):
+- "journal" (default): fatture.json è uno snapshot, ogni inserimento, modifica
+  o cancellazione viene accodato a fatture.journal.jsonl e compattato
+  periodicamente nello snapshot;
+- "json": riscrittura completa di fatture.json ad ogni salvataggio;
+- "sqlite": database fatture.db con indici (vedi archivio_sqlite.py);
+- "anni": un file (snapshot + journal) per anno in fatture_anni/, caricato
+  solo quando serve quell'anno (vedi archivio_anni.py).
+
+Con INVOICEPRO_SNAPSHOT=colonne lo snapshot delle modalità journal e anni è
+un file colonnare binario (fatture.colonne, vedi colonnare.py) invece del JSON.
+
+Scritture concorrenti: ogni sessione (o processo) che scrive prende un lock
+esclusivo su <file>.lock, rilegge l'ultima versione e applica solo la propria
+modifica. I lettori non prendono lock: vedono sempre un file completo grazie
+alla rinomina atomica e ignorano le righe del journal non ancora terminate.
+"""
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import importi
+
+try:
+    import fcntl
+except ImportError:  # Windows: resta solo il lock tra thread dello stesso processo
+    fcntl = None
+
+FILE_FATTURE = "fatture.json"
+FILE_COLONNE = "fatture.colonne"
+FILE_JOURNAL = "fatture.journal.jsonl"
+FILE_ANAGRAFICHE = "anagrafiche.json"
+
+MODALITA_ARCHIVIO = os.environ.get("INVOICEPRO_ARCHIVIO", "journal")
+# Formato dello snapshot in modalità journal/anni: "json" o "colonne" (vedi colonnare.py)
+FORMATO_SNAPSHOT = os.environ.get("INVOICEPRO_SNAPSHOT", "json")
+ESTENSIONE_SNAPSHOT = ".colonne" if FORMATO_SNAPSHOT == "colonne" else ".json"
+# Operazioni nel journal oltre le quali si riscrive lo snapshot
+SOGLIA_COMPATTAZIONE = 5000
+
+TIPI = ("Attiva", "Passiva")
+
+
+def _vuoto_fatture():
+    return {"Attiva": [], "Passiva": []}
+
+
+def _vuoto_anagrafiche():
+    return {"clienti": [], "fornitori": []}
+
+
+def _firma(percorso):
+    """(mtime, dimensione) del file, None se non esiste"""
+    try:
+        info = os.stat(percorso)
+    except OSError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+
+def _scrivi_atomico(percorso, dati, indent=None):
+    """Scrive su file temporaneo e lo rinomina: un crash lascia il file vecchio o quello nuovo"""
+    tmp = f"{percorso}.tmp"
+    separatori = None if indent else (",", ":")
+    with open(tmp, "w", encoding='utf-8') as f:
+        json.dump(dati, f, indent=indent, separators=separatori, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, percorso)
+
+
+@contextmanager
+def blocco_file(percorso):
+    """Lock esclusivo tra processi sul file <percorso>.lock"""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{percorso}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _leggi_json(percorso, vuoto):
+    if os.path.exists(percorso):
+        try:
+            with open(percorso, "r", encoding='utf-8') as f:
+                return json.load(f)
+        except:
+            pass
+    return vuoto()
+
+
+def nuovo_id():
+    return uuid.uuid4().hex
+
+
+def _assegna_id(dati):
+    """Le fatture salvate prima del journal non hanno id: lo deriva dalla posizione nello snapshot"""
+    for tipo in TIPI:
+        for i, fattura in enumerate(dati.get(tipo, [])):
+            if "id" not in fattura:
+                fattura["id"] = f"{tipo}-{i}"
+
+
+def data_fattura(valore):
+    """dd/mm/yyyy (o ISO yyyy-mm-dd) -> date, None se non valida; più veloce di strptime"""
+    try:
+        if "/" in valore:
+            giorno, mese, anno = valore.split("/")
+        else:
+            anno, mese, giorno = valore[:10].split("-")
+        return date(int(anno), int(mese), int(giorno))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def anno_fattura(fattura):
+    """Anno della data della fattura, 0 se manca o non è valida"""
+    data = data_fattura(fattura.get("data"))
+    return data.year if data is not None else 0
+
+
+def filtra_fatture_mese(fatture, mese, anno):
+    filtrate = []
+    for f in fatture:
+        try:
+            data_fattura = datetime.strptime(f['data'], "%d/%m/%Y")
+            if data_fattura.month == mese and data_fattura.year == anno:
+                filtrate.append(f)
+        except:
+            continue
+    return filtrate
+
+
+class _QueryLineari:
+    """Query per i backend JSON: scorrono la vista completa in memoria"""
+
+    def riepilogo(self, tipo, anno=None):
+        fatture = self.leggi()[tipo] if anno is None else self.leggi_anno(anno)[tipo]
+        return len(fatture), importi.somma([f.get('totale', 0) for f in fatture])
+
+    def leggi_anno(self, anno):
+        """Fatture con data nell'anno, filtrate una volta per versione dell'archivio"""
+        dati = self.leggi()
+        cache = getattr(self, "_cache_anni", None)
+        if cache is None or cache[0] != self.versione:
+            cache = self._cache_anni = (self.versione, {})
+        if anno not in cache[1]:
+            cache[1][anno] = {tipo: [f for f in dati[tipo] if anno_fattura(f) == anno] for tipo in TIPI}
+        return cache[1][anno]
+
+    def apri_anno(self, anno):
+        """Con un solo file l'anno è già in memoria: basta rileggere se è cambiato"""
+        self.leggi()
+
+
+class _Osservabile:
+    """Tiene aggiornati gli indici derivati (aggregati, scadenze, ...).
+
+    Un indice espone ricostruisci(dati), chiamato dopo una ricarica completa,
+    e aggiorna(tipo, vecchia, nuova) per ogni singolo inserimento (vecchia
+    None), modifica o cancellazione (nuova None).
+    """
+
+    def registra(self, indice):
+        with self._lock:
+            self.indici.append(indice)
+            indice.ricostruisci(self.leggi())
+
+    def versione_corrente(self):
+        self.leggi()
+        return self.versione
+
+    def _notifica_ricarica(self):
+        for indice in self.indici:
+            indice.ricostruisci(self._dati)
+
+    def _notifica(self, tipo, vecchia, nuova):
+        for indice in self.indici:
+            indice.aggiorna(tipo, vecchia, nuova)
+
+
+class FileCache(_Osservabile):
+    """Contenuto JSON di un file, riletto solo se cambia mtime o dimensione"""
+
+    def __init__(self, percorso, vuoto):
+        self.percorso = percorso
+        self.vuoto = vuoto
+        self.versione = 0
+        self.indici = []
+        self._firma = None
+        self._dati = vuoto()
+        self._lock = threading.RLock()
+
+    def leggi(self):
+        firma = _firma(self.percorso)
+        if firma == self._firma:
+            return self._dati
+        # una scrittura in corso (magari in attesa del lock su file di un altro processo)
+        # tiene self._lock: intanto si restituisce l'ultima versione letta
+        if not self._lock.acquire(blocking=self._firma is None):
+            return self._dati
+        try:
+            if firma != self._firma:
+                self._dati = self._carica()
+                self._firma = firma
+                self.versione += 1
+                self._notifica_ricarica()
+            return self._dati
+        finally:
+            self._lock.release()
+
+    def _carica(self):
+        return _leggi_json(self.percorso, self.vuoto)
+
+    def _salva(self, dati):
+        _scrivi_atomico(self.percorso, dati, indent=4)
+        self._dati = dati
+        self._firma = _firma(self.percorso)
+        self.versione += 1
+        self._notifica_ricarica()
+
+    def scrivi(self, dati, versione=None):
+        """Sostituisce il contenuto del file.
+
+        Con versione (letta da self.versione al momento del caricamento) la
+        scrittura è ottimistica: se nel frattempo il file è cambiato non scrive
+        e restituisce False.
+        """
+        try:
+            with self._lock, blocco_file(self.percorso):
+                if versione is not None:
+                    self.leggi()
+                    if self.versione != versione:
+                        return False
+                self._salva(dati)
+            return True
+        except:
+            return False
+
+    def aggiorna(self, modifica):
+        """Rilegge il file sotto lock, applica modifica(dati) e lo riscrive"""
+        try:
+            with self._lock, blocco_file(self.percorso):
+                dati = self._carica()
+                modifica(dati)
+                self._salva(dati)
+            return True
+        except:
+            return False
+
+    def accoda(self, chiave, voce, ammessa=None):
+        """Aggiunge voce alla lista dati[chiave] e notifica solo l'inserimento.
+
+        ammessa() viene valutata sotto lock, con dati e indici aggiornati
+        all'ultima versione su disco: se restituisce False non scrive nulla.
+        """
+        try:
+            with self._lock, blocco_file(self.percorso):
+                dati = self.leggi()
+                if ammessa is not None and not ammessa():
+                    return False
+                # copy-on-write: chi ha già letto i dati continua a vedere la versione precedente
+                dati = dict(dati, **{chiave: dati.get(chiave, []) + [voce]})
+                _scrivi_atomico(self.percorso, dati, indent=4)
+                self._dati = dati
+                self._firma = _firma(self.percorso)
+                self.versione += 1
+                self._notifica(chiave, None, voce)
+            return True
+        except:
+            return False
+
+
+class ArchivioJson(_QueryLineari, FileCache):
+    """Modalità "json": ogni modifica riscrive l'intero fatture.json"""
+
+    def __init__(self, percorso=FILE_FATTURE):
+        super().__init__(percorso, _vuoto_fatture)
+
+    def _carica(self):
+        dati = super()._carica()
+        _assegna_id(dati)
+        return dati
+
+    def aggiungi(self, tipo, fattura):
+        fattura.setdefault("id", nuovo_id())
+        return self.aggiorna(lambda dati: dati[tipo].append(fattura))
+
+    def aggiungi_molte(self, voci):
+        def accoda(dati):
+            for tipo, fattura in voci:
+                fattura.setdefault("id", nuovo_id())
+                dati[tipo].append(fattura)
+        return self.aggiorna(accoda)
+
+    def modifica(self, tipo, id_fattura, fattura):
+        def sostituisci(dati):
+            dati[tipo] = [dict(fattura, id=id_fattura) if f.get("id") == id_fattura else f
+                          for f in dati[tipo]]
+        return self.aggiorna(sostituisci)
+
+    def elimina(self, tipo, id_fattura):
+        def rimuovi(dati):
+            dati[tipo] = [f for f in dati[tipo] if f.get("id") != id_fattura]
+        return self.aggiorna(rimuovi)
+
+    def compatta(self):
+        return True
+
+    def cancella(self):
+        return self.scrivi(_vuoto_fatture())
+
+
+class ArchivioJournal(_QueryLineari, _Osservabile):
+    """Snapshot JSON + journal JSON-lines delle operazioni.
+
+    Ogni riga del journal è {"seq", "op", "tipo", "id", "fattura"} con op in
+    "ins"/"mod"/"del". Lo snapshot registra in "_seq" l'ultima operazione che
+    contiene, così le righe già compattate vengono saltate al replay anche se
+    il processo si interrompe tra la rinomina dello snapshot e lo svuotamento
+    del journal.
+    """
+
+    def __init__(self, percorso=FILE_FATTURE, percorso_journal=FILE_JOURNAL):
+        self.percorso = percorso
+        self.percorso_journal = percorso_journal
+        self.versione = 0
+        self.indici = []
+        self._firma = None
+        self._offset = 0
+        self._seq = 0
+        self._operazioni = 0
+        self._dati = _vuoto_fatture()
+        self._copiati = None  # liste già copiate dal lotto in corso (None: dati già consegnati)
+        self._vista = None  # (firma snapshot, offset journal, dati) dell'ultima vista consegnata
+        self._lock = threading.RLock()
+
+    # ---------- lettura ----------
+    def leggi(self):
+        """Vista condivisa da tutte le sessioni: non cambia più una volta restituita
+        (le operazioni successive lavorano su copie, vedi _lista)"""
+        vista = self._vista
+        firma = _firma(self.percorso)
+        dimensione = (_firma(self.percorso_journal) or (0, 0))[1]
+        if vista is not None and vista[0] == firma and vista[1] == dimensione:
+            return vista[2]  # file invariati: nessun lock
+        # una scrittura in corso (magari in attesa del lock su file di un altro processo)
+        # tiene self._lock: intanto si restituisce l'ultima vista completa
+        if not self._lock.acquire(blocking=vista is None):
+            return vista[2]
+        try:
+            self._copiati = None
+            firma = _firma(self.percorso)
+            if firma != self._firma:
+                self._ricarica(firma)
+            elif (_firma(self.percorso_journal) or (0, 0))[1] != self._offset:
+                self._applica_journal()
+            self._vista = (self._firma, self._offset, self._dati)
+            return self._dati
+        finally:
+            self._lock.release()
+
+    def _leggi_snapshot(self):
+        if self.percorso.endswith(".colonne"):
+            import colonnare
+            return colonnare.leggi(self.percorso, _vuoto_fatture)
+        return _leggi_json(self.percorso, _vuoto_fatture)
+
+    def _ricarica(self, firma):
+        dati = self._leggi_snapshot()
+        self._seq = dati.pop("_seq", 0)
+        for tipo in TIPI:
+            dati.setdefault(tipo, [])
+        _assegna_id(dati)
+        self._dati = dati
+        self._copiati = set(TIPI)
+        self._firma = firma
+        self._offset = 0
+        self._operazioni = 0
+        self.versione += 1
+        self._notifica_ricarica()
+        self._applica_journal()
+
+    def _applica_journal(self):
+        """Applica le righe del journal successive all'ultimo offset letto"""
+        try:
+            f = open(self.percorso_journal, "rb")
+        except OSError:
+            self._offset = 0
+            return
+        with f:
+            if os.fstat(f.fileno()).st_size < self._offset:
+                # journal svuotato da un altro processo: si riparte dall'inizio
+                self._offset = 0
+            f.seek(self._offset)
+            for riga in f:
+                if not riga.endswith(b"\n"):
+                    break  # riga incompleta (scrittura interrotta o in corso)
+                self._offset += len(riga)
+                try:
+                    voce = json.loads(riga)
+                except ValueError:
+                    continue
+                if voce.get("seq", 0) <= self._seq:
+                    continue
+                self._applica(voce)
+                self._seq = voce["seq"]
+                self._operazioni += 1
+                self.versione += 1
+
+    def _lista(self, tipo):
+        """Lista del tipo modificabile senza toccare la vista già letta dalle sessioni:
+        la prima operazione del lotto copia il dizionario e la lista (copy-on-write)"""
+        if self._copiati is None:
+            self._dati = dict(self._dati)
+            self._copiati = set()
+        if tipo not in self._copiati:
+            self._dati[tipo] = list(self._dati[tipo])
+            self._copiati.add(tipo)
+        return self._dati[tipo]
+
+    def _applica(self, voce):
+        tipo = voce["tipo"]
+        fatture = self._lista(tipo)
+        if voce["op"] == "ins":
+            fatture.append(voce["fattura"])
+            self._notifica(tipo, None, voce["fattura"])
+        elif voce["op"] == "mod":
+            for i, f in enumerate(fatture):
+                if f.get("id") == voce["id"]:
+                    fatture[i] = voce["fattura"]
+                    self._notifica(tipo, f, voce["fattura"])
+                    break
+        elif voce["op"] == "del":
+            rimaste = []
+            for f in fatture:
+                if f.get("id") == voce["id"]:
+                    self._notifica(tipo, f, None)
+                else:
+                    rimaste.append(f)
+            fatture[:] = rimaste
+
+    # ---------- scrittura ----------
+    def _accoda(self, operazioni):
+        """Accoda [(op, tipo, id, fattura)] con una sola scrittura e un solo fsync"""
+        try:
+            with self._lock, blocco_file(self.percorso):
+                # rilettura sotto lock: include le righe accodate da altri processi
+                self.leggi()
+                voci = []
+                for seq, (op, tipo, id_fattura, fattura) in enumerate(operazioni, self._seq + 1):
+                    voce = {"seq": seq, "op": op, "tipo": tipo, "id": id_fattura}
+                    if fattura is not None:
+                        voce["fattura"] = fattura
+                    voci.append(voce)
+                righe = "".join(json.dumps(voce, ensure_ascii=False) + "\n" for voce in voci).encode('utf-8')
+                with open(self.percorso_journal, "ab") as f:
+                    if f.tell() != self._offset:
+                        # riga incompleta lasciata da un crash: si fonderebbe con la prima
+                        # accodata qui e al replay andrebbero perse entrambe
+                        f.truncate(self._offset)
+                    f.write(righe)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._offset += len(righe)
+                for voce in voci:
+                    self._applica(voce)
+                    self._seq = voce["seq"]
+                self._operazioni += len(voci)
+                self.versione += 1
+                if self._operazioni >= SOGLIA_COMPATTAZIONE:
+                    self._scrivi_snapshot(self._dati)
+            return True
+        except:
+            return False
+
+    def aggiungi(self, tipo, fattura):
+        fattura.setdefault("id", nuovo_id())
+        return self._accoda([("ins", tipo, fattura["id"], fattura)])
+
+    def aggiungi_molte(self, voci):
+        for _, fattura in voci:
+            fattura.setdefault("id", nuovo_id())
+        return self._accoda([("ins", tipo, fattura["id"], fattura) for tipo, fattura in voci])
+
+    def modifica(self, tipo, id_fattura, fattura):
+        return self._accoda([("mod", tipo, id_fattura, dict(fattura, id=id_fattura))])
+
+    def elimina(self, tipo, id_fattura):
+        return self._accoda([("del", tipo, id_fattura, None)])
+
+    def compatta(self):
+        """Riscrive lo snapshot con tutte le operazioni e svuota il journal"""
+        try:
+            with self._lock, blocco_file(self.percorso):
+                self.leggi()
+                self._scrivi_snapshot(self._dati)
+            return True
+        except:
+            return False
+
+    def _scrivi_snapshot(self, dati):
+        if self.percorso.endswith(".colonne"):
+            import colonnare
+            colonnare.scrivi(self.percorso, dati, self._seq)
+        else:
+            _scrivi_atomico(self.percorso, dict(dati, _seq=self._seq))
+        with open(self.percorso_journal, "wb"):
+            pass
+        sostituiti = dati is not self._dati
+        self._dati = dati
+        self._firma = _firma(self.percorso)
+        self._offset = 0
+        self._operazioni = 0
+        self.versione += 1
+        if sostituiti:
+            self._notifica_ricarica()
+
+    def scrivi(self, dati, versione=None):
+        """Sostituisce l'intero archivio (es. import o cancellazione), vedi FileCache.scrivi"""
+        try:
+            with self._lock, blocco_file(self.percorso):
+                self.leggi()
+                if versione is not None and self.versione != versione:
+                    return False
+                _assegna_id(dati)
+                self._scrivi_snapshot(dati)
+            return True
+        except:
+            return False
+
+    def cancella(self):
+        return self.scrivi(_vuoto_fatture())
+
+
+def crea_archivio(cartella=None):
+    """(fatture, anagrafiche) nella modalità di INVOICEPRO_ARCHIVIO, con i file in
+    cartella (default: la cartella corrente, con percorsi relativi)"""
+    def percorso(nome):
+        return nome if cartella is None else os.path.join(cartella, nome)
+
+    if MODALITA_ARCHIVIO == "sqlite":
+        from archivio_sqlite import ArchivioSqlite, FILE_SQLITE
+        fatture = ArchivioSqlite(percorso(FILE_SQLITE))
+    elif MODALITA_ARCHIVIO == "anni":
+        from archivio_anni import ArchivioAnni, CARTELLA_ANNI
+        fatture = ArchivioAnni(percorso(CARTELLA_ANNI))
+    elif MODALITA_ARCHIVIO == "json":
+        fatture = ArchivioJson(percorso(FILE_FATTURE))
+    else:
+        fatture = ArchivioJournal(percorso(FILE_COLONNE if FORMATO_SNAPSHOT == "colonne" else FILE_FATTURE),
+                                  percorso(FILE_JOURNAL))
+    return fatture, FileCache(percorso(FILE_ANAGRAFICHE), _vuoto_anagrafiche)
+
+
+_fatture, _anagrafiche = crea_archivio()
+
+
+def carica_dati():
+    """Vista {"Attiva": [...], "Passiva": [...]} condivisa: non modificarla senza salvare"""
+    return _fatture.leggi()
+
+
+def carica_anno(anno):
+    """Come carica_dati, solo le fatture con data nell'anno (in modalità "anni"
+    viene letto soltanto il file di quell'anno)"""
+    return _fatture.leggi_anno(anno)
+
+
+def apri_anno(anno):
+    """Porta l'anno in memoria e allinea gli indici registrati, senza copiare nulla"""
+    _fatture.apri_anno(anno)
+
+
+def carica_anagrafiche():
+    return _anagrafiche.leggi()
+
+
+def salva_dati(dati, versione=None):
+    """Riscrive tutto l'archivio; con versione=versione_dati() letta prima delle
+    modifiche restituisce False se un'altra sessione ha salvato nel frattempo"""
+    return _fatture.scrivi(dati, versione)
+
+
+def salva_anagrafiche(dati, versione=None):
+    return _anagrafiche.scrivi(dati, versione)
+
+
+def aggiungi_anagrafica(categoria, anagrafica, ammessa=None):
+    """Accoda un cliente/fornitore all'ultima versione su disco, senza perdere
+    quelli salvati nel frattempo da altre sessioni (vedi FileCache.accoda)"""
+    return _anagrafiche.accoda(categoria, anagrafica, ammessa)
+
+
+def aggiungi_fattura(tipo, fattura):
+    """Salva una nuova fattura (in modalità journal costa una sola riga accodata)"""
+    return _fatture.aggiungi(tipo, fattura)
+
+
+def aggiungi_fatture(voci):
+    """Salva in un'unica scrittura una lista di (tipo, fattura), es. da un import"""
+    return _fatture.aggiungi_molte(voci)
+
+
+def modifica_fattura(tipo, id_fattura, fattura):
+    return _fatture.modifica(tipo, id_fattura, fattura)
+
+
+def elimina_fattura(tipo, id_fattura):
+    return _fatture.elimina(tipo, id_fattura)
+
+
+def compatta_archivio():
+    return _fatture.compatta()
+
+
+def cancella_archivio():
+    return _fatture.cancella()
+
+
+def versione_dati():
+    """Contatore che cambia ad ogni ricarica o salvataggio dell'archivio"""
+    return _fatture.versione_corrente()
+
+
+def versione_anagrafiche():
+    _anagrafiche.leggi()
+    return _anagrafiche.versione
+
+
+# ---------- query (indicizzate con il backend SQLite) ----------
+def riepilogo_tipo(tipo, anno=None):
+    """(numero fatture, somma totali) per la pagina storico, di tutto l'archivio o dell'anno"""
+    return _fatture.riepilogo(tipo, anno)
+
+
+def registra_indice(indice):
+    """Registra un indice derivato sulle fatture (vedi _Osservabile)"""
+    _fatture.registra(indice)
+
+
+def registra_indice_anagrafiche(indice):
+    _anagrafiche.registra(indice)
+
+
+def cartella_fatture():
+    """Cartella dei file dell'archivio fatture (in modalità anni: fatture_anni/), dove
+    stanno anche gli indici persistenti che ne derivano"""
+    cartella = getattr(_fatture, "cartella", None) or os.path.dirname(_fatture.percorso)
+    return os.path.abspath(cartella)
+
+
+def cartella_anagrafiche():
+    return os.path.abspath(os.path.dirname(_anagrafiche.percorso))
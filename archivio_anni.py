@@ -0,0 +1,191 @@
+"""Archivio fatture diviso per anno (INVOICEPRO_ARCHIVIO=anni).
+
+Ogni anno è un ArchivioJournal a sé in fatture_anni/ (2026.json, o
+2026.colonne con INVOICEPRO_SNAPSHOT=colonne, e 2026.journal.jsonl, con il
+suo lock): la pagina dell'anno selezionato legge solo quei file e gli anni
+precedenti vengono aperti al primo accesso. Le fatture senza una data valida
+finiscono nell'anno 0000.
+
+Gli indici registrati (aggregati, numerazione, ...) ricevono le fatture degli
+anni man mano che vengono aperti; solo carica_dati() e le query su tutto lo
+storico aprono tutti gli anni.
+
+Migrazione una tantum da fatture.json (journal compreso):
+    python archivio_anni.py [fatture.json] [fatture_anni]
+"""
+import glob
+import os
+import sys
+import threading
+from collections import defaultdict
+
+from archivio import (ESTENSIONE_SNAPSHOT, TIPI, ArchivioJournal, _QueryLineari, _vuoto_fatture,
+                      anno_fattura, nuovo_id)
+
+CARTELLA_ANNI = "fatture_anni"
+
+
+class _IndicePartizione:
+    """Collega un indice di tutto l'archivio a un singolo anno: la ricarica
+    dell'anno diventa la rimozione delle sue vecchie fatture e l'inserimento
+    delle nuove, senza toccare gli altri anni.
+
+    _dati è la vista dell'anno che l'indice contiene: con il copy-on-write
+    ogni lotto di operazioni crea una vista nuova, quindi va ripresa dalla
+    partizione ad ogni aggiornamento."""
+
+    def __init__(self, indice, partizione):
+        self.indice = indice
+        self.partizione = partizione
+        self._dati = None
+
+    def ricostruisci(self, dati):
+        if self._dati is not None:
+            for tipo in TIPI:
+                for fattura in self._dati.get(tipo, []):
+                    self.indice.aggiorna(tipo, fattura, None)
+        for tipo in TIPI:
+            for fattura in dati.get(tipo, []):
+                self.indice.aggiorna(tipo, None, fattura)
+        self._dati = dati
+
+    def aggiorna(self, tipo, vecchia, nuova):
+        self.indice.aggiorna(tipo, vecchia, nuova)
+        self._dati = self.partizione._dati
+
+
+class ArchivioAnni(_QueryLineari):
+    """Stessa interfaccia di ArchivioJournal, con un ArchivioJournal per anno"""
+
+    def __init__(self, cartella=CARTELLA_ANNI):
+        self.cartella = cartella
+        os.makedirs(cartella, exist_ok=True)
+        self.indici = []
+        self._partizioni = {}
+        self._vista = (None, None)
+        self._lock = threading.RLock()
+
+    def _percorsi(self, anno):
+        base = os.path.join(self.cartella, f"{anno:04d}")
+        return f"{base}{ESTENSIONE_SNAPSHOT}", f"{base}.journal.jsonl"
+
+    def anni(self):
+        """Anni presenti su disco (snapshot o solo journal, prima della prima compattazione)
+        o già aperti, in ordine"""
+        su_disco = {int(os.path.basename(p)[:4])
+                    for estensione in (ESTENSIONE_SNAPSHOT, ".journal.jsonl")
+                    for p in glob.glob(os.path.join(self.cartella, "[0-9]" * 4 + estensione))}
+        return sorted(su_disco | set(self._partizioni))
+
+    def partizione(self, anno):
+        partizione = self._partizioni.get(anno)
+        if partizione is None:
+            with self._lock:
+                partizione = self._partizioni.get(anno)
+                if partizione is None:
+                    partizione = ArchivioJournal(*self._percorsi(anno))
+                    for indice in self.indici:
+                        partizione.registra(_IndicePartizione(indice, partizione))
+                    self._partizioni[anno] = partizione
+        return partizione
+
+    @property
+    def versione(self):
+        # somma di contatori che crescono soltanto: cambia ad ogni modifica di un anno aperto
+        return sum(p.versione for p in list(self._partizioni.values())) + len(self._partizioni)
+
+    def versione_corrente(self):
+        for partizione in list(self._partizioni.values()):
+            partizione.leggi()
+        return self.versione
+
+    # ---------- lettura ----------
+    def leggi_anno(self, anno):
+        return self.partizione(anno).leggi()
+
+    def apri_anno(self, anno):
+        self.partizione(anno).leggi()
+
+    def leggi(self):
+        """Vista di tutti gli anni (li apre tutti), ricomposta solo se qualcosa è cambiato"""
+        with self._lock:
+            anni = [self.leggi_anno(anno) for anno in self.anni()]
+            versione = self.versione
+            if self._vista[0] != versione:
+                self._vista = (versione, {tipo: [f for dati in anni for f in dati[tipo]] for tipo in TIPI})
+            return self._vista[1]
+
+    def registra(self, indice):
+        with self._lock:
+            self.indici.append(indice)
+            indice.ricostruisci(_vuoto_fatture())
+            for partizione in self._partizioni.values():
+                partizione.registra(_IndicePartizione(indice, partizione))
+
+    # ---------- scrittura ----------
+    def _trova(self, tipo, id_fattura):
+        """Anno che contiene la fattura: prima tra quelli aperti, poi tutti gli altri"""
+        aperti = list(self._partizioni)
+        for anno in aperti + [a for a in self.anni() if a not in aperti]:
+            if any(f.get("id") == id_fattura for f in self.leggi_anno(anno)[tipo]):
+                return anno
+        return None
+
+    def aggiungi(self, tipo, fattura):
+        return self.partizione(anno_fattura(fattura)).aggiungi(tipo, fattura)
+
+    def aggiungi_molte(self, voci):
+        per_anno = defaultdict(list)
+        for tipo, fattura in voci:
+            per_anno[anno_fattura(fattura)].append((tipo, fattura))
+        # una scrittura per anno: un errore su un anno non annulla gli altri
+        return all([self.partizione(anno).aggiungi_molte(gruppo) for anno, gruppo in per_anno.items()])
+
+    def modifica(self, tipo, id_fattura, fattura):
+        anno = self._trova(tipo, id_fattura)
+        if anno is None:
+            return False
+        nuova = dict(fattura, id=id_fattura)
+        if anno_fattura(nuova) == anno:
+            return self.partizione(anno).modifica(tipo, id_fattura, nuova)
+        # cambio di data tra anni diversi: la fattura passa nel file del nuovo anno
+        return (self.partizione(anno_fattura(nuova)).aggiungi(tipo, nuova)
+                and self.partizione(anno).elimina(tipo, id_fattura))
+
+    def elimina(self, tipo, id_fattura):
+        anno = self._trova(tipo, id_fattura)
+        return anno is not None and self.partizione(anno).elimina(tipo, id_fattura)
+
+    def compatta(self):
+        return all([self.partizione(anno).compatta() for anno in self.anni()])
+
+    def scrivi(self, dati, versione=None):
+        """Sostituisce l'intero archivio ridistribuendo le fatture negli anni"""
+        with self._lock:
+            if versione is not None and self.versione_corrente() != versione:
+                return False
+            per_anno = defaultdict(_vuoto_fatture)
+            for tipo in TIPI:
+                for fattura in dati.get(tipo, []):
+                    fattura.setdefault("id", nuovo_id())
+                    per_anno[anno_fattura(fattura)][tipo].append(fattura)
+            anni = set(per_anno) | set(self.anni())
+            return all([self.partizione(anno).scrivi(per_anno.get(anno, _vuoto_fatture())) for anno in sorted(anni)])
+
+    def cancella(self):
+        return self.scrivi(_vuoto_fatture())
+
+
+def migra_da_json(percorso_json="fatture.json", cartella=CARTELLA_ANNI):
+    """Divide l'archivio JSON (snapshot + journal) nei file per anno, sostituendone il contenuto"""
+    percorso_journal = percorso_json[:-len(".json")] + ".journal.jsonl"
+    dati = ArchivioJournal(percorso_json, percorso_journal).leggi()
+    archivio_anni = ArchivioAnni(cartella)
+    if not archivio_anni.scrivi(dati):
+        raise RuntimeError(f"Migrazione in {cartella} non riuscita")
+    return archivio_anni.anni()
+
+
+if __name__ == "__main__":
+    anni = migra_da_json(*sys.argv[1:3])
+    print(f"✅ Archivio diviso in {len(anni)} anni: {', '.join(str(a) for a in anni)}")
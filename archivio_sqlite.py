@@ -0,0 +1,356 @@
+"""Backend SQLite per l'archivio fatture (INVOICEPRO_ARCHIVIO=sqlite).
+
+Le date sono salvate in formato ISO (YYYY-MM-DD) così che filtri per anno,
+somme e ordinamenti usino gli indici invece di scorrere tutte le fatture.
+Le pagine continuano a ricevere dizionari con date dd/mm/yyyy; una data che
+non si riscrive uguale in dd/mm/yyyy (ISO, testo libero da vecchi import)
+resta anche così com'era in data_originale/scadenza_originale.
+
+Migrazione una tantum da fatture.json (journal compreso):
+    python archivio_sqlite.py [fatture.json] [fatture.db]
+"""
+import json
+import sqlite3
+import sys
+import threading
+import uuid
+from datetime import date, datetime
+
+from importi import centesimi, euro
+
+FILE_SQLITE = "fatture.db"
+
+# Colonne con un campo omonimo nella fattura; gli altri campi finiscono in "extra"
+CAMPI = ("numero", "cliente_fornitore", "piva", "imponibile", "iva_perc", "iva",
+         "totale", "pagamento", "note", "timestamp")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fatture (
+    pos INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    tipo TEXT NOT NULL,
+    data TEXT,
+    scadenza TEXT,
+    data_originale TEXT,
+    scadenza_originale TEXT,
+    numero TEXT,
+    cliente_fornitore TEXT,
+    piva TEXT,
+    imponibile REAL,
+    iva_perc REAL,
+    iva REAL,
+    totale REAL,
+    pagamento TEXT,
+    note TEXT,
+    timestamp TEXT,
+    extra TEXT,
+    totale_cent INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_fatture_data ON fatture(tipo, data);
+CREATE INDEX IF NOT EXISTS idx_fatture_scadenza ON fatture(tipo, scadenza);
+CREATE INDEX IF NOT EXISTS idx_fatture_piva ON fatture(piva);
+CREATE INDEX IF NOT EXISTS idx_fatture_numero ON fatture(tipo, numero);
+"""
+
+# Somma dei totali in centesimi interi: SUM su INTEGER è esatta, TOTAL su REAL no.
+# totale_cent è calcolato in Python con importi.centesimi (ROUND di SQLite arrotonda il
+# float binario: 1.005 darebbe 100 centesimi invece di 101)
+_SOMMA_CENTESIMI = "COALESCE(SUM(totale_cent), 0)"
+
+
+def data_iso(valore):
+    """dd/mm/yyyy (o ISO) -> YYYY-MM-DD, None se non interpretabile"""
+    if not valore:
+        return None
+    try:
+        return datetime.strptime(valore, "%d/%m/%Y").date().isoformat()
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(valore)).date().isoformat()
+    except ValueError:
+        return None
+
+
+def data_ita(valore):
+    """YYYY-MM-DD -> dd/mm/yyyy"""
+    if not valore:
+        return ""
+    return date.fromisoformat(valore).strftime("%d/%m/%Y")
+
+
+def _originale(valore, iso):
+    """Il valore della fattura se data_ita(iso) non lo riproduce (anche ""), altrimenti None"""
+    if valore is None or (iso is not None and valore == data_ita(iso)):
+        return None
+    return str(valore)
+
+
+def _riga(tipo, fattura):
+    extra = {k: v for k, v in fattura.items() if k not in CAMPI and k not in ("id", "data", "scadenza")}
+    data, scadenza = data_iso(fattura.get("data")), data_iso(fattura.get("scadenza"))
+    return (fattura["id"], tipo, data, scadenza,
+            _originale(fattura.get("data"), data), _originale(fattura.get("scadenza"), scadenza),
+            *(fattura.get(c) for c in CAMPI), json.dumps(extra, ensure_ascii=False) if extra else None,
+            centesimi(fattura.get("totale")))
+
+
+_COLONNE = ("id", "tipo", "data", "scadenza", "data_originale", "scadenza_originale") + CAMPI + ("extra",)
+_SELECT = f"SELECT {', '.join(_COLONNE)} FROM fatture"
+_SCRITTE = _COLONNE + ("totale_cent",)
+_INSERT = f"INSERT INTO fatture ({', '.join(_SCRITTE)}) VALUES ({', '.join('?' * len(_SCRITTE))})"
+
+
+def _fattura(riga):
+    fattura = {"data": riga[4] if riga[4] is not None else data_ita(riga[2])}
+    for nome, valore in zip(CAMPI, riga[6:-1]):
+        if nome == "timestamp" and (riga[3] or riga[5] is not None):
+            fattura["scadenza"] = riga[5] if riga[5] is not None else data_ita(riga[3])
+        if valore is not None:
+            fattura[nome] = valore
+    if riga[-1]:
+        fattura.update(json.loads(riga[-1]))
+    fattura["id"] = riga[0]
+    return fattura
+
+
+class ArchivioSqlite:
+    """Stessa interfaccia di ArchivioJournal, con query indicizzate"""
+
+    def __init__(self, percorso=FILE_SQLITE):
+        self.percorso = percorso
+        self.versione = 0
+        self._lock = threading.RLock()
+        # WAL: i lettori non bloccano lo scrittore; timeout per attendere gli altri processi
+        self._conn = sqlite3.connect(percorso, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._aggiorna_schema()
+        self._data_version = None
+        self._dati = None
+        self.indici = []
+
+    def _aggiorna_schema(self):
+        """Database creati da versioni precedenti: aggiunge le colonne mancanti
+        (totale_cent viene calcolato una volta per le fatture già salvate)"""
+        colonne = {riga[1] for riga in self._conn.execute("PRAGMA table_info(fatture)")}
+        mancanti = [c for c in ("data_originale", "scadenza_originale", "totale_cent") if c not in colonne]
+        if not mancanti:
+            return
+        self._conn.create_function("centesimi", 1, centesimi, deterministic=True)
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for colonna in mancanti:
+                tipo = "INTEGER" if colonna == "totale_cent" else "TEXT"
+                self._conn.execute(f"ALTER TABLE fatture ADD COLUMN {colonna} {tipo}")
+            if "totale_cent" in mancanti:
+                self._conn.execute("UPDATE fatture SET totale_cent = centesimi(totale)")
+            self._conn.execute("COMMIT")
+        except:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _query(self, sql, parametri=()):
+        with self._lock:
+            return self._conn.execute(sql, parametri).fetchall()
+
+    def _modificato(self):
+        self.versione += 1
+        self._dati = None
+
+    # ---------- vista completa ----------
+    def leggi(self):
+        with self._lock:
+            # data_version cambia quando un'altra connessione scrive sul database
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            ricaricato = data_version != self._data_version
+            if ricaricato:
+                self._data_version = data_version
+                self._modificato()
+            if self._dati is None:
+                dati = {"Attiva": [], "Passiva": []}
+                for riga in self._conn.execute(f"{_SELECT} ORDER BY pos"):
+                    dati[riga[1]].append(_fattura(riga))
+                self._dati = dati
+            if ricaricato:
+                self._notifica_ricarica()
+            return self._dati
+
+    def versione_corrente(self):
+        self.leggi()
+        return self.versione
+
+    def leggi_anno(self, anno):
+        """Fatture dell'anno lette con l'indice sulla data, una volta per versione"""
+        with self._lock:
+            self.leggi()
+            cache = getattr(self, "_cache_anni", None)
+            if cache is None or cache[0] != self.versione:
+                cache = self._cache_anni = (self.versione, {})
+            if anno not in cache[1]:
+                dati = {"Attiva": [], "Passiva": []}
+                for riga in self._conn.execute(f"{_SELECT} WHERE data >= ? AND data < ? ORDER BY pos",
+                                               (date(anno, 1, 1).isoformat(), date(anno + 1, 1, 1).isoformat())):
+                    dati[riga[1]].append(_fattura(riga))
+                cache[1][anno] = dati
+            return cache[1][anno]
+
+    def apri_anno(self, anno):
+        self.leggi()
+
+    # ---------- indici derivati (vedi archivio._Osservabile) ----------
+    def registra(self, indice):
+        with self._lock:
+            self.indici.append(indice)
+            indice.ricostruisci(self.leggi())
+
+    def _notifica_ricarica(self):
+        for indice in self.indici:
+            indice.ricostruisci(self._dati)
+
+    def _notifica(self, tipo, vecchia, nuova):
+        for indice in self.indici:
+            indice.aggiorna(tipo, vecchia, nuova)
+
+    def _aggiorna_vista(self, tipo, vecchia, nuova):
+        """Applica la singola modifica alla vista in memoria invece di rileggerla; la vista
+        già restituita non cambia (copy-on-write, come ArchivioJournal._lista)"""
+        if self._dati is None:
+            return
+        fatture = self._dati[tipo]
+        if vecchia is None:
+            fatture = fatture + [nuova]
+        elif nuova is None:
+            fatture = [f for f in fatture if f["id"] != vecchia["id"]]
+        else:
+            fatture = [nuova if f["id"] == vecchia["id"] else f for f in fatture]
+        self._dati = dict(self._dati, **{tipo: fatture})
+
+    def _per_id(self, tipo, id_fattura):
+        righe = self._query(f"{_SELECT} WHERE id = ? AND tipo = ?", (id_fattura, tipo))
+        return _fattura(righe[0]) if righe else None
+
+    # ---------- scrittura ----------
+    def scrivi(self, dati, versione=None):
+        try:
+            with self._lock:
+                if versione is not None:
+                    self.leggi()
+                    if self.versione != versione:
+                        return False
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.execute("DELETE FROM fatture")
+                    self._inserisci(dati)
+                    self._conn.execute("COMMIT")
+                except:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._modificato()
+                if self.indici:
+                    self.leggi()
+                    self._notifica_ricarica()
+            return True
+        except:
+            return False
+
+    def _inserisci(self, dati):
+        righe = []
+        for tipo in ("Attiva", "Passiva"):
+            for fattura in dati.get(tipo, []):
+                fattura.setdefault("id", uuid.uuid4().hex)
+                righe.append(_riga(tipo, fattura))
+        self._conn.executemany(_INSERT, righe)
+
+    def aggiungi(self, tipo, fattura):
+        fattura.setdefault("id", uuid.uuid4().hex)
+        return self._esegui(_INSERT, _riga(tipo, fattura), tipo, None, fattura)
+
+    def aggiungi_molte(self, voci):
+        try:
+            with self._lock:
+                if self._conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+                    self.leggi()
+                righe = []
+                for tipo, fattura in voci:
+                    fattura.setdefault("id", uuid.uuid4().hex)
+                    righe.append(_riga(tipo, fattura))
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.executemany(_INSERT, righe)
+                    self._conn.execute("COMMIT")
+                except:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self.versione += 1
+                for tipo, fattura in voci:
+                    self._aggiorna_vista(tipo, None, fattura)
+                    self._notifica(tipo, None, fattura)
+            return True
+        except sqlite3.Error:
+            return False
+
+    def modifica(self, tipo, id_fattura, fattura):
+        colonne = _SCRITTE[2:]
+        sql = f"UPDATE fatture SET {', '.join(f'{c} = ?' for c in colonne)} WHERE id = ? AND tipo = ?"
+        nuova = dict(fattura, id=id_fattura)
+        return self._esegui(sql, _riga(tipo, nuova)[2:] + (id_fattura, tipo),
+                            tipo, self._per_id(tipo, id_fattura), nuova)
+
+    def elimina(self, tipo, id_fattura):
+        return self._esegui("DELETE FROM fatture WHERE id = ? AND tipo = ?", (id_fattura, tipo),
+                            tipo, self._per_id(tipo, id_fattura), None)
+
+    def _esegui(self, sql, parametri, tipo=None, vecchia=None, nuova=None):
+        try:
+            with self._lock:
+                # allinea vista e indici alle scritture di altri processi prima della propria
+                if self._conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+                    self.leggi()
+                self._conn.execute(sql, parametri)
+                self.versione += 1
+                if vecchia is not None or nuova is not None:
+                    self._aggiorna_vista(tipo, vecchia, nuova)
+                    self._notifica(tipo, vecchia, nuova)
+            return True
+        except sqlite3.Error:
+            return False
+
+    def compatta(self):
+        try:
+            with self._lock:
+                self._conn.execute("VACUUM")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def cancella(self):
+        return self.scrivi({"Attiva": [], "Passiva": []})
+
+    # ---------- query ----------
+    def riepilogo(self, tipo, anno=None):
+        """(numero fatture, somma totali) del tipo, eventualmente solo dell'anno"""
+        if anno is None:
+            n, cent = self._query(f"SELECT COUNT(*), {_SOMMA_CENTESIMI} FROM fatture WHERE tipo = ?", (tipo,))[0]
+        else:
+            n, cent = self._query(f"SELECT COUNT(*), {_SOMMA_CENTESIMI} FROM fatture WHERE tipo = ? AND data >= ? AND data < ?",
+                                  (tipo, date(anno, 1, 1).isoformat(), date(anno + 1, 1, 1).isoformat()))[0]
+        return n, euro(cent)
+
+
+def migra_da_json(percorso_json="fatture.json", percorso_db=FILE_SQLITE):
+    """Copia l'archivio JSON (snapshot + journal) nel database, sostituendone il contenuto"""
+    from archivio import ArchivioJournal
+
+    percorso_journal = percorso_json[:-len(".json")] + ".journal.jsonl"
+    dati = ArchivioJournal(percorso_json, percorso_journal).leggi()
+    db = ArchivioSqlite(percorso_db)
+    if not db.scrivi(dati):
+        raise RuntimeError(f"Migrazione in {percorso_db} non riuscita")
+    return len(dati["Attiva"]), len(dati["Passiva"])
+
+
+if __name__ == "__main__":
+    attive, passive = migra_da_json(*sys.argv[1:3])
+    print(f"✅ Migrate {attive} fatture attive e {passive} passive")
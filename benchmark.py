@@ -0,0 +1,282 @@
+"""Benchmark dell'archivio su dati sintetici riproducibili.
+
+    python benchmark.py                                  # 1.000, 100.000 e 1.000.000 fatture
+    python benchmark.py --dimensioni 1000 100000 -o bench.json
+    INVOICEPRO_ARCHIVIO=json python benchmark.py --ripetizioni 5
+
+Le fatture (Attiva/Passiva) e le anagrafiche sono generate con un seme fisso
+nello stesso formato del form, in una cartella temporanea per dimensione, e
+il backend è quello scelto da INVOICEPRO_ARCHIVIO / INVOICEPRO_SNAPSHOT.
+Per ogni operazione si riportano il tempo migliore e mediano su più
+ripetizioni, le fatture al secondo e il picco di memoria allocata
+(tracemalloc, misurato in un passaggio a parte per non falsare i tempi).
+L'output è JSON, da confrontare tra un commit e l'altro.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+try:
+    import resource
+except ImportError:  # Windows: niente RSS massimo nel report
+    resource = None
+
+SEME = 20260101
+DIMENSIONI = (1_000, 100_000, 1_000_000)
+
+# ---------- generatore ----------
+_NOMI = ["Rossi", "Bianchi", "Ferrari", "Esposito", "Romano", "Colombo", "Ricci", "Marino", "Greco",
+         "Bruno", "Gallo", "Conti", "De Luca", "Mancini", "Costa", "Giordano", "Rizzo", "Lombardi"]
+_SETTORI = ["Costruzioni", "Trasporti", "Informatica", "Consulenze", "Impianti", "Alimentari",
+            "Logistica", "Arredamenti", "Servizi", "Meccanica", "Tessile", "Edilizia"]
+_FORME = ["S.r.l.", "S.p.A.", "S.n.c.", "S.a.s.", "& C."]
+_ALIQUOTE = [22.0] * 7 + [10.0, 10.0, 4.0, 0.0]
+_NOTE = ["", "", "", "", "Rif. ordine n. {}", "Consegna presso cantiere", "Acconto {}%"]
+
+
+def _piva(rnd):
+    """Partita IVA di 11 cifre con cifra di controllo corretta"""
+    # 7 cifre di matricola + 3 del codice dell'ufficio provinciale
+    cifre = [rnd.randint(0, 9) for _ in range(7)] + [int(c) for c in f"{rnd.randint(1, 100):03d}"]
+    somma = 0
+    for i, c in enumerate(cifre):
+        if i % 2:
+            c *= 2
+            c -= 9 if c > 9 else 0
+        somma += c
+    return "".join(map(str, cifre)) + str((10 - somma % 10) % 10)
+
+
+def genera_anagrafiche(n, rnd):
+    """{"clienti": [...], "fornitori": [...]} con n voci per categoria"""
+    anagrafiche = {"clienti": [], "fornitori": []}
+    for categoria in anagrafiche:
+        usate = set()
+        while len(anagrafiche[categoria]) < n:
+            piva = _piva(rnd)
+            if piva in usate:
+                continue
+            usate.add(piva)
+            nome = f"{rnd.choice(_NOMI)} {rnd.choice(_SETTORI)} {rnd.choice(_FORME)}"
+            anagrafiche[categoria].append({
+                "ragione_sociale": nome,
+                "piva": piva,
+                "email": f"amministrazione@{nome.split()[0].lower()}{len(usate)}.it",
+                "telefono": f"0{rnd.randint(10, 99)} {rnd.randint(1000000, 9999999)}",
+                "timestamp": datetime(2025, 1, 1).isoformat(),
+            })
+    return anagrafiche
+
+
+def genera_fatture(n, seme=SEME, oggi=None):
+    """(dati, anagrafiche): n fatture (2/3 attive) sugli ultimi tre anni, numerate senza buchi
+    per tipo e anno e con importi calcolati come nel form"""
+    # bozza importa archivio: genera_fatture va chiamata dentro la cartella temporanea (vedi esegui)
+    from bozza import GIORNI_PAGAMENTO
+    from fatture import calcola_totali
+
+    # (modalità, giorni alla scadenza) come nel form
+    pagamenti = list(GIORNI_PAGAMENTO.items())
+
+    rnd = random.Random(seme)
+    oggi = oggi or date(2026, 6, 30)
+    anagrafiche = genera_anagrafiche(max(10, min(n // 20, 20_000)), rnd)
+    controparti = {"Attiva": anagrafiche["clienti"], "Passiva": anagrafiche["fornitori"]}
+    inizio = date(oggi.year - 2, 1, 1).toordinal()
+    giorni = rnd.choices(range(inizio, oggi.toordinal() + 1), k=n)
+    giorni.sort()
+    dati = {"Attiva": [], "Passiva": []}
+    progressivi = {}
+    for giorno in giorni:
+        tipo = "Attiva" if rnd.random() < 2 / 3 else "Passiva"
+        data = date.fromordinal(giorno)
+        progressivi[(tipo, data.year)] = progressivi.get((tipo, data.year), 0) + 1
+        controparte = rnd.choice(controparti[tipo])
+        # importi log-normali: molte fatture piccole, poche grandi
+        imponibile = round(min(rnd.lognormvariate(6.5, 1.2), 500_000), 2)
+        iva_perc = rnd.choice(_ALIQUOTE)
+        iva, totale = calcola_totali(imponibile, iva_perc)
+        pagamento, dilazione = rnd.choice(pagamenti)
+        nota = rnd.choice(_NOTE)
+        dati[tipo].append({
+            "data": data.strftime("%d/%m/%Y"),
+            "numero": f"{data.year}/{progressivi[(tipo, data.year)]}",
+            "cliente_fornitore": controparte["ragione_sociale"],
+            "piva": controparte["piva"],
+            "imponibile": imponibile,
+            "iva_perc": iva_perc,
+            "iva": iva,
+            "totale": totale,
+            "pagamento": pagamento,
+            "note": nota.format(rnd.randint(1, 999)) if nota else "",
+            "scadenza": (data + timedelta(days=dilazione or 30)).strftime("%d/%m/%Y"),
+            "timestamp": datetime.combine(data, datetime.min.time()).replace(
+                hour=rnd.randint(8, 19), minute=rnd.randint(0, 59)).isoformat(),
+            "id": f"{rnd.getrandbits(128):032x}",
+        })
+    return dati, anagrafiche
+
+
+# ---------- misure ----------
+def _rileva(funzione, ripetizioni, prepara=None):
+    """Tempi di funzione() su più ripetizioni (prepara() prima di ognuna, fuori dal tempo)"""
+    tempi = []
+    for _ in range(ripetizioni):
+        if prepara:
+            prepara()
+        inizio = time.perf_counter()
+        funzione()
+        tempi.append(time.perf_counter() - inizio)
+    return tempi
+
+
+def _picco(funzione, prepara=None):
+    """Picco di memoria allocata da funzione() in MB, con tracemalloc"""
+    if prepara:
+        prepara()
+    tracemalloc.start()
+    try:
+        funzione()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def misura(nome, n, funzione, ripetizioni, memoria=True, prepara=None):
+    tempi = _rileva(funzione, ripetizioni, prepara)
+    migliore = min(tempi)
+    risultato = {
+        "operazione": nome,
+        "fatture": n,
+        "secondi": round(migliore, 6),
+        "secondi_mediana": round(statistics.median(tempi), 6),
+        "fatture_al_secondo": round(n / migliore) if migliore else None,
+        "picco_mb": round(_picco(funzione, prepara), 2) if memoria else None,
+    }
+    print(f"  {nome:<24} {migliore:9.4f} s  {risultato['fatture_al_secondo'] or 0:>12,} fatt/s"
+          + (f"  {risultato['picco_mb']:9.1f} MB" if memoria else ""), file=sys.stderr)
+    return risultato
+
+
+def esegui(n, ripetizioni=3, seme=SEME, memoria=True, oggi=None):
+    """Misure per un archivio di n fatture, in una cartella temporanea eliminata alla fine"""
+    oggi = oggi or date(2026, 6, 30)
+    cartella = tempfile.mkdtemp(prefix=f"invoicepro_bench_{n}_")
+    precedente = os.getcwd()
+    # l'import crea l'archivio nella cartella corrente: mai in quella di chi lancia il benchmark
+    os.chdir(cartella)
+    import analitica
+    import archivio
+    import esporta
+    import scadenze
+
+    # backend nuovo, con percorsi assoluti nella cartella temporanea, per ogni dimensione
+    originali = archivio._fatture, archivio._anagrafiche
+    archivio._fatture, archivio._anagrafiche = archivio.crea_archivio(cartella)
+    try:
+        inizio = time.perf_counter()
+        dati, anagrafiche = genera_fatture(n, seme, oggi)
+        print(f"{n:,} fatture generate in {time.perf_counter() - inizio:.2f} s", file=sys.stderr)
+        if not archivio.salva_anagrafiche(anagrafiche):
+            raise RuntimeError(f"salvataggio delle anagrafiche non riuscito in {cartella}")
+        attive = dati["Attiva"]
+        risultati = []
+
+        def salva():
+            if not archivio.salva_dati(dati):
+                raise RuntimeError(f"salva_dati non riuscito in {cartella}")
+
+        risultati.append(misura("salva_dati", n, salva, ripetizioni, memoria))
+
+        def invalida():
+            # come dopo una scrittura di un altro processo: la lettura riparte dal file
+            backend = archivio._fatture
+            # in modalità anni ogni anno ha il suo snapshot
+            partizioni = getattr(backend, "_partizioni", {}).values()
+            for percorso in [p.percorso for p in partizioni] or [getattr(backend, "percorso", None)]:
+                if percorso and os.path.exists(percorso):
+                    adesso = time.time_ns()
+                    os.utime(percorso, ns=(adesso, adesso))
+
+        risultati.append(misura("carica_dati", n, archivio.carica_dati, ripetizioni, memoria, invalida))
+        caricate = archivio.carica_dati()["Attiva"]
+
+        mese, anno = oggi.month, oggi.year
+        risultati.append(misura("filtra_fatture_mese", len(caricate),
+                                lambda: archivio.filtra_fatture_mese(caricate, mese, anno), ripetizioni, memoria))
+        # indice delle scadenze come nelle pagine, costruito sul backend di questa dimensione
+        indice = scadenze.IndiceScadenze()
+        indice.ricostruisci(archivio.carica_dati())
+        risultati.append(misura("scadute", len(caricate),
+                                lambda: indice.scadute("Attiva", oggi), ripetizioni, memoria))
+        frame = analitica.costruisci_frame(caricate)
+        risultati.append(misura("classifica_scadenze", len(caricate),
+                                lambda: analitica.classifica_scadenze(frame, oggi), ripetizioni, memoria))
+        risultati.append(misura("fattura_to_xml", len(attive),
+                                lambda: [esporta.fattura_to_xml(f, "Attiva") for f in attive], ripetizioni, memoria))
+        risultati.append(misura("costruisci_storico", len(caricate),
+                                lambda: analitica.costruisci_storico(caricate), ripetizioni, memoria))
+        storico = analitica.costruisci_storico(caricate)
+        risultati.append(misura("csv_storico", len(caricate),
+                                lambda: esporta.scrivi_csv(storico, io.StringIO()), ripetizioni, memoria))
+        risultati.append(misura("csv_fatture", len(caricate),
+                                lambda: esporta.scrivi_csv_fatture(caricate, io.StringIO()), ripetizioni, memoria))
+        return risultati
+    finally:
+        archivio._fatture, archivio._anagrafiche = originali
+        os.chdir(precedente)
+        shutil.rmtree(cartella, ignore_errors=True)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmark", description="Benchmark dell'archivio fatture")
+    p.add_argument("--dimensioni", type=int, nargs="+", default=list(DIMENSIONI), help="numero di fatture")
+    p.add_argument("--ripetizioni", type=int, default=3)
+    p.add_argument("--seme", type=int, default=SEME)
+    p.add_argument("--senza-memoria", action="store_true", help="salta il passaggio con tracemalloc")
+    p.add_argument("-o", "--output", help="file JSON dei risultati (default: stdout)")
+    args = p.parse_args(argv)
+
+    risultati = []
+    for n in args.dimensioni:
+        risultati += esegui(n, args.ripetizioni, args.seme, not args.senza_memoria)
+
+    import archivio
+
+    rss = None
+    if resource is not None:
+        # ru_maxrss è in KB su Linux, in byte su macOS
+        rss = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+    report = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "piattaforma": platform.platform(),
+        "cpu": os.cpu_count(),
+        "archivio": archivio.MODALITA_ARCHIVIO,
+        "snapshot": archivio.FORMATO_SNAPSHOT,
+        "seme": args.seme,
+        "ripetizioni": args.ripetizioni,
+        "rss_massimo_mb": rss,
+        "risultati": risultati,
+    }
+    testo = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding='utf-8') as f:
+            f.write(testo + "\n")
+    else:
+        print(testo)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Bozza della fattura nel form, con derivati e validazione memorizzati.
+
+Lo script ricrea i widget ad ogni tasto premuto; la bozza (in
+st.session_state, solo i campi del form) evita di rifare tutto ogni volta:
+
+- IVA e totale si ricalcolano solo quando cambiano imponibile o aliquota;
+- la scadenza proposta solo quando cambiano data o modalità di pagamento;
+- aggiorna() rivalida soltanto i campi cambiati dal rerun precedente;
+- dati() e l'XML restano quelli già costruiti finché la bozza non cambia.
+
+Nessuna dipendenza da Streamlit.
+"""
+from datetime import timedelta
+
+from esporta import fattura_to_xml
+from fatture import VALIDAZIONI, calcola_totali, valida_campo
+
+# Modalità del form -> giorni dalla data fattura alla scadenza proposta
+GIORNI_PAGAMENTO = {
+    "Bonifico 30gg": 30,
+    "Bonifico 60gg": 60,
+    "Anticipo": 0,
+    "Contanti": 0,
+    "Ri.Ba.": 30,
+    "Bonifico immediato": 0,
+}
+PAGAMENTI = list(GIORNI_PAGAMENTO)
+GIORNI_DEFAULT = 30
+
+_MANCANTE = object()
+
+
+class Bozza:
+    def __init__(self, tipo):
+        self.tipo = tipo
+        self.campi = {}  # valori dei widget: date per data/scadenza, stringhe non ripulite
+        self.versione = 0
+        self.toccati = set()  # campi cambiati dall'utente dopo il primo rerun
+        self.errori = {}  # campo -> [messaggi], aggiornati solo per i campi cambiati
+        self._totali = (None, (0.0, 0.0))
+        self._scadenza = (None, None)
+        self._dati = (None, None)
+        self._xml = (None, None)
+
+    # ---------- derivati ----------
+    def totali(self, imponibile, iva_perc):
+        """(IVA, totale), ricalcolati solo se cambiano imponibile o aliquota"""
+        chiave = (imponibile, iva_perc)
+        if self._totali[0] != chiave:
+            self._totali = (chiave, calcola_totali(imponibile, iva_perc))
+        return self._totali[1]
+
+    def scadenza_proposta(self, data, pagamento):
+        """Data fattura + giorni della modalità di pagamento"""
+        chiave = (data, pagamento)
+        if self._scadenza[0] != chiave:
+            self._scadenza = (chiave, data + timedelta(days=GIORNI_PAGAMENTO.get(pagamento, GIORNI_DEFAULT)))
+        return self._scadenza[1]
+
+    # ---------- aggiornamento ----------
+    def aggiorna(self, **campi):
+        """Registra i valori dei widget e rivalida solo i campi cambiati; restituisce i loro nomi"""
+        cambiati = {nome for nome, valore in campi.items() if self.campi.get(nome, _MANCANTE) != valore}
+        if not cambiati:
+            return cambiati
+        if self.campi:
+            self.toccati |= cambiati
+        self.campi.update((nome, campi[nome]) for nome in cambiati)
+        self.versione += 1
+        dati = self.dati()
+        for campo in cambiati & VALIDAZIONI.keys():
+            self.errori[campo] = valida_campo(campo, dati)
+        return cambiati
+
+    def dati(self):
+        """Fattura pronta da salvare (stesso formato dell'archivio), ricostruita solo se la bozza cambia"""
+        if self._dati[0] != self.versione:
+            c = self.campi
+            imponibile, iva_perc = float(c.get("imponibile", 0.0)), float(c.get("iva_perc", 0.0))
+            iva, totale = self.totali(imponibile, iva_perc)
+            data = c.get("data")
+            scadenza = c.get("scadenza") or (self.scadenza_proposta(data, c.get("pagamento")) if data else None)
+            self._dati = (self.versione, {
+                "data": data.strftime("%d/%m/%Y") if data else "",
+                "numero": c.get("numero", "").strip(),
+                "cliente_fornitore": c.get("cliente_fornitore", "").strip(),
+                "piva": c.get("piva", "").strip(),
+                "imponibile": imponibile,
+                "iva_perc": iva_perc,
+                "iva": float(iva),
+                "totale": float(totale),
+                "pagamento": c.get("pagamento", ""),
+                "note": c.get("note", "").strip(),
+                "scadenza": scadenza.strftime("%d/%m/%Y") if scadenza else "",
+            })
+        return self._dati[1]
+
+    # ---------- validazione ----------
+    def errori_visibili(self):
+        """Errori dei campi già modificati dall'utente (un form appena aperto non ne mostra)"""
+        return [e for campo in VALIDAZIONI if campo in self.toccati for e in self.errori.get(campo, [])]
+
+    def errori_lista(self):
+        """Tutti gli errori, come valida_fattura, senza rivalidare i campi invariati"""
+        dati = self.dati()
+        for campo in VALIDAZIONI.keys() - self.errori.keys():
+            self.errori[campo] = valida_campo(campo, dati)
+        return [e for campo in VALIDAZIONI for e in self.errori[campo]]
+
+    # ---------- XML ----------
+    def xml(self):
+        """XML della bozza in UTF-8, rigenerato solo se la bozza è cambiata"""
+        if self._xml[0] != self.versione:
+            self._xml = (self.versione, fattura_to_xml(self.dati(), self.tipo).encode('utf-8'))
+        return self._xml[1]
@@ -0,0 +1,175 @@
+"""Comandi da terminale per job batch e cron, senza avviare Streamlit.
+
+    python cli.py importa fatture.csv --tipo Passiva
+    python cli.py importa cartella_xml/
+    python cli.py esporta-xml 2026 --mese 3 -o marzo.zip
+    python cli.py esporta-pdf 2026 --mese 3 -o marzo_pdf.zip
+    python cli.py esporta-csv Attiva [--anno 2026] -o attive.csv
+    python cli.py aggregati 2026 [--mese 3]
+    python cli.py scadenze [--giorni 7] [--elenco]
+    python cli.py compatta
+
+I moduli vengono importati solo dal comando che li usa: pandas non viene
+mai caricato.
+"""
+import argparse
+import json
+import os
+import sys
+
+
+def cmd_importa(args):
+    import importa
+
+    righe = []
+    for percorso in args.file:
+        if os.path.isdir(percorso):
+            righe += importa.leggi_cartella_xml(percorso)
+        elif percorso.lower().endswith(".xml"):
+            righe.append(importa.leggi_xml(percorso, os.path.basename(percorso)))
+        else:
+            righe += importa.leggi_csv(percorso, args.tipo)
+    importate, errori = importa.importa(righe, args.tutto_o_niente, args.processi)
+    for riferimento, messaggi in errori.items():
+        print(f"{riferimento}: {' '.join(messaggi)}", file=sys.stderr)
+    print(f"{importate} fatture importate, {len(errori)} righe scartate")
+    return 1 if errori else 0
+
+
+def cmd_esporta_xml(args):
+    import esporta
+
+    fatture = esporta.fatture_periodo(args.anno, args.mese)
+    destinazione = args.output or os.path.join(args.origine, f"fatture_xml_{args.anno}{f'_{args.mese:02d}' if args.mese else ''}.zip")
+    esporta.xml_zip(fatture, destinazione, args.processi)
+    print(f"{len(fatture)} fatture esportate in {destinazione}")
+    return 0
+
+
+def cmd_esporta_pdf(args):
+    import esporta
+    import stampa
+
+    if args.processi:
+        stampa.PROCESSI = args.processi
+    fatture = esporta.fatture_periodo(args.anno, args.mese)
+    destinazione = args.output or os.path.join(args.origine, f"fatture_pdf_{args.anno}{f'_{args.mese:02d}' if args.mese else ''}.zip")
+    stampa.pdf_zip(fatture, destinazione)
+    print(f"{len(fatture)} fatture esportate in {destinazione}")
+    return 0
+
+
+def cmd_esporta_csv(args):
+    import archivio
+    import esporta
+
+    dati = archivio.carica_dati() if args.anno is None else archivio.carica_anno(args.anno)
+    fatture = dati[args.tipo]
+    if args.output:
+        with open(args.output, "w", encoding='utf-8', newline="") as f:
+            esporta.scrivi_csv_fatture(fatture, f)
+    else:
+        esporta.scrivi_csv_fatture(fatture, sys.stdout)
+    return 0
+
+
+def cmd_aggregati(args):
+    import aggregati
+
+    risultato = {}
+    for tipo in ("Attiva", "Passiva"):
+        if args.mese:
+            risultato[tipo] = aggregati.riepilogo_mese(args.anno, args.mese, tipo)
+        else:
+            risultato[tipo] = aggregati.andamento_anno(args.anno, tipo)
+    print(json.dumps(risultato, indent=2))
+    return 0
+
+
+def cmd_scadenze(args):
+    from datetime import date
+
+    import scadenze
+
+    oggi = date.today()
+    indice = scadenze.indice_scadenze()
+    risultato = indice.riepilogo(oggi, args.giorni)
+    if args.elenco:
+        for tipo in risultato:
+            risultato[tipo]["elenco_scadute"] = indice.scadute(tipo, oggi)
+    print(json.dumps(risultato, indent=2, ensure_ascii=False))
+    return 0
+
+
+def cmd_compatta(args):
+    import archivio
+
+    if not archivio.compatta_archivio():
+        print("❌ Compattazione non riuscita", file=sys.stderr)
+        return 1
+    print("✅ Archivio compattato")
+    return 0
+
+
+def parser():
+    p = argparse.ArgumentParser(prog="invoicepro", description="Job batch sull'archivio fatture")
+    p.add_argument("--cartella", default=".", help="cartella con fatture.json / fatture.db")
+    sub = p.add_subparsers(dest="comando", required=True)
+
+    imp = sub.add_parser("importa", help="importa fatture da CSV, file XML o cartelle di XML")
+    imp.add_argument("file", nargs="+")
+    imp.add_argument("--tipo", choices=["Attiva", "Passiva"], default="Attiva", help="tipo delle righe CSV")
+    imp.add_argument("--tutto-o-niente", action="store_true", help="non salva nulla se una riga non è valida")
+    imp.add_argument("--processi", type=int, default=None)
+    imp.set_defaults(funzione=cmd_importa)
+
+    xml = sub.add_parser("esporta-xml", help="ZIP con un XML per fattura dell'anno o del mese")
+    xml.add_argument("anno", type=int)
+    xml.add_argument("--mese", type=int, choices=range(1, 13))
+    xml.add_argument("-o", "--output")
+    xml.add_argument("--processi", type=int, default=None)
+    xml.set_defaults(funzione=cmd_esporta_xml)
+
+    pdf = sub.add_parser("esporta-pdf", help="ZIP con un PDF per fattura dell'anno o del mese")
+    pdf.add_argument("anno", type=int)
+    pdf.add_argument("--mese", type=int, choices=range(1, 13))
+    pdf.add_argument("-o", "--output")
+    pdf.add_argument("--processi", type=int, default=None)
+    pdf.set_defaults(funzione=cmd_esporta_pdf)
+
+    csv_ = sub.add_parser("esporta-csv", help="CSV ';' delle fatture del tipo (stdout se manca -o)")
+    csv_.add_argument("tipo", choices=["Attiva", "Passiva"])
+    csv_.add_argument("--anno", type=int, help="solo le fatture dell'anno (default: tutte)")
+    csv_.add_argument("-o", "--output")
+    csv_.set_defaults(funzione=cmd_esporta_csv)
+
+    agg = sub.add_parser("aggregati", help="riepilogo mensile (o dei 12 mesi) in JSON")
+    agg.add_argument("anno", type=int)
+    agg.add_argument("--mese", type=int, choices=range(1, 13))
+    agg.set_defaults(funzione=cmd_aggregati)
+
+    scad = sub.add_parser("scadenze", help="scadute e in scadenza di tutto l'archivio in JSON")
+    scad.add_argument("--giorni", type=int, default=7, help="orizzonte di \"in scadenza\"")
+    scad.add_argument("--elenco", action="store_true", help="aggiunge l'elenco delle scadute")
+    scad.set_defaults(funzione=cmd_scadenze)
+
+    comp = sub.add_parser("compatta", help="riscrive lo snapshot e svuota il journal")
+    comp.set_defaults(funzione=cmd_compatta)
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    # file in ingresso e -o restano relativi alla cartella da cui si lancia il comando
+    args.origine = os.getcwd()
+    if getattr(args, "file", None):
+        args.file = [os.path.abspath(percorso) for percorso in args.file]
+    if getattr(args, "output", None):
+        args.output = os.path.abspath(args.output)
+    # i percorsi dell'archivio sono relativi: si entra nella cartella prima di leggerlo
+    os.chdir(args.cartella)
+    return args.funzione(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""Snapshot colonnare dell'archivio fatture (INVOICEPRO_SNAPSHOT=colonne).
+
+Al posto di fatture.json con indent e chiavi ripetute in ogni fattura,
+fatture.colonne contiene per ogni tipo una colonna NumPy per campo:
+
+- date (data, scadenza) come int32, giorni dal 01/01/1970;
+- importi e aliquota come int64 in centesimi;
+- testi come un unico blocco UTF-8 separato da \\x00 (una decode e uno split);
+- una maschera di bit con i campi presenti in ogni fattura e, in JSON, i
+  valori che non rientrano nel formato della colonna (date non dd/mm/yyyy,
+  importi con più di due decimali, campi aggiuntivi): nulla va perso.
+
+Il file è un'intestazione JSON seguita dai buffer delle colonne, allineati a
+8 byte, e viene letto con mmap: le colonne numeriche non vengono copiate.
+leggi() però decodifica subito tutte le righe in dizionari, come lo snapshot
+JSON, perché l'archivio lavora su liste di fatture: il guadagno è nel
+caricamento (niente parsing JSON), non nella memoria dopo la lettura.
+All'avvio di una sessione tutta la storia viene quindi ancora decodificata:
+le colonne di apri() non sono esposte ad archivio_anni né ad analitica, che
+ricevono sempre le fatture come dizionari.
+
+Migrazione una tantum da fatture.json (journal compreso):
+    python colonnare.py [fatture.json] [fatture.colonne]
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from datetime import date
+from operator import itemgetter
+
+import numpy as np
+
+MAGIA = b"INVPCOL1"
+EPOCA = date(1970, 1, 1).toordinal()
+
+CAMPI_DATA = ("data", "scadenza")
+CAMPI_IMPORTO = ("imponibile", "iva_perc", "iva", "totale")
+CAMPI_TESTO = ("numero", "cliente_fornitore", "piva", "pagamento", "note", "timestamp", "id")
+# Ordine delle chiavi nelle fatture ricostruite (lo stesso del form)
+ORDINE = ("data", "numero", "cliente_fornitore", "piva", "imponibile", "iva_perc", "iva",
+          "totale", "pagamento", "note", "scadenza", "timestamp", "id")
+_BIT = {campo: 1 << i for i, campo in enumerate(ORDINE)}
+
+
+def _data_testo(giorni):
+    return date.fromordinal(int(giorni) + EPOCA).strftime("%d/%m/%Y")
+
+
+# ---------- codifica ----------
+_MANCA = object()
+
+
+def _giorni(valore):
+    """dd/mm/yyyy -> giorni dal 1970, None se la data non si riscrive identica"""
+    if not isinstance(valore, str) or len(valore) != 10:
+        return None
+    try:
+        giorno = date(int(valore[6:]), int(valore[3:5]), int(valore[:2]))
+    except ValueError:
+        return None
+    return giorno.toordinal() - EPOCA if giorno.strftime("%d/%m/%Y") == valore else None
+
+
+def _codifica(fatture):
+    """Fatture -> {nome colonna: array NumPy o bytes}, una colonna alla volta"""
+    n = len(fatture)
+    presenza = np.zeros(n, dtype="uint16")
+    colonne = {"presenza": presenza}
+    fuori = {}  # posizione -> campi con valori non rappresentabili nella colonna
+    for campo in ORDINE:
+        valori = [f.get(campo, _MANCA) for f in fatture]
+        if campo in CAMPI_IMPORTO:
+            # solo float con al più due decimali: gli int restano int passando da extra
+            numeri = np.array([v if type(v) is float else np.nan for v in valori], dtype="float64")
+            with np.errstate(invalid="ignore", over="ignore"):
+                centesimi = np.round(numeri * 100)
+                validi = (centesimi / 100 == numeri) & (np.abs(numeri) < 9e15)
+            colonne[campo] = np.where(validi, centesimi, 0).astype("int64")
+        elif campo in CAMPI_DATA:
+            giorni = {v: _giorni(v) for v in set(v for v in valori if type(v) is str)}
+            convertite = [giorni.get(v) if type(v) is str else None for v in valori]
+            validi = np.array([g is not None for g in convertite], dtype=bool)
+            colonne[campo] = np.array([g or 0 for g in convertite], dtype="int32")
+        else:
+            validi = np.array([type(v) is str and "\x00" not in v for v in valori], dtype=bool)
+            colonne[campo] = "\x00".join([v if ok else "" for v, ok in zip(valori, validi.tolist())]).encode('utf-8')
+        presenza[validi] |= _BIT[campo]
+        for i in np.flatnonzero(~validi).tolist():
+            if valori[i] is not _MANCA:
+                fuori.setdefault(i, {})[campo] = valori[i]
+    for i, fattura in enumerate(fatture):
+        if fattura.keys() - _BIT.keys():
+            fuori.setdefault(i, {}).update((k, v) for k, v in fattura.items() if k not in _BIT)
+    extra = [""] * n
+    for i, campi in fuori.items():
+        extra[i] = json.dumps(campi, ensure_ascii=False)
+    colonne["extra"] = "\x00".join(extra).encode('utf-8')
+    return colonne
+
+
+def scrivi(percorso, dati, seq=0):
+    """Scrive lo snapshot (file temporaneo + rinomina, come _scrivi_atomico)"""
+    intestazione = {"seq": seq, "tipi": {}}
+    buffer = []
+    posizione = 0
+    for tipo, fatture in dati.items():
+        if tipo.startswith("_"):
+            continue
+        colonne = {}
+        for nome, valore in _codifica(fatture).items():
+            grezzo = valore if isinstance(valore, bytes) else valore.tobytes()
+            dtype = "bytes" if isinstance(valore, bytes) else valore.dtype.str
+            colonne[nome] = [dtype, posizione, len(grezzo)]
+            riempimento = -len(grezzo) % 8
+            buffer.append(grezzo + b"\x00" * riempimento)
+            posizione += len(grezzo) + riempimento
+        intestazione["tipi"][tipo] = {"righe": len(fatture), "colonne": colonne}
+    testata = json.dumps(intestazione).encode('utf-8')
+    testata += b" " * (-(len(MAGIA) + 8 + len(testata)) % 8)
+    tmp = f"{percorso}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIA + struct.pack("<Q", len(testata)) + testata)
+        for blocco in buffer:
+            f.write(blocco)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, percorso)
+
+
+# ---------- lettura ----------
+def apri(percorso):
+    """(seq, {tipo: (righe, {nome colonna: array in sola lettura sul file mappato o bytes})})"""
+    with open(percorso, "rb") as f:
+        mappa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mappa[:len(MAGIA)] != MAGIA:
+        raise ValueError(f"{percorso} non è uno snapshot colonnare")
+    lunghezza, = struct.unpack_from("<Q", mappa, len(MAGIA))
+    inizio = len(MAGIA) + 8 + lunghezza
+    intestazione = json.loads(mappa[len(MAGIA) + 8:inizio])
+    tipi = {}
+    for tipo, info in intestazione["tipi"].items():
+        colonne = {}
+        for nome, (dtype, posizione, dimensione) in info["colonne"].items():
+            if dtype == "bytes":
+                colonne[nome] = mappa[inizio + posizione:inizio + posizione + dimensione]
+            elif dimensione == 0:
+                colonne[nome] = np.zeros(0, dtype=dtype)
+            else:
+                colonne[nome] = np.frombuffer(mappa, dtype=dtype, count=dimensione // np.dtype(dtype).itemsize,
+                                              offset=inizio + posizione)
+        tipi[tipo] = (info["righe"], colonne)
+    return intestazione["seq"], tipi
+
+
+def _fatture(chiavi, colonne):
+    """Colonne di valori (una per chiave) -> lista di dizionari, una riga per fattura"""
+    return [dict(zip(chiavi, riga)) for riga in zip(*colonne)]
+
+
+def _decodifica(righe, colonne):
+    """Colonne -> lista di fatture (dizionari come quelli dello snapshot JSON)"""
+    if righe == 0:
+        return []
+    valori = {}
+    for campo in CAMPI_DATA:
+        # le date distinte sono poche: si formatta ognuna una volta sola
+        distinte, posizioni = np.unique(colonne[campo], return_inverse=True)
+        testi = [_data_testo(g) for g in distinte.tolist()]
+        valori[campo] = [testi[p] for p in posizioni.tolist()]
+    for campo in CAMPI_IMPORTO:
+        valori[campo] = (colonne[campo] / 100).tolist()
+    for campo in CAMPI_TESTO:
+        valori[campo] = colonne[campo].decode('utf-8').split("\x00")
+    extra = colonne["extra"].decode('utf-8').split("\x00")
+    presenza = colonne["presenza"]
+
+    maschere = np.unique(presenza).tolist()
+    if len(maschere) == 1:
+        chiavi = [campo for campo in ORDINE if maschere[0] & _BIT[campo]]
+        fatture = _fatture(chiavi, [valori[campo] for campo in chiavi]) if chiavi \
+            else [{} for _ in range(righe)]
+    else:
+        # quasi tutte le fatture hanno gli stessi campi: un gruppo per combinazione presente
+        fatture = [None] * righe
+        for maschera in maschere:
+            chiavi = [campo for campo in ORDINE if maschera & _BIT[campo]]
+            posizioni = np.flatnonzero(presenza == maschera).tolist()
+            if not chiavi:
+                gruppo = [{} for _ in posizioni]
+            else:
+                prendi = itemgetter(*posizioni) if len(posizioni) > 1 else (lambda lista: (lista[posizioni[0]],))
+                gruppo = _fatture(chiavi, [prendi(valori[campo]) for campo in chiavi])
+            for posizione, fattura in zip(posizioni, gruppo):
+                fatture[posizione] = fattura
+    for posizione, testo in enumerate(extra):
+        if testo:
+            fatture[posizione].update(json.loads(testo))
+    return fatture
+
+
+def leggi(percorso, vuoto):
+    """Snapshot -> {"_seq": ..., tipo: [fatture]}, vuoto() se manca o non è leggibile"""
+    try:
+        seq, tipi = apri(percorso)
+    except:
+        return vuoto()
+    dati = {tipo: _decodifica(righe, colonne) for tipo, (righe, colonne) in tipi.items()}
+    dati["_seq"] = seq
+    return dati
+
+
+def migra_da_json(percorso_json="fatture.json", percorso_colonne="fatture.colonne"):
+    """Compatta l'archivio JSON e ne scrive lo snapshot colonnare con lo stesso numero di sequenza"""
+    from archivio import ArchivioJournal
+
+    percorso_journal = percorso_json[:-len(".json")] + ".journal.jsonl"
+    origine = ArchivioJournal(percorso_json, percorso_journal)
+    if not origine.compatta():
+        raise RuntimeError(f"Compattazione di {percorso_json} non riuscita")
+    dati = origine.leggi()
+    scrivi(percorso_colonne, dati, origine._seq)
+    return len(dati["Attiva"]), len(dati["Passiva"])
+
+
+if __name__ == "__main__":
+    attive, passive = migra_da_json(*sys.argv[1:3])
+    print(f"✅ Snapshot colonnare con {attive} fatture attive e {passive} passive")
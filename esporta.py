@@ -0,0 +1,220 @@
+"""Esportazioni dell'archivio fatture: CSV dello storico e XML delle fatture."""
+import csv
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import archivio
+import profilo
+from archivio import data_fattura
+
+# Righe scritte per blocco: il CSV non viene mai costruito per intero in memoria
+BLOCCO_CSV = 50_000
+
+_cartella_csv = None
+_csv_pronti = {}  # (tipo, anno) -> (versione archivio, percorso)
+_lock_csv = threading.Lock()
+
+
+def scrivi_csv(df, destinazione, blocco=BLOCCO_CSV):
+    """Scrive il DataFrame come CSV ';' a blocchi di righe su un file di testo aperto"""
+    for inizio in range(0, max(len(df), 1), blocco):
+        df.iloc[inizio:inizio + blocco].to_csv(destinazione, index=False, sep=';', header=inizio == 0)
+
+
+def _data_csv(valore):
+    """Come formatta_date di analitica: dd/mm/yyyy, invariata se non interpretabile"""
+    if valore is None:
+        return ""
+    valore = str(valore)
+    if not valore or "/" in valore:
+        return valore
+    data = data_fattura(valore)
+    return data.strftime("%d/%m/%Y") if data is not None else valore
+
+
+def scrivi_csv_fatture(fatture, destinazione):
+    """Stesso CSV ';' dello storico scritto riga per riga con il modulo csv, senza pandas"""
+    colonne = {}
+    for fattura in fatture:
+        for campo in fattura:
+            colonne.setdefault(campo, None)
+    colonne.pop("id", None)
+    writer = csv.DictWriter(destinazione, fieldnames=list(colonne), delimiter=';',
+                            restval="", extrasaction="ignore", lineterminator="\n")
+    writer.writeheader()
+    for fattura in fatture:
+        riga = dict(fattura)
+        for campo in ("data", "scadenza"):
+            if campo in riga:
+                riga[campo] = _data_csv(riga[campo])
+        writer.writerow(riga)
+
+
+def csv_archivio(tipo, anno=None):
+    """Percorso del CSV delle fatture del tipo (tutte o dell'anno), rigenerato solo se l'archivio è cambiato"""
+    from analitica import frame_storico
+
+    global _cartella_csv
+    versione = archivio.versione_dati()
+    with _lock_csv:
+        pronto = _csv_pronti.get((tipo, anno))
+        if pronto and pronto[0] == versione and os.path.exists(pronto[1]):
+            return pronto[1]
+        if _cartella_csv is None:
+            _cartella_csv = tempfile.mkdtemp(prefix="invoicepro_csv_")
+        percorso = os.path.join(_cartella_csv, f"Fatture_{tipo}_{anno or 'tutte'}_{versione}.csv")
+        with open(percorso, "w", encoding='utf-8', newline="") as f, profilo.fase(f"CSV {tipo}"):
+            scrivi_csv(frame_storico(tipo, anno), f)
+        if pronto and pronto[1] != percorso and os.path.exists(pronto[1]):
+            os.remove(pronto[1])
+        _csv_pronti[(tipo, anno)] = (versione, percorso)
+        return percorso
+
+
+# ---------- XML ----------
+# Oltre questa soglia l'export a lotti usa un pool di processi
+SOGLIA_PROCESSI = 5000
+BLOCCO_XML = 2000
+# ZIP degli XML tenuti su disco, uno per periodo (come stampa.ZIP_TENUTI)
+ZIP_TENUTI = 4
+
+_cartella_zip = None
+_zip_pronti = {}  # (anno, mese) -> (versione archivio, percorso)
+_lock_zip = threading.Lock()
+
+_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})
+
+
+def _testo(valore):
+    if valore is None:
+        return ""
+    return str(valore).replace("\r\n", "\n").replace("\r", "\n").translate(_ESCAPE)
+
+
+def _elemento(nome, valore, rientro):
+    testo = _testo(valore)
+    if not testo:
+        return f"{rientro}<{nome}/>\n"
+    return f"{rientro}<{nome}>{testo}</{nome}>\n"
+
+
+def fattura_to_xml(fattura, tipo):
+    """XML della fattura, scritto direttamente come testo indentato (stesso output di
+    ElementTree + minidom.toprettyxml, senza costruire e riparsare l'albero)"""
+    return "".join((
+        '<?xml version="1.0" ?>\n',
+        f'<Fattura tipo="{_testo(tipo)}">\n',
+        "  <Generale>\n",
+        _elemento("Data", fattura["data"], "    "),
+        _elemento("Numero", fattura["numero"], "    "),
+        _elemento("Totale", f"{fattura['totale']:.2f}", "    "),
+        "  </Generale>\n",
+        "  <Controparte>\n",
+        _elemento("RagioneSociale", fattura["cliente_fornitore"], "    "),
+        _elemento("PIVA", fattura["piva"], "    "),
+        "  </Controparte>\n",
+        "  <Importi>\n",
+        _elemento("Imponibile", f"{fattura['imponibile']:.2f}", "    "),
+        _elemento("IVA", f"{fattura['iva']:.2f}", "    "),
+        _elemento("IVA_Perc", f"{fattura['iva_perc']}%", "    "),
+        "  </Importi>\n",
+        _elemento("Pagamento", fattura["pagamento"], "  "),
+        _elemento("Note", fattura["note"], "  "),
+        "</Fattura>\n",
+    ))
+
+
+def nome_file_xml(fattura, tipo):
+    """Nome del file nello ZIP: il numero (es. 2026/12) senza caratteri non validi"""
+    numero = re.sub(r"[^\w.-]+", "-", str(fattura.get("numero", ""))).strip("-") or fattura.get("id", "fattura")
+    return f"{numero}_{tipo}.xml"
+
+
+def nome_libero(nome, usati):
+    """Numeri duplicati: dal secondo file un suffisso progressivo, finché il nome non è libero"""
+    base, estensione = os.path.splitext(nome)
+    n = 1
+    while nome in usati:
+        nome = f"{base}_{n}{estensione}"
+        n += 1
+    return nome
+
+
+def _xml_blocco(blocco):
+    """Eseguita nei processi del pool: [(tipo, fattura)] -> [(nome file, xml in bytes)]"""
+    return [(nome_file_xml(fattura, tipo), fattura_to_xml(fattura, tipo).encode('utf-8'))
+            for tipo, fattura in blocco]
+
+
+def fatture_periodo(anno, mese=None, tipi=archivio.TIPI):
+    """[(tipo, fattura)] emesse nell'anno (e nel mese, se indicato)"""
+    selezionate = []
+    dati = archivio.carica_anno(anno)
+    for tipo in tipi:
+        for fattura in dati[tipo]:
+            if mese is None or data_fattura(fattura["data"]).month == mese:
+                selezionate.append((tipo, fattura))
+    return selezionate
+
+
+def xml_zip(fatture, destinazione, processi=None):
+    """Scrive in uno ZIP un file XML per fattura; restituisce il numero di fatture esportate.
+
+    Le fatture vengono serializzate a blocchi, in parallelo se sono più di
+    SOGLIA_PROCESSI, e ogni file viene scritto nello ZIP appena pronto.
+    """
+    blocchi = [fatture[i:i + BLOCCO_XML] for i in range(0, len(fatture), BLOCCO_XML)]
+    usati = set()
+    with zipfile.ZipFile(destinazione, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        if len(fatture) > SOGLIA_PROCESSI:
+            # spawn: il processo Streamlit ha più thread e fork potrebbe bloccarsi
+            pool = ProcessPoolExecutor(max_workers=processi, mp_context=multiprocessing.get_context("spawn"))
+            risultati = pool.map(_xml_blocco, blocchi)
+        else:
+            pool = None
+            risultati = map(_xml_blocco, blocchi)
+        try:
+            for serializzate in risultati:
+                for nome, xml in serializzate:
+                    nome = nome_libero(nome, usati)
+                    usati.add(nome)
+                    zf.writestr(nome, xml)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    return len(fatture)
+
+
+def xml_zip_periodo(anno, mese=None):
+    """Percorso dello ZIP con gli XML del periodo, rigenerato solo se l'archivio è cambiato"""
+    global _cartella_zip
+    versione = archivio.versione_dati()
+    with _lock_zip:
+        pronto = _zip_pronti.pop((anno, mese), None)
+        if pronto and pronto[0] == versione and os.path.exists(pronto[1]):
+            _zip_pronti[(anno, mese)] = pronto  # in fondo: usato di recente
+            return pronto[1]
+        if _cartella_zip is None:
+            _cartella_zip = tempfile.mkdtemp(prefix="invoicepro_xml_")
+        percorso = os.path.join(_cartella_zip, f"Fatture_XML_{anno}_{mese or 'anno'}_{versione}.zip")
+        try:
+            with open(percorso, "wb") as f, profilo.fase("XML"):
+                xml_zip(fatture_periodo(anno, mese), f)
+        except:
+            if os.path.exists(percorso):
+                os.remove(percorso)
+            raise
+        if pronto and pronto[1] != percorso and os.path.exists(pronto[1]):
+            os.remove(pronto[1])
+        _zip_pronti[(anno, mese)] = (versione, percorso)
+        # al massimo ZIP_TENUTI periodi su disco: si elimina quello richiesto meno di recente
+        while len(_zip_pronti) > ZIP_TENUTI:
+            _, vecchio = _zip_pronti.pop(next(iter(_zip_pronti)))
+            if os.path.exists(vecchio):
+                os.remove(vecchio)
+        return percorso
@@ -0,0 +1,71 @@
+"""Calcolo totali e validazione delle fatture (nessuna dipendenza da Streamlit)."""
+from importi import centesimi, euro, iva_centesimi
+
+
+def calcola_totali(imponibile, iva_perc):
+    """(IVA, totale) in euro, calcolati in centesimi: totale = imponibile + IVA esatto al centesimo"""
+    try:
+        imp = centesimi(imponibile)
+        iva = iva_centesimi(imp, iva_perc)
+        return euro(iva), euro(imp + iva)
+    except:
+        return 0.0, 0.0
+
+
+def valida_piva(piva):
+    piva = piva.replace("IT", "").replace(" ", "").strip().upper()
+    return len(piva) == 11 and piva.isdigit()
+
+
+def valida_cf(cf):
+    cf = cf.replace("IT", "").replace(" ", "").strip().upper()
+    return len(cf) == 16 and cf.isalnum()
+
+
+# ---------- validazione per campo ----------
+def _errori_controparte(dati):
+    if not dati.get("cliente_fornitore", "").strip():
+        return ["❌ Cliente/Fornitore obbligatorio"]
+    return []
+
+
+def _errori_piva(dati):
+    if not dati.get("piva", "").strip():
+        return ["❌ P.IVA/CF obbligatorio"]
+    if not valida_piva(dati["piva"]):
+        return ["❌ P.IVA non valida (11 cifre)"]
+    return []
+
+
+def _errori_imponibile(dati):
+    if float(dati.get("imponibile", 0)) <= 0:
+        return ["❌ Imponibile > 0"]
+    return []
+
+
+def _errori_numero(dati):
+    if not dati.get("numero", "").strip():
+        return ["❌ Numero protocollo obbligatorio"]
+    return []
+
+
+# campo -> controllo, nell'ordine in cui vengono mostrati gli errori
+VALIDAZIONI = {
+    "cliente_fornitore": _errori_controparte,
+    "piva": _errori_piva,
+    "imponibile": _errori_imponibile,
+    "numero": _errori_numero,
+}
+
+
+def valida_campo(campo, dati):
+    """Errori del solo campo indicato (lista vuota se valido o senza controlli)"""
+    controllo = VALIDAZIONI.get(campo)
+    return controllo(dati) if controllo else []
+
+
+def valida_fattura(dati):
+    errori = []
+    for controllo in VALIDAZIONI.values():
+        errori += controllo(dati)
+    return errori
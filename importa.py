@@ -0,0 +1,146 @@
+"""Import massivo di fatture da CSV (formato export dello storico) e da XML.
+
+Le righe vengono validate con valida_fattura in un pool di processi (sopra
+SOGLIA_PROCESSI righe) e quelle valide salvate con un'unica scrittura.
+Un file che non si riesce a leggere (XML malformato, CSV non UTF-8) diventa
+un errore sotto il suo nome, senza interrompere gli altri.
+"""
+import csv
+import glob
+import io
+import multiprocessing
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import archivio
+from fatture import calcola_totali, valida_fattura
+
+SOGLIA_PROCESSI = 5000
+BLOCCO_VALIDAZIONE = 2000
+
+CAMPI_NUMERICI = ("imponibile", "iva_perc", "iva", "totale")
+# Chiave della riga segnaposto di un file illeggibile (vedi _illeggibile)
+ERRORE_LETTURA = "_errore_lettura"
+
+
+def _numero(valore):
+    """Importo da CSV/XML: accetta la virgola decimale, vuoto -> 0"""
+    valore = str(valore or "").strip().replace("€", "").replace("%", "").strip()
+    if "," in valore:
+        valore = valore.replace(".", "").replace(",", ".")
+    return float(valore) if valore else 0.0
+
+
+def normalizza(riga):
+    """Riga letta da CSV/XML -> fattura nello schema dell'archivio"""
+    fattura = {k: (v.strip() if isinstance(v, str) else v) for k, v in riga.items()
+               if k and k != "id" and v is not None}
+    for campo in ("cliente_fornitore", "piva", "numero", "data", "pagamento", "note"):
+        fattura.setdefault(campo, "")
+    for campo in CAMPI_NUMERICI:
+        if campo in fattura:
+            fattura[campo] = _numero(fattura[campo])
+    fattura.setdefault("iva_perc", 0.0)
+    fattura.setdefault("imponibile", 0.0)
+    if "iva" not in fattura or "totale" not in fattura:
+        fattura["iva"], fattura["totale"] = calcola_totali(fattura["imponibile"], fattura["iva_perc"])
+    fattura.setdefault("timestamp", datetime.now().isoformat())
+    return fattura
+
+
+# ---------- lettura ----------
+def _illeggibile(nome, tipo, errore):
+    """Riga segnaposto per un file non leggibile: la validazione la riporta come errore"""
+    return nome, tipo, {ERRORE_LETTURA: f"❌ File non leggibile: {errore}"}
+
+
+def leggi_csv(sorgente, tipo, nome=None):
+    """[(riferimento, tipo, riga)] da un CSV ';' (percorso o file di testo aperto)"""
+    nome = nome or (os.path.basename(sorgente) if isinstance(sorgente, str) else "csv")
+    try:
+        if isinstance(sorgente, str):
+            with open(sorgente, "r", encoding='utf-8-sig', newline="") as f:
+                return leggi_csv(f, tipo, nome)
+        return [(f"{nome}:{n}", tipo, riga)
+                for n, riga in enumerate(csv.DictReader(sorgente, delimiter=';'), start=2)]
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        return [_illeggibile(nome, tipo, e)]
+
+
+def leggi_xml(sorgente, nome="xml"):
+    """(riferimento, tipo, riga) da un file XML generato da fattura_to_xml"""
+    try:
+        radice = ET.parse(sorgente).getroot()
+    except (OSError, ET.ParseError) as e:
+        return _illeggibile(nome, "Attiva", e)
+    testo = lambda percorso: (radice.findtext(percorso) or "")
+    riga = {
+        "data": testo("Generale/Data"),
+        "numero": testo("Generale/Numero"),
+        "totale": testo("Generale/Totale"),
+        "cliente_fornitore": testo("Controparte/RagioneSociale"),
+        "piva": testo("Controparte/PIVA"),
+        "imponibile": testo("Importi/Imponibile"),
+        "iva": testo("Importi/IVA"),
+        "iva_perc": testo("Importi/IVA_Perc"),
+        "pagamento": testo("Pagamento"),
+        "note": testo("Note"),
+    }
+    return nome, radice.get("tipo", "Attiva"), riga
+
+
+def leggi_cartella_xml(cartella):
+    return [leggi_xml(percorso, os.path.basename(percorso))
+            for percorso in sorted(glob.glob(os.path.join(cartella, "*.xml")))]
+
+
+# ---------- validazione ----------
+def _valida_blocco(blocco):
+    """Eseguita nei processi del pool: [(riferimento, tipo, riga)] -> [(riferimento, tipo, fattura, errori)]"""
+    risultati = []
+    for riferimento, tipo, riga in blocco:
+        if ERRORE_LETTURA in riga:
+            risultati.append((riferimento, tipo, None, [riga[ERRORE_LETTURA]]))
+            continue
+        try:
+            fattura = normalizza(riga)
+            errori = valida_fattura(fattura)
+            if tipo not in archivio.TIPI:
+                errori.append(f"❌ Tipo sconosciuto: {tipo}")
+        except (TypeError, ValueError) as e:
+            fattura, errori = None, [f"❌ Riga non leggibile: {e}"]
+        risultati.append((riferimento, tipo, fattura, errori))
+    return risultati
+
+
+def valida(righe, processi=None):
+    blocchi = [righe[i:i + BLOCCO_VALIDAZIONE] for i in range(0, len(righe), BLOCCO_VALIDAZIONE)]
+    if len(righe) <= SOGLIA_PROCESSI:
+        return [r for blocco in blocchi for r in _valida_blocco(blocco)]
+    with ProcessPoolExecutor(max_workers=processi, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return [r for risultati in pool.map(_valida_blocco, blocchi) for r in risultati]
+
+
+def importa(righe, solo_se_tutte_valide=False, processi=None):
+    """Valida e salva le righe; restituisce (numero importate, {riferimento: errori})"""
+    validate = valida(righe, processi)
+    errori = {riferimento: e for riferimento, _, _, e in validate if e}
+    if errori and solo_se_tutte_valide:
+        return 0, errori
+    voci = [(tipo, fattura) for _, tipo, fattura, e in validate if not e]
+    if voci and not archivio.aggiungi_fatture(voci):
+        raise OSError("Salvataggio dell'import non riuscito")
+    return len(voci), errori
+
+
+def righe_da_file(nome, contenuto, tipo):
+    """Righe da un file caricato (CSV o XML) come bytes"""
+    if nome.lower().endswith(".xml"):
+        return [leggi_xml(io.BytesIO(contenuto), nome)]
+    try:
+        testo = contenuto.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        return [_illeggibile(nome, tipo, e)]
+    return leggi_csv(io.StringIO(testo, newline=""), tipo, nome)
@@ -0,0 +1,71 @@
+"""Importi in centesimi interi: calcoli esatti su IVA, totali e somme.
+
+Nelle fatture gli importi restano float in euro (il formato dell'archivio non
+cambia), ma ogni calcolo passa dai centesimi: IVA e totale con Decimal e
+arrotondamento commerciale (mezzo centesimo per eccesso), le somme come interi.
+Per molte fatture insieme c'è la versione vettoriale su array int64, esatta
+fino a ~90.000 miliardi di euro.
+"""
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+import numpy as np
+
+_CENTO = Decimal(100)
+_UNITA = Decimal(1)
+
+
+def centesimi(valore):
+    """Importo in euro (float, int, stringa con punto o virgola) -> centesimi interi, 0 se non valido"""
+    if valore is None or valore == "":
+        return 0
+    try:
+        # str(float) è la rappresentazione più corta: 0.1 resta 0.1 e non 0.1000000000000000055...
+        importo = Decimal(str(valore).strip().replace(",", "."))
+        return int((importo * _CENTO).quantize(_UNITA, rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError, OverflowError):
+        return 0
+
+
+def euro(cent):
+    """Centesimi interi -> float in euro (il float più vicino al valore esatto)"""
+    return int(cent) / 100
+
+
+def iva_centesimi(imponibile_cent, aliquota):
+    """IVA in centesimi sull'imponibile in centesimi, arrotondata al centesimo"""
+    try:
+        iva = Decimal(imponibile_cent) * Decimal(str(aliquota or 0).replace(",", ".")) / _CENTO
+        return int(iva.quantize(_UNITA, rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError, OverflowError):
+        return 0
+
+
+def somma(valori):
+    """Somma esatta di una lista di importi in euro, restituita in euro"""
+    try:
+        return euro(somma_centesimi(np.fromiter((v or 0 for v in valori), dtype="float64")))
+    except (TypeError, ValueError):
+        # valori non numerici (es. stringhe da vecchi import): uno alla volta
+        return euro(sum(centesimi(v) for v in valori))
+
+
+# ---------- versione vettoriale ----------
+def centesimi_array(valori):
+    """Array di importi in euro -> array int64 di centesimi (NaN -> 0), con lo stesso
+    arrotondamento di centesimi(): mezzo centesimo per eccesso sul valore decimale"""
+    numeri = np.asarray(valori, dtype="float64")
+    with np.errstate(invalid="ignore"):
+        cent = np.nan_to_num(numeri * 100, nan=0.0, posinf=0.0, neginf=0.0)
+        assoluti = np.abs(cent)
+        risultato = (np.sign(cent) * np.floor(assoluti + 0.5)).astype("int64")
+        # vicino al mezzo centesimo il float non basta (1.005 * 100 = 100.4999...):
+        # quei pochi valori passano da centesimi(), che arrotonda il decimale più corto
+        dubbi = np.flatnonzero(np.abs(assoluti - np.floor(assoluti) - 0.5) <= 1e-6 + assoluti * 1e-14)
+    for i, valore in zip(dubbi.tolist(), numeri[dubbi].tolist()):
+        risultato[i] = centesimi(valore)
+    return risultato
+
+
+def somma_centesimi(valori):
+    """Somma esatta in centesimi (int) di un array di importi in euro"""
+    return int(centesimi_array(valori).sum())
@@ -4,10 +4,28 @@ import os
 import pandas as pd
 import io
 from datetime import datetime
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
 import base64
 
+from archivio import carica_anagrafiche, carica_anno, cancella_archivio, nuovo_id, riepilogo_tipo
+import anagrafiche
+import numerazione
+from aggregati import riepilogo_mese, andamento_anno
+import analitica
+import esporta
+from fatture import valida_piva, valida_cf
+from bozza import Bozza, PAGAMENTI
+import importa
+import profilo
+import ricerca
+import risorse
+import scadenze
+import stampa
+
+
+def mostra_banner(**opzioni):
+    """Banner delle pagine: byte già in memoria (vedi risorse), non riletti da disco ad ogni rerun"""
+    st.image(risorse.banner(), **opzioni)
+
 
 # ========== LOGIN CON SECRETS ==========
 def check_login():
@@ -22,7 +40,7 @@ def check_login():
     if st.session_state.authenticated:
         return True
     
-    st.image("banner1.png", use_column_width=True, clamp=True, caption="Realizzato dal Mago con Perplexity AI")
+    mostra_banner(use_column_width=True, clamp=True, caption="Realizzato dal Mago con Perplexity AI")
 
     username = st.text_input("👤 **Username**", key="login_username")
     password = st.text_input("🔑 **Password**", type="password", key="login_password")
@@ -40,26 +58,19 @@ def check_login():
     st.markdown("</div>", unsafe_allow_html=True)
     st.stop()
 
+# ========== PROFILO DEL RERUN (solo con INVOICEPRO_PROFILO=1) ==========
+if "id_sessione" not in st.session_state:
+    st.session_state.id_sessione = nuovo_id()
+profilo.inizia_rerun(st.session_state.id_sessione, st.session_state.pop("profilo_cattura", False))
+
 # Verifica autenticazione all'inizio
+profilo.sezione("check_login")
 check_login()
 
 # ========== STILE CSS (solo dopo login) ==========
-st.markdown("""
-<style>
-/* METRIC PIÙ PICCOLE */
-[data-testid="stMetricLabel"] {
-    font-size: 16px !important;
-    font-weight: 600 !important;
-}
-[data-testid="stMetricValue"] {
-    font-size: 20px !important;
-    font-weight: 700 !important;
-}
-[data-testid="stMetricDelta"] {
-    font-size: 14px !important;
-}
-</style>
-""", unsafe_allow_html=True)
+# CSS minimizzato una volta per processo; va riemesso ad ogni rerun perché
+# Streamlit toglie dalla pagina gli elementi non ridisegnati
+st.markdown(risorse.stile(), unsafe_allow_html=True)
 
 # Header con utente loggato
 st.sidebar.success(f"👋 **Benvenuto, {st.session_state.username}!**")
@@ -68,25 +79,10 @@ st.sidebar.markdown("---")
 # =============================================================================
 # INIZIALIZZAZIONE SESSION STATE (SENZA LIBRERIE ESTERNE)
 # =============================================================================
-def formatta_data_df(data_str):
-    """Converte data per dataframe in dd/mm/yyyy"""
-    try:
-        if pd.isna(data_str):
-            return ""
-        if isinstance(data_str, str) and '/' in data_str:
-            return data_str
-        dt = pd.to_datetime(data_str)
-        return dt.strftime("%d/%m/%Y")
-    except:
-        return str(data_str)
-        
 def init_session_state():
     defaults = {
-        'dati_fatture': {"Attiva": [], "Passiva": []},
-        'anagrafiche': {"clienti": [], "fornitori": []},
         'pagina': 'home',
         'form_dati_salvati': False,
-        'form_dati_temp': {},
         'tipo': None,
         'show_pdf_preview': False,
         'anno_selezionato': 2026
@@ -97,80 +93,13 @@ def init_session_state():
 
 init_session_state()
 
-# Carica/Salva dati
-def carica_dati():
-    if os.path.exists("fatture.json"):
-        try:
-            with open("fatture.json", "r", encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            pass
-    return {"Attiva": [], "Passiva": []}
-
-def carica_anagrafiche():
-    if os.path.exists("anagrafiche.json"):
-        try:
-            with open("anagrafiche.json", "r", encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            pass
-    return {"clienti": [], "fornitori": []}
-
-def salva_dati(dati):
-    try:
-        with open("fatture.json", "w", encoding='utf-8') as f:
-            json.dump(dati, f, indent=4, ensure_ascii=False)
-        return True
-    except:
-        return False
-
-def salva_anagrafiche(dati):
-    try:
-        with open("anagrafiche.json", "w", encoding='utf-8') as f:
-            json.dump(dati, f, indent=4, ensure_ascii=False)
-        return True
-    except:
-        return False
-
-# Aggiorna dati persistenti
-st.session_state.dati_fatture = carica_dati()
-st.session_state.anagrafiche = carica_anagrafiche()
+# Fatture e anagrafiche non stanno nella sessione: le pagine leggono la vista
+# condivisa dal processo (archivio, copy-on-write) e qui restano solo pagina,
+# filtri e bozza del form, quindi la memoria per sessione non cresce con l'archivio.
 
 # =============================================================================
 # FUNZIONI UTILITY (SOLO LIBRERIE BASE)
 # =============================================================================
-def calcola_totali(imponibile, iva_perc):
-    try:
-        imp = float(imponibile or 0)
-        iva_p = float(iva_perc or 0) / 100
-        iva = imp * iva_p
-        totale = imp + iva
-        return round(iva, 2), round(totale, 2)
-    except:
-        return 0.0, 0.0
-
-def valida_piva(piva):
-    piva = piva.replace("IT", "").replace(" ", "").strip().upper()
-    return len(piva) == 11 and piva.isdigit()
-
-def valida_cf(cf):
-    cf = cf.replace("IT", "").replace(" ", "").strip().upper()
-    return len(cf) == 16 and cf.isalnum()
-
-def valida_fattura(dati):
-    errori = []
-    if not dati.get("cliente_fornitore", "").strip():
-        errori.append("❌ Cliente/Fornitore obbligatorio")
-    if not dati.get("piva", "").strip():
-        errori.append("❌ P.IVA/CF obbligatorio")
-    elif not valida_piva(dati["piva"]):
-        errori.append("❌ P.IVA non valida (11 cifre)")
-    if float(dati.get("imponibile", 0)) <= 0:
-        errori.append("❌ Imponibile > 0")
-    if not dati.get("numero", "").strip():
-        errori.append("❌ Numero protocollo obbligatorio")
-    return errori
-
 def cancella_storico():
     risposta = messagebox.askyesno("Conferma", "Eliminare TUTTE le fatture dallo storico?")
     if risposta:
@@ -180,43 +109,87 @@ def cancella_storico():
         messagebox.showinfo("Fatto", "Storico cancellato!")
         aggiorna_lista_archivio()  # Ricarica interfaccia
 
-def formatta_data_df(data_str):
-    try:
-        if pd.isna(data_str) or data_str == "":
-            return ""
-        if isinstance(data_str, str) and '/' in data_str:
-            return data_str
-        dt = pd.to_datetime(data_str)
-        return dt.strftime("%d/%m/%Y")
-    except:
-        return str(data_str)
-
-def fattura_to_xml(fattura, tipo):
-    fattura_xml = ET.Element("Fattura", tipo=tipo)
-    generali = ET.SubElement(fattura_xml, "Generale")
-    ET.SubElement(generali, "Data").text = fattura["data"]
-    ET.SubElement(generali, "Numero").text = fattura["numero"]
-    ET.SubElement(generali, "Totale").text = f"{fattura['totale']:.2f}"
-    
-    controparte = ET.SubElement(fattura_xml, "Controparte")
-    ET.SubElement(controparte, "RagioneSociale").text = fattura["cliente_fornitore"]
-    ET.SubElement(controparte, "PIVA").text = fattura["piva"]
-    
-    importi = ET.SubElement(fattura_xml, "Importi")
-    ET.SubElement(importi, "Imponibile").text = f"{fattura['imponibile']:.2f}"
-    ET.SubElement(importi, "IVA").text = f"{fattura['iva']:.2f}"
-    ET.SubElement(importi, "IVA_Perc").text = f"{fattura['iva_perc']}%"
-    
-    ET.SubElement(fattura_xml, "Pagamento").text = fattura["pagamento"]
-    ET.SubElement(fattura_xml, "Note").text = fattura["note"]
-    
-    rough_string = ET.tostring(fattura_xml, 'unicode')
-    reparsed = minidom.parseString(rough_string)
-    return reparsed.toprettyxml(indent="  ")
+def mostra_archivio(tipo, chiave, anno):
+    """Tabella storico filtrata, ordinata e paginata lato server: al browser va solo la pagina visibile"""
+    df = analitica.frame_fatture(tipo, anno)
+    with st.expander("🔎 **Filtri**"):
+        col_f1, col_f2, col_f3 = st.columns(3)
+        with col_f1:
+            dal = st.date_input("📅 Dal", value=None, format="DD/MM/YYYY", key=f"{chiave}_dal")
+            al = st.date_input("📅 Al", value=None, format="DD/MM/YYYY", key=f"{chiave}_al")
+        with col_f2:
+            controparte = st.text_input("👤 Cliente/Fornitore", key=f"{chiave}_controparte")
+            piva = st.text_input("🆔 P.IVA", key=f"{chiave}_piva")
+        with col_f3:
+            importo_min = st.number_input("💶 Totale da", value=None, min_value=0.0, step=100.0, key=f"{chiave}_min")
+            importo_max = st.number_input("💶 Totale a", value=None, min_value=0.0, step=100.0, key=f"{chiave}_max")
+        pagamenti = st.multiselect("💳 Pagamento", list(df["pagamento"].cat.categories), key=f"{chiave}_pagamento")
+
+    filtrate = analitica.filtra_archivio(df, dal, al, controparte, piva, pagamenti, importo_min, importo_max)
+
+    col_o1, col_o2, col_o3, col_o4 = st.columns(4)
+    ordina_per = col_o1.selectbox("↕️ Ordina per", analitica.COLONNE_ARCHIVIO, key=f"{chiave}_ordina")
+    crescente = col_o2.radio("Verso", ["Decrescente", "Crescente"], horizontal=True, key=f"{chiave}_verso") == "Crescente"
+    righe = col_o3.selectbox("Righe per pagina", [25, 50, 100, 200], index=1, key=f"{chiave}_righe")
+    pagine = max(1, -(-len(filtrate) // righe))
+    pagina = col_o4.number_input(f"Pagina (di {pagine})", min_value=1, value=1, key=f"{chiave}_pagina")
+
+    visibili, pagine = analitica.pagina_archivio(filtrate, ordina_per, crescente, pagina, righe)
+    st.caption(f"{len(filtrate)} fatture su {len(df)} - totale € {analitica.somma_importi(filtrate):,.2f}")
+    st.dataframe(visibili, use_container_width=True, hide_index=True)
+    # id delle righe visibili: i numeri possono ripetersi o essere salvati come interi
+    mostra_pdf(tipo, chiave, anno, dict(zip(filtrate["id"].loc[visibili.index], visibili["numero"])))
+
+def mostra_pdf(tipo, chiave, anno, numeri):
+    """PDF di una fattura della pagina ({id: numero}): generato nel pool di stampa, lo script non lo aspetta mai"""
+    id_fattura = st.selectbox("🖨️ **PDF della fattura**", list(numeri), index=None, placeholder="Scegli il numero...",
+                              format_func=numeri.get, key=f"{chiave}_pdf")
+    if id_fattura is None:
+        return
+    fattura = next((f for f in carica_anno(anno)[tipo] if f.get("id") == id_fattura), None)
+    if fattura is None:
+        return
+    numero = numeri[id_fattura]
+    futuro = stampa.richiedi_pdf(fattura, tipo)
+    if futuro is None:
+        st.warning("⏳ Troppi PDF in coda, riprova tra poco")
+    elif not futuro.done():
+        col1, col2 = st.columns([3, 1])
+        col1.info(f"⏳ PDF della fattura {numero} in preparazione...")
+        col2.button("🔄 Aggiorna", key=f"{chiave}_pdf_aggiorna", use_container_width=True)
+    elif futuro.exception() is not None:
+        st.error(f"❌ PDF non generato: {futuro.exception()}")
+    else:
+        with open(futuro.result(), "rb") as f:
+            st.download_button(
+                label=f"🖨️ **Scarica PDF {numero}**",
+                data=f,
+                file_name=stampa.nome_file_pdf(fattura, tipo),
+                mime="application/pdf",
+                use_container_width=True,
+                key=f"{chiave}_pdf_scarica"
+            )
+
+def mostra_profilo(rerun):
+    """Pannello di debug nella sidebar con le fasi del rerun appena concluso"""
+    with st.sidebar.expander(f"🐞 **Profilo rerun: {rerun.totale_ms:.0f} ms**"):
+        fasi = sorted(rerun.fasi, key=lambda f: f["inizio_ms"])
+        st.dataframe(pd.DataFrame([{
+            "fase": "· " * f["livello"] + f["fase"],
+            "ms": f["ms"],
+            "KB allocati": f["allocati_kb"],
+            "picco KB": f["picco_kb"],
+        } for f in fasi]), use_container_width=True, hide_index=True)
+        if rerun.statistiche:
+            st.caption(f"cProfile salvato in {rerun.file_profilo}")
+            st.code(rerun.statistiche, language=None)
+        if st.button("🔬 **Profila il prossimo rerun (cProfile)**", key="profilo_cprofile", use_container_width=True):
+            st.session_state.profilo_cattura = True
 
 # =============================================================================
 # SIDEBAR
 # =============================================================================
+profilo.sezione("sidebar")
 st.sidebar.title("📊 **DASHBOARD**")
 
 st.sidebar.info(f"**Anno selezionato: {st.session_state.anno_selezionato}**")
@@ -247,12 +220,29 @@ if st.sidebar.button("📈 **ANALISI RICAVI/COSTI**", use_container_width=True,
     st.rerun()
 st.sidebar.markdown("---")
 
+# RICERCA (indice invertito su fatture e anagrafiche, vedi ricerca.py)
+testo_ricerca = st.sidebar.text_input("🔎 **Cerca**", key="testo_ricerca",
+                                      placeholder="Controparte, numero, P.IVA, note...")
+if testo_ricerca.strip():
+    fatture_trovate, n_fatture_trovate = ricerca.cerca_fatture(testo_ricerca, 10)
+    anagrafiche_trovate, n_anagrafiche_trovate = ricerca.cerca_anagrafiche(testo_ricerca, 5)
+    st.sidebar.caption(f"{n_fatture_trovate} fatture, {n_anagrafiche_trovate} anagrafiche")
+    for tipo_trovata, trovata in fatture_trovate:
+        st.sidebar.markdown(f"{'📤' if tipo_trovata == 'Attiva' else '📥'} **{trovata.get('numero', '')}** "
+                            f"{trovata.get('cliente_fornitore', '')}  \n{trovata.get('data', '')} · "
+                            f"€ {float(trovata.get('totale') or 0):,.2f}")
+    for categoria_trovata, trovata in anagrafiche_trovate:
+        st.sidebar.markdown(f"{'🏢' if categoria_trovata == 'clienti' else '🏭'} "
+                            f"**{trovata.get('ragione_sociale', '')}** - {trovata.get('piva', '')}")
+    st.sidebar.markdown("---")
+
 # =============================================================================
 # PAGINE PRINCIPALI (SENZA SPAZI VUOTI)
 # =============================================================================
+profilo.sezione(f"pagina {st.session_state.pagina}")
 if st.session_state.pagina == "home":
     # Sostituisci TUTTI i banner con:
-    st.image("banner1.png", use_column_width=True, clamp=True, caption="Realizzato dal Mago con Perplexity AI")
+    mostra_banner(use_column_width=True, clamp=True, caption="Realizzato dal Mago con Perplexity AI")
 
     #st.image("banner1.png", use_column_width=False, caption="Realizzato dal Mago con Perplexity AI")
     #st.title("💼 **Fatturazione Aziendale** 💼")
@@ -267,7 +257,7 @@ if st.session_state.pagina == "home":
             st.session_state.pagina = "form"
             st.session_state.tipo = "Attiva"
             st.session_state.form_dati_salvati = False
-            st.session_state.form_dati_temp = {}
+            st.session_state.bozza = Bozza(st.session_state.tipo)
             st.rerun()
     
     with col2:
@@ -277,12 +267,16 @@ if st.session_state.pagina == "home":
             st.session_state.pagina = "form"
             st.session_state.tipo = "Passiva"
             st.session_state.form_dati_salvati = False
-            st.session_state.form_dati_temp = {}
+            st.session_state.bozza = Bozza(st.session_state.tipo)
             st.rerun()
 
 elif st.session_state.pagina == "form":
     tipo = st.session_state.tipo
-    st.image("banner1.png", use_column_width=False)
+    # Bozza del form: totali, scadenza, validazione e XML ricalcolati solo se cambiano gli input
+    if st.session_state.get("bozza") is None or st.session_state.bozza.tipo != tipo:
+        st.session_state.bozza = Bozza(tipo)
+    bozza = st.session_state.bozza
+    mostra_banner(use_column_width=False)
     st.header(f"📄 **Nuova Fattura {tipo}**")
     
     # Form principale
@@ -292,65 +286,74 @@ elif st.session_state.pagina == "form":
         data = st.date_input("**📅 Data**", 
                             value=datetime.now(),
                             format="DD/MM/YYYY")
-        anno_selezionato = st.session_state.anno_selezionato
-        numero = st.text_input("**🔢 Numero Fattura**", 
-                              value=f"{anno_selezionato}/{len(st.session_state.dati_fatture[tipo])+1}")
-        nome = st.text_input("**👤 Cliente/Fornitore**", value="" if tipo == "Attiva" else "")
-        piva = st.text_input("**🆔 P.IVA / CF**", value="")
+        # Progressivo dell'anno della fattura: quello definitivo è assegnato al salvataggio
+        numero_proposto = numerazione.prossimo_numero(tipo, data.year)
+        numero = st.text_input("**🔢 Numero Fattura**", value=numero_proposto)
+        nome = st.text_input("**👤 Cliente/Fornitore**", key="form_nome")
+        # Autocompletamento dalle anagrafiche: la scelta compila nome e P.IVA
+        suggerimenti = anagrafiche.cerca(anagrafiche.categoria_tipo(tipo), nome)
+        if suggerimenti and not (len(suggerimenti) == 1 and suggerimenti[0]["ragione_sociale"] == nome.strip()):
+            def usa_anagrafica():
+                scelta = st.session_state.form_suggerimento
+                if scelta is not None:
+                    st.session_state.form_nome = scelta["ragione_sociale"]
+                    st.session_state.form_piva = scelta["piva"]
+                    st.session_state.form_suggerimento = None
+            st.selectbox("🔎 **Anagrafiche trovate**", suggerimenti, index=None, key="form_suggerimento",
+                         format_func=lambda a: f"{a['ragione_sociale']} - {a['piva']}",
+                         placeholder="Seleziona per compilare nome e P.IVA", on_change=usa_anagrafica)
+        piva = st.text_input("**🆔 P.IVA / CF**", key="form_piva")
     
     with col2:
         imponibile = st.number_input("**💰 Imponibile (€)**", min_value=0.0, step=0.01, format="%.2f")
         iva_perc = st.number_input("**📊 Aliquota IVA (%)**", min_value=0.0, value=22.0, step=0.1)
-        pagamento = st.selectbox("**💳 Modalità Pagamento**", 
-                               ["Bonifico 30gg", "Bonifico 60gg", "Anticipo", "Contanti", "Ri.Ba.", "Bonifico immediato"])
-        # ← CAMPO SCADENZA AGGIUNTO
+        pagamento = st.selectbox("**💳 Modalità Pagamento**", PAGAMENTI)
+        # Proposta dai termini di pagamento: cambia (e si riallinea) solo se cambiano data o pagamento
         scadenza = st.date_input("**⏰ Data Scadenza**", 
-                               value=datetime.now() + pd.Timedelta(days=30),  # 30gg da oggi
-                               min_value=datetime.now(), 
+                               value=bozza.scadenza_proposta(data, pagamento),
+                               min_value=data, 
                                format="DD/MM/YYYY")
     
     # Totali
-    iva, totale = calcola_totali(imponibile, iva_perc)
+    iva, totale = bozza.totali(imponibile, iva_perc)
     col_tot1, col_tot2 = st.columns(2)
     col_tot1.metric("**IVA**", f"€ {iva:.2f}")
     col_tot2.metric("**TOTALE**", f"€ {totale:.2f}")
     
     note = st.text_area("**📝 Note**", height=100)
     
-    # Salva dati temporanei
-    st.session_state.form_dati_temp = {
-        "data": data.strftime("%d/%m/%Y"),
-        "numero": numero.strip(),
-        "cliente_fornitore": nome.strip(),
-        "piva": piva.strip(),
-        "imponibile": float(imponibile),
-        "iva_perc": float(iva_perc),
-        "iva": float(iva),
-        "totale": float(totale),
-        "pagamento": pagamento,
-        "note": note.strip(),
-        "scadenza": scadenza.strftime("%d/%m/%Y"),  # ← AGGIUNTO
-    }
+    # Solo i campi cambiati dal rerun precedente vengono rivalidati
+    bozza.aggiorna(data=data, numero=numero, cliente_fornitore=nome, piva=piva, imponibile=imponibile,
+                   iva_perc=iva_perc, pagamento=pagamento, scadenza=scadenza, note=note)
+    for errore in bozza.errori_visibili():
+        st.caption(errore)
 
     # Pulsanti azione con validazione
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         if st.button("💾 **SALVA**", type="primary", use_container_width=True):
-            errori = valida_fattura(st.session_state.form_dati_temp)
+            errori = bozza.errori_lista()
             if errori:
                 for errore in errori:
                     st.error(errore)
             else:
-                fattura = st.session_state.form_dati_temp.copy()
+                fattura = bozza.dati().copy()
                 fattura["timestamp"] = datetime.now().isoformat()
-                st.session_state.dati_fatture[tipo].append(fattura)
-                salva_dati(st.session_state.dati_fatture)
-                st.session_state.form_dati_salvati = True
-                st.session_state.pagina = "storico"
-                st.success("✅ **Fattura salvata con successo!**")
-                st.balloons()
-                st.rerun()
+                automatico = fattura["numero"] == numero_proposto
+                avvisi = []
+                errori = numerazione.salva_fattura(tipo, fattura, automatico, avvisi)
+                if errori:
+                    for errore in errori:
+                        st.error(errore)
+                else:
+                    st.session_state.form_dati_salvati = True
+                    st.session_state.pagina = "storico"
+                    # mostrati dallo storico: la fattura è salvata, il form non va riproposto
+                    st.session_state.avvisi_salvataggio = avvisi
+                    st.success(f"✅ **Fattura {fattura['numero']} salvata con successo!**")
+                    st.balloons()
+                    st.rerun()
     
     with col2:
         if st.button("⬅️ **Home**", use_container_width=True):
@@ -363,11 +366,11 @@ elif st.session_state.pagina == "form":
     
     with col3:
         if st.button("📄 **XML**", use_container_width=True):
-            xml_data = fattura_to_xml(st.session_state.form_dati_temp, tipo)
+            # XML riusato finché la bozza non cambia
             st.download_button(
                 label="💾 **Scarica XML**",
-                data=xml_data.encode('utf-8'),
-                file_name=f"{st.session_state.form_dati_temp['numero']}_{tipo}.xml",
+                data=bozza.xml(),
+                file_name=f"{bozza.dati()['numero']}_{tipo}.xml",
                 mime="application/xml",
                 use_container_width=True
             )
@@ -377,32 +380,103 @@ elif st.session_state.pagina == "form":
     st.metric("📝 **Stato form**", stato)
     
 elif st.session_state.pagina == "storico":
-    st.image("banner1.png", use_column_width=True, clamp=True, caption="Realizzato dal Mago con Perplexity AI")
-    st.header("📋 **Archivio Fatture**")
+    mostra_banner(use_column_width=True, clamp=True, caption="Realizzato dal Mago con Perplexity AI")
+    st.header(f"📋 **Archivio Fatture {st.session_state.anno_selezionato}**")
+    for avviso in st.session_state.pop("avvisi_salvataggio", []):
+        st.warning(avviso)
     
     # Statistiche
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("📤 Fatture Attive", len(st.session_state.dati_fatture["Attiva"]))
-    col2.metric("💶 Totale Attivo", f"€ {sum(f.get('totale', 0) for f in st.session_state.dati_fatture['Attiva']):.2f}")
-    col3.metric("📥 Fatture Passive", len(st.session_state.dati_fatture["Passiva"]))
-    col4.metric("💸 Totale Passivo", f"€ {sum(f.get('totale', 0) for f in st.session_state.dati_fatture['Passiva']):.2f}")
+    anno_archivio = st.session_state.anno_selezionato
+    n_attive, totale_attive = riepilogo_tipo("Attiva", anno_archivio)
+    n_passive, totale_passive = riepilogo_tipo("Passiva", anno_archivio)
+    col1.metric("📤 Fatture Attive", n_attive)
+    col2.metric("💶 Totale Attivo", f"€ {totale_attive:.2f}")
+    col3.metric("📥 Fatture Passive", n_passive)
+    col4.metric("💸 Totale Passivo", f"€ {totale_passive:.2f}")
+    
+    # Export XML a lotti (un file per fattura, in un unico ZIP)
+    with st.expander(f"🗜️ **Esporta XML {st.session_state.anno_selezionato} (ZIP)**"):
+        mesi_xml = ["Tutto l'anno", "Gennaio", "Febbraio", "Marzo", "Aprile", "Maggio", "Giugno", "Luglio",
+                    "Agosto", "Settembre", "Ottobre", "Novembre", "Dicembre"]
+        mese_xml = st.selectbox("📅 **Periodo**", mesi_xml, key="mese_xml")
+        if st.button("🗜️ **Genera ZIP**", key="genera_zip_xml", use_container_width=True):
+            # lo ZIP precedente lo elimina esporta quando non serve più (può servire ad altre sessioni)
+            with st.spinner("Generazione XML in corso..."):
+                st.session_state.zip_xml = esporta.xml_zip_periodo(
+                    st.session_state.anno_selezionato, mesi_xml.index(mese_xml) or None)
+        if st.session_state.get("zip_xml") and os.path.exists(st.session_state.zip_xml):
+            with open(st.session_state.zip_xml, "rb") as f:
+                st.download_button(
+                    label="💾 **Scarica ZIP XML**",
+                    data=f,
+                    file_name=os.path.basename(st.session_state.zip_xml),
+                    mime="application/zip",
+                    use_container_width=True
+                )
+
+    # PDF di un mese in un unico ZIP, costruito in background (vedi stampa)
+    with st.expander(f"🖨️ **Esporta PDF {st.session_state.anno_selezionato} (ZIP)**"):
+        mese_pdf = st.selectbox("📅 **Mese**", mesi_xml[1:], key="mese_pdf")
+        if st.button("🖨️ **Genera ZIP PDF**", key="genera_zip_pdf", use_container_width=True):
+            st.session_state.zip_pdf = (st.session_state.anno_selezionato, mesi_xml.index(mese_pdf))
+        if st.session_state.get("zip_pdf"):
+            futuro = stampa.zip_pdf_periodo(*st.session_state.zip_pdf)
+            if not futuro.done():
+                col1, col2 = st.columns([3, 1])
+                col1.info("⏳ PDF in preparazione...")
+                col2.button("🔄 Aggiorna", key="aggiorna_zip_pdf", use_container_width=True)
+            elif futuro.exception() is not None:
+                st.error(f"❌ ZIP non generato: {futuro.exception()}")
+            else:
+                with open(futuro.result(), "rb") as f:
+                    st.download_button(
+                        label="💾 **Scarica ZIP PDF**",
+                        data=f,
+                        file_name=f"Fatture_PDF_{st.session_state.zip_pdf[0]}_{st.session_state.zip_pdf[1]:02d}.zip",
+                        mime="application/zip",
+                        use_container_width=True
+                    )
+
+    # Import massivo (CSV dello storico o XML)
+    with st.expander("📥 **Importa fatture (CSV / XML)**"):
+        tipo_import = st.selectbox("**Tipo fatture CSV**", ["Attiva", "Passiva"], key="tipo_import")
+        file_import = st.file_uploader("**File**", type=["csv", "xml"], accept_multiple_files=True, key="file_import")
+        if file_import and st.button("📥 **IMPORTA**", key="importa", type="primary", use_container_width=True):
+            righe = []
+            for file in file_import:
+                righe += importa.righe_da_file(file.name, file.getvalue(), tipo_import)
+            try:
+                with st.spinner(f"Validazione di {len(righe)} fatture..."):
+                    importate, errori = importa.importa(righe)
+            except OSError as e:
+                st.error(f"❌ **Import non riuscito**: {e}")
+                importate, errori = None, {}
+            if importate is not None:
+                st.success(f"✅ **{importate} fatture importate**")
+            if errori:
+                st.error(f"❌ **{len(errori)} righe scartate**")
+                st.dataframe(pd.DataFrame([{"riga": r, "errori": " ".join(e)} for r, e in errori.items()]),
+                             use_container_width=True, hide_index=True)
     
     # Tabs
     tab1, tab2 = st.tabs(["📤 **Fatturazione Attiva**", "📥 **Fatturazione Passiva**"])
     
     with tab1:
-        if st.session_state.dati_fatture["Attiva"]:
-            df_attive = pd.DataFrame(st.session_state.dati_fatture["Attiva"])
-            df_attive['data'] = df_attive['data'].apply(formatta_data_df)
-            
-            csv_data = df_attive.to_csv(index=False, sep=';', encoding='utf-8').encode('utf-8')
-            st.download_button(
-                label="📄 **Salva fatture Attive**",
-                data=csv_data,
-                file_name=f"Fatture_Attive_{datetime.now().strftime('%d%m%Y_%H%M')}.csv",
-                mime='text/csv',
-                use_container_width=True
-            )
+        if n_attive:
+            # CSV generato solo su richiesta (e riusato finché l'archivio non cambia)
+            if st.button("📄 **Esporta fatture Attive (CSV)**", key="esporta_attive", use_container_width=True):
+                st.session_state.export_attive = True
+            if st.session_state.get("export_attive", False):
+                with open(esporta.csv_archivio("Attiva", anno_archivio), "rb") as f:
+                    st.download_button(
+                        label="📄 **Salva fatture Attive**",
+                        data=f,
+                        file_name=f"Fatture_Attive_{anno_archivio}_{datetime.now().strftime('%d%m%Y_%H%M')}.csv",
+                        mime='text/csv',
+                        use_container_width=True,
+                        on_click=lambda: st.session_state.update(export_attive=False)
+                    )
 
             if st.button(
                 label="Cancella Storico Attive e Passive", 
@@ -418,9 +492,7 @@ elif st.session_state.pagina == "storico":
                     st.error("⚠️ CONFERMI cancellazione TUTTE le fatture attive e passive?")
                 with col2:
                     if st.button("SI, CANCELLA TUTTO", key="si_attive", type="primary"):
-                        st.session_state.dati_fatture["Attiva"] = []
-                        if os.path.exists("fatture.json"):
-                            os.remove("fatture.json")
+                        cancella_archivio()
                         st.session_state.confirm_delete_attive = False
                         st.success("✅ Storico attive cancellato!")
                         st.rerun()
@@ -428,24 +500,25 @@ elif st.session_state.pagina == "storico":
                         st.session_state.confirm_delete_attive = False
                         st.rerun()
 
-            st.dataframe(df_attive, use_container_width=True, hide_index=True)
+            mostra_archivio("Attiva", "archivio_attive", anno_archivio)
         else:
-            st.info("👆 **Nessuna fattura attiva**. Crea la prima dalla Home!")
+            st.info(f"👆 **Nessuna fattura attiva nel {anno_archivio}**. Crea la prima dalla Home!")
     
     with tab2:
-        if st.session_state.dati_fatture["Passiva"]:
-            df_passive = pd.DataFrame(st.session_state.dati_fatture["Passiva"])
-            df_passive['data'] = df_passive['data'].apply(formatta_data_df)
-
-            # Bottone esportazione
-            csv_data = df_passive.to_csv(index=False, sep=';', encoding='utf-8').encode('utf-8')
-            st.download_button(
-                label="📄 **Salva fatture Passive**",
-                data=csv_data,
-                file_name=f"Fatture_Passive_{datetime.now().strftime('%d%m%Y_%H%M')}.csv",
-                mime='text/csv',
-                use_container_width=True
-            )
+        if n_passive:
+            # Bottone esportazione (CSV generato solo su richiesta)
+            if st.button("📄 **Esporta fatture Passive (CSV)**", key="esporta_passive", use_container_width=True):
+                st.session_state.export_passive = True
+            if st.session_state.get("export_passive", False):
+                with open(esporta.csv_archivio("Passiva", anno_archivio), "rb") as f:
+                    st.download_button(
+                        label="📄 **Salva fatture Passive**",
+                        data=f,
+                        file_name=f"Fatture_Passive_{anno_archivio}_{datetime.now().strftime('%d%m%Y_%H%M')}.csv",
+                        mime='text/csv',
+                        use_container_width=True,
+                        on_click=lambda: st.session_state.update(export_passive=False)
+                    )
 
             if st.button(
                 label="Cancella Storico Attive e Passive", 
@@ -461,9 +534,7 @@ elif st.session_state.pagina == "storico":
                     st.error("⚠️ CONFERMI cancellazione TUTTE le fatture attive e passive?")
                 with col2:
                     if st.button("SI, CANCELLA TUTTO", key="si_passive", type="primary"):
-                        st.session_state.dati_fatture["Passiva"] = []
-                        if os.path.exists("fatture.json"):
-                            os.remove("fatture.json")
+                        cancella_archivio()
                         st.session_state.confirm_delete_passive = False
                         st.success("✅ Storico passive cancellato!")
                         st.rerun()
@@ -471,16 +542,16 @@ elif st.session_state.pagina == "storico":
                         st.session_state.confirm_delete_passive = False
                         st.rerun()
 
-            st.dataframe(df_passive, use_container_width=True, hide_index=True)
+            mostra_archivio("Passiva", "archivio_passive", anno_archivio)
         else:
-            st.info("👆 **Nessuna fattura passiva**. Crea la prima dalla Home!")
+            st.info(f"👆 **Nessuna fattura passiva nel {anno_archivio}**. Crea la prima dalla Home!")
     
     if st.button("🏠 **Torna alla Home**", type="secondary", use_container_width=True):
         st.session_state.pagina = "home"
         st.rerun()
 
 elif st.session_state.pagina == "analisi":
-    st.image("banner1.png", use_column_width=True, clamp=True, caption="Realizzato dal Mago con Perplexity AI")
+    mostra_banner(use_column_width=True, clamp=True, caption="Realizzato dal Mago con Perplexity AI")
     st.header("📈 **Analisi Ricavi, Costi e Scadenze**")
     
     # SELETTORE MESI
@@ -500,47 +571,51 @@ elif st.session_state.pagina == "analisi":
     
     numero_mese = list(mesi_italiani.values()).index(mese_selezionato) + 1
     
-    # FILTRA PER MESE
-    def filtra_fatture_mese(fatture, mese, anno):
-        filtrate = []
-        for f in fatture:
-            try:
-                data_fattura = datetime.strptime(f['data'], "%d/%m/%Y")
-                if data_fattura.month == mese and data_fattura.year == anno:
-                    filtrate.append(f)
-            except:
-                continue
-        return filtrate
-    
-    attive_mese = filtra_fatture_mese(st.session_state.dati_fatture["Attiva"], numero_mese, anno_selezionato)
-    passive_mese = filtra_fatture_mese(st.session_state.dati_fatture["Passiva"], numero_mese, anno_selezionato)
+    # FILTRA PER MESE (DataFrame tipizzati, filtro vettoriale)
+    attive_anno = analitica.frame_fatture("Attiva", anno_selezionato)
+    passive_anno = analitica.frame_fatture("Passiva", anno_selezionato)
+    attive_mese = analitica.filtra_mese(attive_anno, numero_mese, anno_selezionato)
+    passive_mese = analitica.filtra_mese(passive_anno, numero_mese, anno_selezionato)
     
-    # STATISTICHE
+    # STATISTICHE (aggregati precalcolati, aggiornati ad ogni salvataggio)
+    oggi = datetime.now().date()
+    riepilogo_attive = riepilogo_mese(anno_selezionato, numero_mese, "Attiva", oggi)
+    riepilogo_passive = riepilogo_mese(anno_selezionato, numero_mese, "Passiva", oggi)
     col1, col2, col3, col4 = st.columns(4)
-    totali_attive_mese = sum(f.get('totale', 0) for f in attive_mese)
-    totali_passive_mese = sum(f.get('totale', 0) for f in passive_mese)
+    totali_attive_mese = riepilogo_attive["totale"]
+    totali_passive_mese = riepilogo_passive["totale"]
     
-    col1.metric("💰 **RICAVI**", f"€ {totali_attive_mese:,.2f}", delta=f"{len(attive_mese)} fatt.")
-    col2.metric("💸 **COSTI**", f"€ {totali_passive_mese:,.2f}", delta=f"{len(passive_mese)} fatt.")
+    col1.metric("💰 **RICAVI**", f"€ {totali_attive_mese:,.2f}", delta=f"{riepilogo_attive['numero']} fatt.")
+    col2.metric("💸 **COSTI**", f"€ {totali_passive_mese:,.2f}", delta=f"{riepilogo_passive['numero']} fatt.")
     col3.metric("📊 **SALDO**", f"€ {totali_attive_mese - totali_passive_mese:,.2f}")
     col4.metric("📅 **Mese**", f"{mese_selezionato} {anno_selezionato}")
     
+    # ANDAMENTO ANNO
+    with st.expander(f"📊 **Andamento {anno_selezionato}**"):
+        ricavi_anno = andamento_anno(anno_selezionato, "Attiva", oggi)
+        costi_anno = andamento_anno(anno_selezionato, "Passiva", oggi)
+        df_andamento = pd.DataFrame(
+            {"Ricavi": [m["totale"] for m in ricavi_anno], "Costi": [m["totale"] for m in costi_anno]},
+            index=[f"{n:02d} {nome[:3]}" for n, nome in mesi_italiani.items()]
+        )
+        st.bar_chart(df_andamento)
+    
     st.markdown("---")
 
     # TABELLE DETTAGLIO (sotto)
     col_tab1, col_tab2 = st.columns(2)
     with col_tab1:
         st.markdown("### 💰 **Ricavi Dettaglio**")
-        if attive_mese:
-            df = pd.DataFrame(attive_mese)[['numero', 'cliente_fornitore', 'totale']].head(8)
+        if not attive_mese.empty:
+            df = attive_mese[['numero', 'cliente_fornitore', 'totale']].head(8)
             st.dataframe(df, use_container_width=True, hide_index=True)
         else:
             st.info("Nessun dato")
     
     with col_tab2:
         st.markdown("### 💸 **Costi Dettaglio**")
-        if passive_mese:
-            df = pd.DataFrame(passive_mese)[['numero', 'cliente_fornitore', 'totale']].head(8)
+        if not passive_mese.empty:
+            df = passive_mese[['numero', 'cliente_fornitore', 'totale']].head(8)
             st.dataframe(df, use_container_width=True, hide_index=True)
         else:
             st.info("Nessun dato")
@@ -548,46 +623,25 @@ elif st.session_state.pagina == "analisi":
     st.markdown("---")
     
     # SCADENZE MESE CORRENTE
-    oggi = datetime.now().date()
-    attive_scadute = []
-    passive_scadute = []
-    attive_ok = []
-    passive_ok = []
-    
-    for f in attive_mese:
-        if 'scadenza' in f:
-            scadenza = datetime.strptime(f['scadenza'], "%d/%m/%Y").date()
-            if scadenza < oggi:
-                attive_scadute.append(f)
-            else:
-                attive_ok.append(f)
-    
-    for f in passive_mese:
-        if 'scadenza' in f:
-            scadenza = datetime.strptime(f['scadenza'], "%d/%m/%Y").date()
-            if scadenza < oggi:
-                passive_scadute.append(f)
-            else:
-                passive_ok.append(f)
+    attive_scadute, attive_ok = analitica.dividi_scadenze(attive_mese, oggi)
+    passive_scadute, passive_ok = analitica.dividi_scadenze(passive_mese, oggi)
     
     # VISUALIZZAZIONE SCADENZE
     col_scad1, col_scad2 = st.columns(2)
     
     with col_scad1:
         st.markdown("### 🚨 **SCADUTE**")
-        if attive_scadute:
+        if not attive_scadute.empty:
             st.error(f"**{len(attive_scadute)} attive**")
-            for f in attive_scadute:
-                giorni = (oggi - datetime.strptime(f['scadenza'], "%d/%m/%Y").date()).days
-                st.warning(f"• {f['numero']} - €{f['totale']:.2f}")
+            for f in attive_scadute.itertuples():
+                st.warning(f"• {f.numero} - €{f.totale:.2f} ({f.giorni_scaduto} gg)")
         else:
             st.success("✅ Nessuna attiva scaduta")
             
-        if passive_scadute:
+        if not passive_scadute.empty:
             st.error(f"**{len(passive_scadute)} passive**")
-            for f in passive_scadute:
-                giorni = (oggi - datetime.strptime(f['scadenza'], "%d/%m/%Y").date()).days
-                st.warning(f"• {f['numero']} - €{f['totale']:.2f}")
+            for f in passive_scadute.itertuples():
+                st.warning(f"• {f.numero} - €{f.totale:.2f} ({f.giorni_scaduto} gg)")
         else:
             st.success("✅ Nessuna passiva scaduta")
     
@@ -596,12 +650,49 @@ elif st.session_state.pagina == "analisi":
         st.info(f"**{len(attive_ok)} attive OK**")
         st.info(f"**{len(passive_ok)} passive OK**")
 
+    # SCADENZE DI TUTTO L'ARCHIVIO (indice per data di scadenza, riepilogo ricalcolato ogni giorno)
+    st.markdown("---")
+    st.markdown("### 🗓️ **Scadenze di tutto l'archivio**")
+    riepilogo_scadenze = scadenze.riepilogo(oggi)
+    col_s1, col_s2, col_s3, col_s4 = st.columns(4)
+    col_s1.metric("🚨 Attive scadute", riepilogo_scadenze["Attiva"]["scadute"],
+                  delta=f"€ {riepilogo_scadenze['Attiva']['totale_scadute']:,.2f}", delta_color="inverse")
+    col_s2.metric("🚨 Passive scadute", riepilogo_scadenze["Passiva"]["scadute"],
+                  delta=f"€ {riepilogo_scadenze['Passiva']['totale_scadute']:,.2f}", delta_color="inverse")
+    col_s3.metric(f"⏰ Attive entro {scadenze.GIORNI_AVVISO} gg", riepilogo_scadenze["Attiva"]["in_scadenza"],
+                  delta=f"€ {riepilogo_scadenze['Attiva']['totale_in_scadenza']:,.2f}", delta_color="off")
+    col_s4.metric(f"⏰ Passive entro {scadenze.GIORNI_AVVISO} gg", riepilogo_scadenze["Passiva"]["in_scadenza"],
+                  delta=f"€ {riepilogo_scadenze['Passiva']['totale_in_scadenza']:,.2f}", delta_color="off")
+    with st.expander("📋 **Elenco scadute (dalla più vecchia)**"):
+        for tipo_scadute in ("Attiva", "Passiva"):
+            elenco = scadenze.scadute(tipo_scadute, oggi)
+            if elenco:
+                st.markdown(f"**{tipo_scadute}**")
+                st.dataframe(pd.DataFrame([{
+                    "numero": f.get("numero"),
+                    "cliente_fornitore": f.get("cliente_fornitore"),
+                    "scadenza": f.get("scadenza"),
+                    "totale": f.get("totale"),
+                } for f in elenco[:200]]), use_container_width=True, hide_index=True)
+                if len(elenco) > 200:
+                    st.caption(f"Prime 200 di {len(elenco)}")
+    
+    # ANZIANITÀ SCADUTO (fatture dell'anno selezionato)
+    st.markdown(f"### ⏳ **Anzianità scaduto {anno_selezionato} (giorni)**")
+    col_fasce1, col_fasce2 = st.columns(2)
+    with col_fasce1:
+        st.markdown("**Attive**")
+        st.dataframe(analitica.fasce_anzianita(attive_anno, oggi), use_container_width=True)
+    with col_fasce2:
+        st.markdown("**Passive**")
+        st.dataframe(analitica.fasce_anzianita(passive_anno, oggi), use_container_width=True)
+
     if st.button("⬅️ **Home**", type="secondary", use_container_width=True):
         st.session_state.pagina = "home"
         st.rerun()
 
 elif st.session_state.pagina == "anagrafiche":
-    st.image("banner1.png", use_column_width=True, clamp=True, caption="Realizzato dal Mago con Perplexity AI")
+    mostra_banner(use_column_width=True, clamp=True, caption="Realizzato dal Mago con Perplexity AI")
     st.header("👥 **Gestione Anagrafiche**")
     
     # Tabs per nuovi inserimenti
@@ -626,7 +717,9 @@ elif st.session_state.pagina == "anagrafiche":
                     st.rerun()
             
             if submitted and rag_sociale and piva:
-                if valida_piva(piva):
+                if anagrafiche.esiste("clienti", piva):
+                    st.error("❌ **P.IVA già presente** in anagrafica")
+                elif valida_piva(piva):
                     nuovo_cliente = {
                         "ragione_sociale": rag_sociale.strip(),
                         "piva": piva.strip(),
@@ -634,11 +727,12 @@ elif st.session_state.pagina == "anagrafiche":
                         "telefono": telefono.strip(),
                         "timestamp": datetime.now().isoformat()
                     }
-                    st.session_state.anagrafiche["clienti"].append(nuovo_cliente)
-                    salva_anagrafiche(st.session_state.anagrafiche)
-                    st.success("✅ **Cliente salvato con successo!**")
-                    st.balloons()
-                    st.rerun()
+                    if anagrafiche.aggiungi("clienti", nuovo_cliente):
+                        st.success("✅ **Cliente salvato con successo!**")
+                        st.balloons()
+                        st.rerun()
+                    else:
+                        st.error("❌ **Cliente non salvato**: P.IVA già presente o errore di scrittura")
                 else:
                     st.error("❌ **P.IVA non valida** (11 cifre numeriche)")
             elif submitted:
@@ -663,7 +757,9 @@ elif st.session_state.pagina == "anagrafiche":
                     st.rerun()
             
             if submitted_f and rag_sociale_f and piva_f:
-                if valida_piva(piva_f):
+                if anagrafiche.esiste("fornitori", piva_f):
+                    st.error("❌ **P.IVA già presente** in anagrafica")
+                elif valida_piva(piva_f):
                     nuovo_fornitore = {
                         "ragione_sociale": rag_sociale_f.strip(),
                         "piva": piva_f.strip(),
@@ -671,11 +767,12 @@ elif st.session_state.pagina == "anagrafiche":
                         "telefono": telefono_f.strip(),
                         "timestamp": datetime.now().isoformat()
                     }
-                    st.session_state.anagrafiche["fornitori"].append(nuovo_fornitore)
-                    salva_anagrafiche(st.session_state.anagrafiche)
-                    st.success("✅ **Fornitore salvato con successo!**")
-                    st.balloons()
-                    st.rerun()
+                    if anagrafiche.aggiungi("fornitori", nuovo_fornitore):
+                        st.success("✅ **Fornitore salvato con successo!**")
+                        st.balloons()
+                        st.rerun()
+                    else:
+                        st.error("❌ **Fornitore non salvato**: P.IVA già presente o errore di scrittura")
                 else:
                     st.error("❌ **P.IVA non valida** (11 cifre numeriche)")
             elif submitted_f:
@@ -685,12 +782,13 @@ elif st.session_state.pagina == "anagrafiche":
     st.markdown("---")
     st.subheader("📋 **Elenco Anagrafiche Salvate**")
     
+    salvate = carica_anagrafiche()
     col_list1, col_list2 = st.columns(2)
     
     with col_list1:
         st.markdown("### 🏢 **CLIENTI**")
-        if st.session_state.anagrafiche["clienti"]:
-            for i, cliente in enumerate(st.session_state.anagrafiche["clienti"][:10]):
+        if salvate["clienti"]:
+            for i, cliente in enumerate(salvate["clienti"][:10]):
                 with st.expander(f"**{cliente['ragione_sociale']}** - {cliente['piva']}", expanded=False):
                     st.write(f"📧 **{cliente.get('email', 'N/D')}**")
                     st.write(f"📞 **{cliente.get('telefono', 'N/D')}**")
@@ -700,8 +798,8 @@ elif st.session_state.pagina == "anagrafiche":
     
     with col_list2:
         st.markdown("### 🏭 **FORNITORI**")
-        if st.session_state.anagrafiche["fornitori"]:
-            for i, fornitore in enumerate(st.session_state.anagrafiche["fornitori"][:10]):
+        if salvate["fornitori"]:
+            for i, fornitore in enumerate(salvate["fornitori"][:10]):
                 with st.expander(f"**{fornitore['ragione_sociale']}** - {fornitore['piva']}", expanded=False):
                     st.write(f"📧 **{fornitore.get('email', 'N/D')}**")
                     st.write(f"📞 **{fornitore.get('telefono', 'N/D')}**")
@@ -712,3 +810,8 @@ elif st.session_state.pagina == "anagrafiche":
     if st.button("⬅️ **Torna alla Home**", type="secondary", use_container_width=True):
         st.session_state.pagina = "home"
         st.rerun()
+
+# ========== PANNELLO PROFILO ==========
+rerun_profilato = profilo.termina_rerun()
+if rerun_profilato is not None:
+    mostra_profilo(rerun_profilato)
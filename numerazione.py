@@ -0,0 +1,138 @@
+"""Numerazione progressiva delle fatture per tipo e anno (2026/1, 2026/2, ...).
+
+L'ultimo progressivo assegnato è salvato in numerazione.json; il numero viene
+assegnato al salvataggio, sotto il lock di quel file, insieme alla scrittura
+della fattura: due sessioni con il form aperto non ricevono lo stesso numero
+e una fattura non salvata non lascia buchi. I numeri già usati stanno in un
+indice derivato dall'archivio, quindi il controllo dei doppioni è O(1).
+"""
+import re
+import threading
+from collections import Counter
+
+import archivio
+
+FILE_NUMERAZIONE = "numerazione.json"
+
+_PROGRESSIVO = re.compile(r"^(\d{4})/(\d+)$")
+
+
+def chiave_numero(numero):
+    return str(numero or "").strip().upper()
+
+
+def progressivo(numero):
+    """Numero anno/progressivo -> (anno, progressivo), es. 2026/12 -> (2026, 12); altrimenti None"""
+    trovato = _PROGRESSIVO.match(chiave_numero(numero))
+    return (int(trovato.group(1)), int(trovato.group(2))) if trovato else None
+
+
+class IndiceNumeri:
+    """Numeri usati per tipo e progressivo più alto per (tipo, anno)"""
+
+    def __init__(self):
+        self._usati = Counter()
+        self._massimi = {}
+        self._lock = threading.Lock()
+
+    def ricostruisci(self, dati):
+        usati, massimi = Counter(), {}
+        for tipo in archivio.TIPI:
+            for fattura in dati.get(tipo, []):
+                self._conta(usati, massimi, tipo, fattura, 1)
+        with self._lock:
+            self._usati, self._massimi = usati, massimi
+
+    def aggiorna(self, tipo, vecchia, nuova):
+        with self._lock:
+            if vecchia is not None:
+                self._conta(self._usati, self._massimi, tipo, vecchia, -1)
+            if nuova is not None:
+                self._conta(self._usati, self._massimi, tipo, nuova, 1)
+
+    @staticmethod
+    def _conta(usati, massimi, tipo, fattura, segno):
+        chiave = (tipo, chiave_numero(fattura.get("numero")))
+        usati[chiave] += segno
+        if usati[chiave] <= 0:
+            del usati[chiave]
+        # il massimo non scende con le cancellazioni: i numeri non vengono riusati
+        anno_n = progressivo(fattura.get("numero"))
+        if segno > 0 and anno_n is not None:
+            massimi[(tipo, anno_n[0])] = max(massimi.get((tipo, anno_n[0]), 0), anno_n[1])
+
+    def usato(self, tipo, numero):
+        return (tipo, chiave_numero(numero)) in self._usati
+
+    def massimo(self, tipo, anno):
+        return self._massimi.get((tipo, anno), 0)
+
+
+_contatori = archivio.FileCache(FILE_NUMERAZIONE, dict)
+_indice = None
+_lock_indice = threading.Lock()
+
+
+def indice_numeri(anno):
+    """Indice condiviso dal processo, registrato sull'archivio alla prima chiamata,
+    con l'anno indicato in memoria"""
+    global _indice
+    with _lock_indice:
+        if _indice is None:
+            indice = IndiceNumeri()
+            archivio.registra_indice(indice)
+            _indice = indice
+    archivio.apri_anno(anno)
+    return _indice
+
+
+def _ultimo(contatori, indice, tipo, anno):
+    return max(contatori.get(tipo, {}).get(str(anno), 0), indice.massimo(tipo, anno))
+
+
+def prossimo_numero(tipo, anno):
+    """Numero proposto nel form; quello definitivo è assegnato da salva_fattura"""
+    return f"{anno}/{_ultimo(_contatori.leggi(), indice_numeri(anno), tipo, anno) + 1}"
+
+
+def numero_usato(tipo, numero, anno):
+    """Numero già usato tra le fatture del tipo (nell'archivio diviso per anno: dell'anno)"""
+    return indice_numeri(anno).usato(tipo, numero)
+
+
+def salva_fattura(tipo, fattura, automatico=True, avvisi=None):
+    """Salva la fattura; se automatico le assegna il prossimo numero dell'anno
+    della sua data, altrimenti controlla che il numero indicato non sia già usato.
+
+    Restituisce la lista degli errori (vuota se salvata, con fattura["numero"]
+    definitivo). Se la fattura è salvata ma numerazione.json non si aggiorna
+    non è un errore (il prossimo numero viene comunque dall'indice
+    dell'archivio): il problema finisce nella lista avvisi, se indicata.
+    """
+    errori = []
+    salvata = []
+    anno = archivio.anno_fattura(fattura)
+
+    def assegna(contatori):
+        indice = indice_numeri(anno)  # rilegge l'archivio: include le fatture delle altre sessioni
+        if automatico:
+            fattura["numero"] = f"{anno}/{_ultimo(contatori, indice, tipo, anno) + 1}"
+        elif indice.usato(tipo, fattura["numero"]):
+            errori.append(f"❌ Numero fattura {fattura['numero']} già usato")
+            return
+        if not archivio.aggiungi_fattura(tipo, fattura):
+            errori.append("❌ Salvataggio non riuscito")
+            return
+        salvata.append(True)
+        anno_n = progressivo(fattura["numero"])
+        if anno_n is not None:
+            contatori.setdefault(tipo, {})
+            contatori[tipo][str(anno_n[0])] = max(contatori[tipo].get(str(anno_n[0]), 0), anno_n[1])
+
+    if not _contatori.aggiorna(assegna) and not errori:
+        if not salvata:
+            errori.append("❌ Salvataggio non riuscito")
+        elif avvisi is not None:
+            # la fattura è già nell'archivio: un nuovo SALVA la duplicherebbe
+            avvisi.append("⚠️ Fattura salvata, ma il contatore della numerazione non è stato aggiornato")
+    return errori
@@ -0,0 +1,203 @@
+"""Tempi e allocazioni di ogni rerun dello script, attivi con INVOICEPRO_PROFILO=1.
+
+Lo script apre il rerun con inizia_rerun(), divide la pagina in sezioni
+(sezione("login"), sezione("pagina storico"), ...) e i moduli misurano le
+operazioni pesanti con `with fase("CSV"):` (costruzione dei DataFrame, CSV,
+XML): il tempo trascorso, i KB allocati e il picco di memoria finiscono nel
+pannello della sidebar e, una riga JSON per rerun, in profilo.log (ruotato a
+1 MB, 3 copie). Un singolo rerun può essere catturato anche con cProfile: il
+.prof va in profili/ (apribile con snakeviz o pstats).
+
+Disattivato, fase() non misura nulla e costa una lettura di thread-local.
+Le allocazioni sono quelle di tutto il processo (tracemalloc), quindi con più
+sessioni attive insieme includono anche le altre.
+"""
+import cProfile
+import io
+import json
+import logging
+import logging.handlers
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+from datetime import datetime
+
+ATTIVO = os.environ.get("INVOICEPRO_PROFILO", "") not in ("", "0")
+FILE_LOG = "profilo.log"
+DIMENSIONE_LOG = 1_000_000
+COPIE_LOG = 3
+CARTELLA_PROFILI = "profili"
+RIGHE_CPROFILE = 25
+
+_locale = threading.local()
+_in_corso = {}  # sessione -> rerun non terminato (st.rerun e st.stop interrompono lo script)
+_lock = threading.Lock()
+_log = None
+_nulla = nullcontext()
+
+
+class _Fase:
+    __slots__ = ("rerun", "nome", "livello", "inizio", "memoria", "picco_figli")
+
+    def __init__(self, rerun, nome):
+        self.rerun = rerun
+        self.nome = nome
+        self.livello = len(rerun.aperte)
+        self.picco_figli = 0
+
+    def __enter__(self):
+        if self.rerun.aperte:
+            genitore = self.rerun.aperte[-1]
+            genitore.picco_figli = max(genitore.picco_figli, tracemalloc.get_traced_memory()[1])
+        self.rerun.aperte.append(self)
+        self.memoria = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self.inizio = time.perf_counter()
+        return self
+
+    def __exit__(self, *errore):
+        secondi = time.perf_counter() - self.inizio
+        attuale, picco = tracemalloc.get_traced_memory()
+        picco = max(picco, self.picco_figli)
+        self.rerun.aperte.remove(self)
+        self.rerun.ultimo = time.perf_counter()
+        if self.rerun.aperte:
+            genitore = self.rerun.aperte[-1]
+            genitore.picco_figli = max(genitore.picco_figli, picco)
+        tracemalloc.reset_peak()
+        self.rerun.fasi.append({
+            "fase": self.nome,
+            "livello": self.livello,
+            "inizio_ms": round((self.inizio - self.rerun.inizio) * 1000, 2),
+            "ms": round(secondi * 1000, 2),
+            "allocati_kb": round((attuale - self.memoria) / 1024, 1),
+            "picco_kb": round((picco - self.memoria) / 1024, 1),
+            "errore": errore[0].__name__ if errore[0] else None,
+        })
+        return False
+
+
+class Rerun:
+    def __init__(self, sessione, cattura=False):
+        self.sessione = sessione
+        self.inizio = self.ultimo = time.perf_counter()
+        self.fine = None
+        self.data = datetime.now().isoformat(timespec="seconds")
+        self.fasi = []
+        self.aperte = []
+        self.sezione = None
+        self.completato = False
+        self.statistiche = None  # testo pstats del rerun catturato con cProfile
+        self.file_profilo = None
+        self.profiler = cProfile.Profile() if cattura else None
+
+    def fase(self, nome):
+        return _Fase(self, nome)
+
+    def chiudi_sezione(self):
+        if self.sezione is not None:
+            sezione, self.sezione = self.sezione, None
+            sezione.__exit__(None, None, None)
+
+    @property
+    def totale_ms(self):
+        return round(((self.fine or time.perf_counter()) - self.inizio) * 1000, 2)
+
+    def riepilogo(self):
+        return {"data": self.data, "sessione": self.sessione, "completato": self.completato,
+                "totale_ms": self.totale_ms, "fasi": self.fasi, "cprofile": self.file_profilo}
+
+
+def _scrivi_log(rerun):
+    global _log
+    with _lock:
+        if _log is None:
+            _log = logging.getLogger("invoicepro.profilo")
+            _log.propagate = False
+            _log.setLevel(logging.INFO)
+            _log.addHandler(logging.handlers.RotatingFileHandler(
+                FILE_LOG, maxBytes=DIMENSIONE_LOG, backupCount=COPIE_LOG, encoding='utf-8'))
+    try:
+        _log.info(json.dumps(rerun.riepilogo(), ensure_ascii=False))
+    except:
+        pass
+
+
+def _chiudi(rerun):
+    """Chiude sezioni e fasi rimaste aperte, ferma cProfile e scrive il rerun nel log"""
+    if rerun.completato:
+        rerun.chiudi_sezione()
+        while rerun.aperte:
+            rerun.aperte[-1].__exit__(None, None, None)
+        rerun.fine = time.perf_counter()
+    else:
+        # interrotto: le fasi aperte durerebbero fino al rerun successivo, si registra solo il concluso
+        rerun.fine = rerun.ultimo
+        rerun.sezione = None
+        rerun.aperte = []
+    if rerun.profiler is not None:
+        rerun.profiler.disable()
+        testo = io.StringIO()
+        pstats.Stats(rerun.profiler, stream=testo).sort_stats("cumulative").print_stats(RIGHE_CPROFILE)
+        rerun.statistiche = testo.getvalue()
+        try:
+            os.makedirs(CARTELLA_PROFILI, exist_ok=True)
+            rerun.file_profilo = os.path.join(CARTELLA_PROFILI, f"rerun_{datetime.now():%Y%m%d_%H%M%S}.prof")
+            rerun.profiler.dump_stats(rerun.file_profilo)
+        except OSError:
+            rerun.file_profilo = None
+        rerun.profiler = None
+    _scrivi_log(rerun)
+
+
+def inizia_rerun(sessione, cattura=False):
+    """Apre il rerun della sessione (None se il profilo non è attivo); un rerun
+    precedente interrotto da st.rerun/st.stop viene registrato come incompleto"""
+    if not ATTIVO:
+        return None
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    with _lock:
+        interrotto = _in_corso.pop(sessione, None)
+    if interrotto is not None:
+        _chiudi(interrotto)
+    rerun = Rerun(sessione, cattura)
+    with _lock:
+        _in_corso[sessione] = rerun
+    _locale.rerun = rerun
+    if rerun.profiler is not None:
+        rerun.profiler.enable()
+    return rerun
+
+
+def sezione(nome):
+    """Chiude la sezione precedente dello script e ne apre una nuova"""
+    rerun = getattr(_locale, "rerun", None)
+    if rerun is None:
+        return
+    rerun.chiudi_sezione()
+    rerun.sezione = rerun.fase(nome)
+    rerun.sezione.__enter__()
+
+
+def fase(nome):
+    """Context manager che misura un'operazione del rerun in corso (nulla se non attivo)"""
+    rerun = getattr(_locale, "rerun", None)
+    return _nulla if rerun is None else rerun.fase(nome)
+
+
+def termina_rerun():
+    """Chiude il rerun arrivato in fondo allo script e lo restituisce per il pannello"""
+    rerun = getattr(_locale, "rerun", None)
+    if rerun is None:
+        return None
+    _locale.rerun = None
+    with _lock:
+        if _in_corso.get(rerun.sessione) is rerun:
+            del _in_corso[rerun.sessione]
+    rerun.completato = True
+    _chiudi(rerun)
+    return rerun
@@ -0,0 +1,388 @@
+"""Ricerca testuale su fatture e anagrafiche con un indice invertito.
+
+Ogni parola di controparte, numero, P.IVA e note (per le anagrafiche:
+ragione sociale, P.IVA, email e telefono) punta ai documenti che la
+contengono. L'indice ha due parti, come snapshot e journal dell'archivio:
+
+- la base su disco (ricerca_fatture.indice, ricerca_anagrafiche.indice,
+  nella cartella dei file che indicizzano):
+  vocabolario ordinato e liste di documenti in array NumPy, letti con mmap,
+  più id e firma (crc32 del testo indicizzato) di ogni documento;
+- le modifiche successive in memoria (dizionario parola -> documenti), ad
+  ogni salvataggio, riversate nella base oltre SOGLIA_COMPATTAZIONE.
+
+All'avvio le fatture con la stessa firma riusano la base e solo quelle
+cambiate nel frattempo vengono rianalizzate. Una ricerca è una ricerca
+binaria per parola digitata (anche parziale: "ross" trova "Rossi") più
+l'intersezione degli array dei documenti.
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from bisect import bisect_left, insort
+
+import numpy as np
+
+import archivio
+from anagrafiche import chiave_piva
+
+MAGIA = b"INVPRIC1"
+FILE_INDICE_FATTURE = "ricerca_fatture.indice"
+FILE_INDICE_ANAGRAFICHE = "ricerca_anagrafiche.indice"
+# Documenti modificati in memoria oltre i quali la base su disco viene riscritta
+SOGLIA_COMPATTAZIONE = 20_000
+CATEGORIE_ANAGRAFICHE = ("clienti", "fornitori")
+
+# Parole: lettere e cifre, "/" compreso perché 2026/12 resti un numero solo
+_PAROLA = re.compile(r"[\w/]+")
+_FINE = "\uffff"  # dopo ogni parola che inizia con il prefisso
+
+
+def parole(testo):
+    return _PAROLA.findall(testo.lower())
+
+
+def testo_fattura(fattura):
+    piva = str(fattura.get("piva") or "")
+    return " ".join((str(fattura.get("cliente_fornitore") or ""), str(fattura.get("numero") or ""),
+                     piva, chiave_piva(piva), str(fattura.get("note") or "")))
+
+
+def testo_anagrafica(anagrafica):
+    piva = str(anagrafica.get("piva") or "")
+    return " ".join((str(anagrafica.get("ragione_sociale") or ""), piva, chiave_piva(piva),
+                     str(anagrafica.get("email") or ""), str(anagrafica.get("telefono") or "")))
+
+
+def chiave_fattura(fattura):
+    return str(fattura.get("id") or id(fattura))
+
+
+def chiave_anagrafica(anagrafica):
+    # le anagrafiche non hanno un id: P.IVA e ragione sociale le distinguono
+    return f"{chiave_piva(anagrafica.get('piva'))}|{anagrafica.get('ragione_sociale', '')}"
+
+
+def _firma(testo):
+    return zlib.crc32(testo.encode('utf-8'))
+
+
+# ---------- file della base ----------
+def _scrivi_base(percorso, base):
+    """Intestazione JSON + buffer allineati a 8 byte (stesso schema di colonnare.py)"""
+    blocchi = {
+        "termini": "\x00".join(base["termini"]).encode('utf-8'),
+        "inizi": base["inizi"].astype("int64"),
+        "documenti": base["documenti"].astype("int32"),
+        "tipi": base["tipi"].astype("uint8"),
+        "chiavi": "\x00".join(base["chiavi"]).encode('utf-8'),
+        "firme": base["firme"].astype("uint32"),
+    }
+    intestazione = {"categorie": list(base["categorie"]), "n_termini": len(base["termini"]),
+                    "n_documenti": len(base["chiavi"]), "buffer": {}}
+    dati, posizione = [], 0
+    for nome, valore in blocchi.items():
+        grezzo = valore if isinstance(valore, bytes) else valore.tobytes()
+        dtype = "bytes" if isinstance(valore, bytes) else valore.dtype.str
+        intestazione["buffer"][nome] = [dtype, posizione, len(grezzo)]
+        riempimento = -len(grezzo) % 8
+        dati.append(grezzo + b"\x00" * riempimento)
+        posizione += len(grezzo) + riempimento
+    testata = json.dumps(intestazione).encode('utf-8')
+    testata += b" " * (-(len(MAGIA) + 8 + len(testata)) % 8)
+    tmp = f"{percorso}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIA + struct.pack("<Q", len(testata)) + testata)
+        for blocco in dati:
+            f.write(blocco)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, percorso)
+
+
+def _leggi_base(percorso, categorie):
+    """Base dal file (array mappati in memoria), None se manca, è illeggibile o di altre categorie"""
+    try:
+        with open(percorso, "rb") as f:
+            mappa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mappa[:len(MAGIA)] != MAGIA:
+            return None
+        lunghezza, = struct.unpack_from("<Q", mappa, len(MAGIA))
+        inizio = len(MAGIA) + 8 + lunghezza
+        intestazione = json.loads(mappa[len(MAGIA) + 8:inizio])
+        if tuple(intestazione["categorie"]) != tuple(categorie):
+            return None
+        base = {"categorie": tuple(categorie)}
+        for nome, (dtype, posizione, dimensione) in intestazione["buffer"].items():
+            if dtype == "bytes":
+                testo = mappa[inizio + posizione:inizio + posizione + dimensione].decode('utf-8')
+                base[nome] = testo.split("\x00") if testo else []
+            elif dimensione == 0:
+                base[nome] = np.zeros(0, dtype=dtype)
+            else:
+                base[nome] = np.frombuffer(mappa, dtype=dtype, count=dimensione // np.dtype(dtype).itemsize,
+                                           offset=inizio + posizione)
+        # un termine o una chiave vuota spariscono nello split: il file non è coerente
+        if len(base["termini"]) != intestazione["n_termini"] or len(base["chiavi"]) != intestazione["n_documenti"]:
+            return None
+        return base
+    except:
+        return None
+
+
+def _base_vuota(categorie):
+    return {"categorie": tuple(categorie), "termini": [], "inizi": np.zeros(1, dtype="int64"),
+            "documenti": np.zeros(0, dtype="int32"), "tipi": np.zeros(0, dtype="uint8"),
+            "chiavi": [], "firme": np.zeros(0, dtype="uint32")}
+
+
+class IndiceTesto:
+    """Indice invertito base + modifiche; segue il protocollo degli indici derivati
+    (ricostruisci / aggiorna) con tipi = TIPI o categorie delle anagrafiche"""
+
+    def __init__(self, percorso, categorie, testo, chiave):
+        self.percorso = percorso
+        self.categorie = tuple(categorie)
+        self.testo = testo
+        self.chiave = chiave
+        self._lock = threading.RLock()
+        self._base = None
+
+    # ---------- base ----------
+    def _installa(self, base, voci=None):
+        self._base = base
+        n = len(base["chiavi"])
+        self._posizioni = {categoria: {} for categoria in self.categorie}
+        for posizione, (codice, chiave) in enumerate(zip(base["tipi"].tolist(), base["chiavi"])):
+            self._posizioni[self.categorie[codice]][chiave] = posizione
+        self._vive = np.ones(n, dtype=bool) if voci is not None else np.zeros(n, dtype=bool)
+        self._voci = voci if voci is not None else [None] * n
+        self._azzera_modifiche()
+
+    def _azzera_modifiche(self):
+        self._prossimo = len(self._base["chiavi"])
+        self._nuovi = {}             # documento -> (tipo, voce, chiave, firma, parole)
+        self._per_chiave = {}        # (tipo, chiave) -> documento
+        self._termini_nuovi = {}     # parola -> documenti
+        self._vocabolario = []       # parole di _termini_nuovi, ordinate
+
+    def _carica_base(self):
+        if self._base is None:
+            self._installa(_leggi_base(self.percorso, self.categorie) or _base_vuota(self.categorie))
+
+    # ---------- modifiche ----------
+    def _ravviva(self, tipo, voce, chiave, firma):
+        """Documento della base con la stessa firma: torna visibile senza rianalizzarlo"""
+        posizione = self._posizioni[tipo].get(chiave)
+        if posizione is not None and not self._vive[posizione] and self._base["firme"][posizione] == firma:
+            self._vive[posizione] = True
+            self._voci[posizione] = voce
+            return True
+        return False
+
+    def _aggiungi(self, tipo, voce, testo, chiave, firma, indicizza=True):
+        documento = self._prossimo
+        self._prossimo += 1
+        trovate = set(parole(testo))
+        self._nuovi[documento] = (tipo, voce, chiave, firma, trovate)
+        self._per_chiave[(tipo, chiave)] = documento
+        if indicizza:
+            for parola in trovate:
+                documenti = self._termini_nuovi.get(parola)
+                if documenti is None:
+                    self._termini_nuovi[parola] = {documento}
+                    insort(self._vocabolario, parola)
+                else:
+                    documenti.add(documento)
+
+    def _rimuovi(self, tipo, voce):
+        chiave = self.chiave(voce)
+        documento = self._per_chiave.pop((tipo, chiave), None)
+        if documento is not None:
+            for parola in self._nuovi.pop(documento)[4]:
+                documenti = self._termini_nuovi[parola]
+                documenti.discard(documento)
+                if not documenti:
+                    del self._termini_nuovi[parola]
+                    del self._vocabolario[bisect_left(self._vocabolario, parola)]
+            return
+        posizione = self._posizioni[tipo].get(chiave)
+        if posizione is not None and self._vive[posizione]:
+            self._vive[posizione] = False
+            self._voci[posizione] = None
+
+    def _inserisci(self, tipo, voce):
+        testo = self.testo(voce)
+        chiave, firma = self.chiave(voce), _firma(testo)
+        if not self._ravviva(tipo, voce, chiave, firma):
+            self._aggiungi(tipo, voce, testo, chiave, firma)
+
+    def ricostruisci(self, dati):
+        with self._lock:
+            self._carica_base()
+            self._vive[:] = False
+            self._voci = [None] * len(self._voci)
+            self._azzera_modifiche()
+            da_analizzare = []
+            for tipo in self.categorie:
+                for voce in dati.get(tipo, []):
+                    testo = self.testo(voce)
+                    chiave, firma = self.chiave(voce), _firma(testo)
+                    if not self._ravviva(tipo, voce, chiave, firma):
+                        da_analizzare.append((tipo, voce, testo, chiave, firma))
+            # molte novità (primo avvio, import): vanno direttamente nella base
+            massa = len(da_analizzare) > SOGLIA_COMPATTAZIONE or (da_analizzare and not len(self._vive))
+            for voce in da_analizzare:
+                self._aggiungi(*voce, indicizza=not massa)
+            if massa:
+                self.compatta()
+
+    def aggiorna(self, tipo, vecchia, nuova):
+        with self._lock:
+            self._carica_base()
+            if vecchia is not None:
+                self._rimuovi(tipo, vecchia)
+            if nuova is not None:
+                self._inserisci(tipo, nuova)
+            if len(self._nuovi) > SOGLIA_COMPATTAZIONE:
+                self.compatta()
+
+    # ---------- compattazione ----------
+    def compatta(self):
+        """Riversa le modifiche nella base e la riscrive su disco (sotto lock tra processi)"""
+        with self._lock:
+            self._carica_base()
+            base = self._base
+            vive = np.flatnonzero(self._vive)
+            nuovi = [self._nuovi[d] for d in sorted(self._nuovi)]
+            termini_vecchi = base["termini"]
+            termini = sorted(set(termini_vecchi).union(*(n[4] for n in nuovi)))
+            numero = {t: i for i, t in enumerate(termini)}
+
+            # coppie (termine, documento) della base ancora visibili, rinumerate
+            nuova_posizione = np.full(len(self._vive), -1, dtype="int64")
+            nuova_posizione[vive] = np.arange(len(vive))
+            termine_di = np.repeat(np.arange(len(termini_vecchi), dtype="int64"), np.diff(base["inizi"]))
+            tieni = self._vive[base["documenti"]]
+            mappa = np.array([numero[t] for t in termini_vecchi], dtype="int64")
+            coppie_t = [mappa[termine_di[tieni]] if len(termini_vecchi) else np.zeros(0, dtype="int64")]
+            coppie_d = [nuova_posizione[base["documenti"][tieni]]]
+            # coppie dei documenti nuovi
+            t_nuovi, d_nuovi = [], []
+            for i, (_, _, _, _, trovate) in enumerate(nuovi, start=len(vive)):
+                for parola in trovate:
+                    t_nuovi.append(numero[parola])
+                    d_nuovi.append(i)
+            coppie_t.append(np.array(t_nuovi, dtype="int64"))
+            coppie_d.append(np.array(d_nuovi, dtype="int64"))
+            t = np.concatenate(coppie_t)
+            d = np.concatenate(coppie_d)
+            ordine = np.lexsort((d, t))
+            t, d = t[ordine], d[ordine]
+            conteggi = np.bincount(t, minlength=len(termini))
+            # termini rimasti senza documenti (fatture cancellate) escono dal vocabolario
+            usati = np.flatnonzero(conteggi)
+            inizi = np.zeros(len(usati) + 1, dtype="int64")
+            np.cumsum(conteggi[usati], out=inizi[1:])
+            codici = {c: i for i, c in enumerate(self.categorie)}
+            nuova = {
+                "categorie": self.categorie,
+                "termini": [termini[i] for i in usati.tolist()],
+                "inizi": inizi,
+                "documenti": d.astype("int32"),
+                "tipi": np.concatenate([base["tipi"][vive], np.array([codici[n[0]] for n in nuovi], dtype="uint8")]),
+                "chiavi": [base["chiavi"][i] for i in vive.tolist()] + [n[2] for n in nuovi],
+                "firme": np.concatenate([base["firme"][vive], np.array([n[3] for n in nuovi], dtype="uint32")]),
+            }
+            voci = [self._voci[i] for i in vive.tolist()] + [n[1] for n in nuovi]
+            try:
+                with archivio.blocco_file(self.percorso):
+                    _scrivi_base(self.percorso, nuova)
+            except OSError:
+                pass  # resta valida in memoria; su disco alla prossima compattazione
+            self._installa(nuova, voci)
+            return True
+
+    # ---------- ricerca ----------
+    def _documenti_base(self, parola):
+        termini = self._base["termini"]
+        i = bisect_left(termini, parola)
+        # una sola lettera: solo parola intera, altrimenti anche le parole che iniziano così
+        j = bisect_left(termini, parola + _FINE, i) if len(parola) > 1 else i + (i < len(termini) and termini[i] == parola)
+        inizi = self._base["inizi"]
+        documenti = self._base["documenti"][inizi[i]:inizi[j]]
+        if j - i <= 1:
+            return documenti
+        if len(documenti) < 10_000:
+            return np.unique(documenti)
+        # molti documenti (prefissi corti): una maschera costa meno dell'ordinamento
+        presenti = np.zeros(len(self._vive), dtype=bool)
+        presenti[documenti] = True
+        return np.flatnonzero(presenti)
+
+    def _documenti_nuovi(self, parola):
+        if len(parola) == 1:
+            return set(self._termini_nuovi.get(parola, ()))
+        i = bisect_left(self._vocabolario, parola)
+        j = bisect_left(self._vocabolario, parola + _FINE, i)
+        return set().union(*(self._termini_nuovi[p] for p in self._vocabolario[i:j]))
+
+    def cerca(self, testo, limite=20):
+        """([(tipo, voce)] con tutte le parole cercate, dalla più recente; numero totale trovate)"""
+        cercate = list(dict.fromkeys(parole(testo)))
+        if not cercate:
+            return [], 0
+        with self._lock:
+            self._carica_base()
+            base, nuovi = None, None
+            for parola in cercate:
+                trovati = self._documenti_base(parola)
+                base = trovati if base is None else np.intersect1d(base, trovati, assume_unique=True)
+                nuovi = self._documenti_nuovi(parola) if nuovi is None else nuovi & self._documenti_nuovi(parola)
+            base = base[self._vive[base]]
+            risultati = [(self._nuovi[d][0], self._nuovi[d][1]) for d in sorted(nuovi, reverse=True)[:limite]]
+            for posizione in base[::-1][:limite - len(risultati)].tolist():
+                risultati.append((self.categorie[self._base["tipi"][posizione]], self._voci[posizione]))
+            return risultati, len(base) + len(nuovi)
+
+
+_indice_fatture = None
+_indice_anagrafiche = None
+_lock_indice = threading.Lock()
+
+
+def indice_fatture():
+    """Indice condiviso dal processo, registrato sull'archivio (tutti gli anni) alla prima chiamata"""
+    global _indice_fatture
+    with _lock_indice:
+        if _indice_fatture is None:
+            indice = IndiceTesto(os.path.join(archivio.cartella_fatture(), FILE_INDICE_FATTURE),
+                                 archivio.TIPI, testo_fattura, chiave_fattura)
+            archivio.registra_indice(indice)
+            _indice_fatture = indice
+    archivio.carica_dati()
+    return _indice_fatture
+
+
+def indice_anagrafiche():
+    global _indice_anagrafiche
+    with _lock_indice:
+        if _indice_anagrafiche is None:
+            indice = IndiceTesto(os.path.join(archivio.cartella_anagrafiche(), FILE_INDICE_ANAGRAFICHE),
+                                 CATEGORIE_ANAGRAFICHE, testo_anagrafica, chiave_anagrafica)
+            archivio.registra_indice_anagrafiche(indice)
+            _indice_anagrafiche = indice
+    archivio.carica_anagrafiche()
+    return _indice_anagrafiche
+
+
+def cerca_fatture(testo, limite=20):
+    return indice_fatture().cerca(testo, limite)
+
+
+def cerca_anagrafiche(testo, limite=10):
+    return indice_anagrafiche().cerca(testo, limite)
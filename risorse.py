@@ -0,0 +1,73 @@
+"""Immagini e stile delle pagine, preparati una volta per processo.
+
+st.image("banner1.png") rilegge il PNG ad ogni rerun; qui i byte restano in
+memoria finché il file non cambia (controllo sull'mtime, come FileCache) e il
+banner può essere servito ridimensionato in WebP: ~27 KB invece di ~95 KB.
+
+INVOICEPRO_BANNER=originale serve il file così com'è; senza Pillow si usa
+comunque l'originale.
+"""
+import io
+import os
+from functools import lru_cache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+BANNER = "banner1.png"
+# 2x della colonna centrale di Streamlit (~700 px): nitido anche su schermi retina
+LARGHEZZA_BANNER = int(os.environ.get("INVOICEPRO_BANNER_LARGHEZZA", "1400"))
+FORMATO_BANNER = os.environ.get("INVOICEPRO_BANNER", "webp").lower()
+
+STILE = """
+<style>
+/* METRIC PIÙ PICCOLE */
+[data-testid="stMetricLabel"] {
+    font-size: 16px !important;
+    font-weight: 600 !important;
+}
+[data-testid="stMetricValue"] {
+    font-size: 20px !important;
+    font-weight: 700 !important;
+}
+[data-testid="stMetricDelta"] {
+    font-size: 14px !important;
+}
+</style>
+"""
+
+
+@lru_cache(maxsize=16)
+def _prepara(percorso, mtime, larghezza, formato):
+    with open(percorso, "rb") as f:
+        originale = f.read()
+    if Image is None or formato == "originale":
+        return originale
+    try:
+        img = Image.open(io.BytesIO(originale))
+        if larghezza and img.width > larghezza:
+            img = img.resize((larghezza, round(img.height * larghezza / img.width)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, "WEBP", quality=85, method=6)
+    except:
+        return originale
+    # una variante più pesante dell'originale non serve
+    return buffer.getvalue() if buffer.tell() < len(originale) else originale
+
+
+def immagine(percorso, larghezza=None, formato="originale"):
+    """Byte dell'immagine (eventualmente ridotta a larghezza px e in WebP), riletti solo se il file cambia"""
+    return _prepara(percorso, os.path.getmtime(percorso), larghezza, formato)
+
+
+def banner():
+    return immagine(BANNER, LARGHEZZA_BANNER, FORMATO_BANNER)
+
+
+@lru_cache(maxsize=1)
+def stile():
+    """CSS delle pagine senza commenti e spazi superflui, calcolato una volta"""
+    righe = [r.strip() for r in STILE.splitlines()]
+    return "".join(r for r in righe if r and not r.startswith("/*"))
@@ -0,0 +1,180 @@
+"""Scadenze di tutto l'archivio: indice ordinato per data di scadenza.
+
+Per ogni tipo le fatture con scadenza stanno in una lista ordinata di
+(giorno, id), aggiornata ad ogni salvataggio come gli altri indici derivati:
+le scadute a una data sono un prefisso della lista (ricerca binaria + k
+elementi) e quelle in scadenza nei prossimi N giorni un intervallo.
+
+Un thread in background rilegge l'archivio e ricalcola il riepilogo di
+scadute e in scadenza una volta al giorno, al cambio di data: la prima pagina
+dopo mezzanotte lo trova già pronto.
+"""
+import threading
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta
+
+import archivio
+from archivio import data_fattura
+from importi import centesimi, euro
+
+# Orizzonte di "in scadenza" nel riepilogo
+GIORNI_AVVISO = 7
+# Controllo del cambio di data almeno ogni ora (sospensioni, cambi di orario)
+INTERVALLO_MASSIMO = 3600
+
+
+def _chiave(fattura):
+    scadenza = data_fattura(fattura.get("scadenza"))
+    if scadenza is None:
+        return None
+    return (scadenza.toordinal(), str(fattura.get("id") or id(fattura)))
+
+
+class IndiceScadenze:
+    def __init__(self):
+        self._chiavi = {tipo: [] for tipo in archivio.TIPI}  # (giorno, id) ordinati
+        self._voci = {tipo: {} for tipo in archivio.TIPI}  # id -> fattura
+        self.versione = 0
+        self._lock = threading.Lock()
+
+    def ricostruisci(self, dati):
+        chiavi, voci = {}, {}
+        for tipo in archivio.TIPI:
+            coppie = [(c, f) for c, f in ((_chiave(f), f) for f in dati.get(tipo, [])) if c is not None]
+            chiavi[tipo] = sorted(c for c, _ in coppie)
+            voci[tipo] = {c[1]: f for c, f in coppie}
+        with self._lock:
+            self._chiavi, self._voci = chiavi, voci
+            self.versione += 1
+
+    def aggiorna(self, tipo, vecchia, nuova):
+        with self._lock:
+            if vecchia is not None:
+                chiave = _chiave(vecchia)
+                if chiave is not None:
+                    chiavi = self._chiavi[tipo]
+                    i = bisect_left(chiavi, chiave)
+                    if i < len(chiavi) and chiavi[i] == chiave:
+                        del chiavi[i]
+                        self._voci[tipo].pop(chiave[1], None)
+            if nuova is not None:
+                chiave = _chiave(nuova)
+                if chiave is not None:
+                    insort(self._chiavi[tipo], chiave)
+                    self._voci[tipo][chiave[1]] = nuova
+            self.versione += 1
+
+    def _intervallo(self, tipo, dal, al):
+        """Fatture con scadenza in [dal, al), dalla più vecchia"""
+        with self._lock:
+            chiavi = self._chiavi[tipo]
+            inizio = 0 if dal is None else bisect_left(chiavi, (dal.toordinal(),))
+            fine = bisect_left(chiavi, (al.toordinal(),), inizio)
+            voci = self._voci[tipo]
+            return [voci[c[1]] for c in chiavi[inizio:fine]]
+
+    def scadute(self, tipo, oggi):
+        """Fatture con scadenza < oggi in tutto l'archivio, dalla più vecchia"""
+        return self._intervallo(tipo, None, oggi)
+
+    def in_scadenza(self, tipo, oggi, giorni=GIORNI_AVVISO):
+        """Fatture che scadono da oggi ai prossimi giorni (compresi)"""
+        return self._intervallo(tipo, oggi, oggi + timedelta(days=giorni + 1))
+
+    def riepilogo(self, oggi, giorni=GIORNI_AVVISO):
+        """{tipo: {"scadute", "totale_scadute", "in_scadenza", "totale_in_scadenza"}}"""
+        risultato = {}
+        for tipo in archivio.TIPI:
+            scadute = self.scadute(tipo, oggi)
+            prossime = self.in_scadenza(tipo, oggi, giorni)
+            risultato[tipo] = {
+                "scadute": len(scadute),
+                "totale_scadute": euro(sum(centesimi(f.get("totale")) for f in scadute)),
+                "in_scadenza": len(prossime),
+                "totale_in_scadenza": euro(sum(centesimi(f.get("totale")) for f in prossime)),
+            }
+        return risultato
+
+
+class Scanner(threading.Thread):
+    """Thread che al cambio di data rilegge l'archivio e ricalcola il riepilogo del giorno"""
+
+    def __init__(self, indice, giorni=GIORNI_AVVISO):
+        super().__init__(name="invoicepro-scadenze", daemon=True)
+        self.indice = indice
+        self.giorni = giorni
+        self._stato = None  # (giorno, versione indice, riepilogo)
+        self._lock = threading.Lock()
+        self._ferma = threading.Event()
+
+    def aggiorna(self, oggi=None):
+        oggi = oggi or date.today()
+        archivio.carica_dati()  # allinea l'indice con le scritture degli altri processi
+        versione = self.indice.versione
+        riepilogo = self.indice.riepilogo(oggi, self.giorni)
+        with self._lock:
+            self._stato = (oggi, versione, riepilogo)
+        return riepilogo
+
+    def riepilogo(self, oggi=None):
+        """Riepilogo del giorno: quello precalcolato se l'indice non è cambiato"""
+        oggi = oggi or date.today()
+        with self._lock:
+            stato = self._stato
+        if stato is not None and stato[0] == oggi and stato[1] == self.indice.versione:
+            return stato[2]
+        return self.aggiorna(oggi)
+
+    def run(self):
+        while not self._ferma.is_set():
+            oggi = date.today()
+            with self._lock:
+                giorno = self._stato[0] if self._stato else None
+            if giorno != oggi:
+                try:
+                    self.aggiorna(oggi)
+                except:
+                    pass
+            domani = datetime.combine(oggi + timedelta(days=1), datetime.min.time())
+            attesa = (domani - datetime.now()).total_seconds() + 1
+            self._ferma.wait(min(max(attesa, 1), INTERVALLO_MASSIMO))
+
+    def ferma(self):
+        self._ferma.set()
+
+
+_indice = None
+_scanner = None
+_lock_indice = threading.Lock()
+
+
+def indice_scadenze():
+    """Indice condiviso dal processo, registrato sull'archivio (tutti gli anni) alla prima chiamata"""
+    global _indice
+    with _lock_indice:
+        if _indice is None:
+            indice = IndiceScadenze()
+            archivio.registra_indice(indice)
+            _indice = indice
+    archivio.carica_dati()
+    return _indice
+
+
+def scadute(tipo, oggi=None):
+    return indice_scadenze().scadute(tipo, oggi or date.today())
+
+
+def in_scadenza(tipo, oggi=None, giorni=GIORNI_AVVISO):
+    return indice_scadenze().in_scadenza(tipo, oggi or date.today(), giorni)
+
+
+def riepilogo(oggi=None):
+    """Scadute e in scadenza nei prossimi GIORNI_AVVISO giorni, per tipo; alla prima
+    chiamata avvia il thread che lo ricalcola ad ogni cambio di data"""
+    global _scanner
+    indice = indice_scadenze()
+    with _lock_indice:
+        if _scanner is None:
+            _scanner = Scanner(indice)
+            _scanner.start()
+    return _scanner.riepilogo(oggi)
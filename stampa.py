@@ -0,0 +1,405 @@
+"""Fatture in PDF, generate fuori dal rerun in un pool di processi limitato.
+
+Il PDF è scritto direttamente (una pagina A4, font standard Helvetica, logo
+da logo_pdf.png), come fattura_to_xml scrive l'XML senza librerie esterne.
+Il rendering avviene nei processi del pool (al massimo PROCESSI insieme): lo
+script chiede il PDF con richiedi_pdf(), riceve un Future e al rerun
+successivo lo trova pronto, senza mai aspettarlo.
+
+I file finiscono in CARTELLA_PDF con nome uguale all'hash dei campi stampati:
+una fattura non modificata si riscarica senza rigenerarla, una modificata
+ottiene un file nuovo. La cache è potata ai file usati meno di recente oltre
+DIMENSIONE_CACHE.
+
+Gli ZIP di un mese (zip_pdf_periodo) vengono costruiti in un thread a parte,
+che manda al pool solo le fatture non ancora in cache.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import textwrap
+import threading
+import zipfile
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+try:
+    from PIL import Image
+except ImportError:  # senza Pillow il PDF esce senza logo
+    Image = None
+
+CARTELLA_PDF = os.environ.get("INVOICEPRO_PDF_CACHE", "pdf_cache")
+PROCESSI = int(os.environ.get("INVOICEPRO_PDF_PROCESSI", "2"))
+# Richieste singole in attesa oltre le quali richiedi_pdf() rifiuta (coda limitata)
+CODA_MASSIMA = 64
+DIMENSIONE_CACHE = 200 * 2**20
+BLOCCO_PDF = 200
+# ZIP dei periodi tenuti su disco per il download (gli altri vengono eliminati)
+ZIP_TENUTI = 4
+LOGO = "logo_pdf.png"
+# Da cambiare quando cambia l'impaginazione: invalida tutta la cache
+VERSIONE_PDF = 1
+
+# Campi che finiscono nel PDF: solo questi entrano nella chiave della cache
+CAMPI = ("data", "numero", "cliente_fornitore", "piva", "imponibile", "iva_perc", "iva", "totale",
+         "pagamento", "scadenza", "note")
+
+# ---------- impaginazione ----------
+LARGHEZZA, ALTEZZA = 595.28, 841.89  # A4 in punti
+MARGINE = 50
+# Larghezze Helvetica (1/1000 di corpo) dei caratteri degli importi, per allinearli a destra
+_LARGHEZZE = {**dict.fromkeys("0123456789", 556), ".": 278, ",": 278, " ": 278, "€": 556, "-": 333, "%": 889}
+
+
+def _euro(valore):
+    """1234.5 -> "€ 1.234,50" """
+    try:
+        testo = f"{float(valore):,.2f}"
+    except (TypeError, ValueError):
+        testo = "0.00"
+    return "€ " + testo.replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def _stringa(valore):
+    """Stringa PDF in WinAnsi (i caratteri non rappresentabili diventano ?)"""
+    testo = "" if valore is None else str(valore)
+    dati = testo.encode("cp1252", "replace")
+    return b"(" + dati.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+class _Pagina:
+    def __init__(self):
+        self.comandi = []
+
+    def testo(self, x, y, valore, corpo=10, grassetto=False, destra=False):
+        if destra:
+            x -= sum(_LARGHEZZE.get(c, 556) for c in str(valore)) * corpo / 1000
+        font = b"/F2" if grassetto else b"/F1"
+        self.comandi.append(b"BT %s %d Tf %.2f %.2f Td %s Tj ET" % (font, corpo, x, y, _stringa(valore)))
+
+    def linea(self, x1, y1, x2, y2, spessore=0.5):
+        self.comandi.append(b"%.2f w %.2f %.2f m %.2f %.2f l S" % (spessore, x1, y1, x2, y2))
+
+    def grigio(self, livello):
+        self.comandi.append(b"%.2f g %.2f G" % (livello, livello))
+
+    def immagine(self, x, y, larghezza, altezza):
+        self.comandi.append(b"q %.2f 0 0 %.2f %.2f %.2f cm /Logo Do Q" % (larghezza, altezza, x, y))
+
+    def contenuto(self):
+        return b"\n".join(self.comandi)
+
+
+@lru_cache(maxsize=1)
+def _logo(percorso, mtime):
+    """(jpeg, larghezza px, altezza px) del logo, preparato una volta per processo"""
+    if Image is None:
+        return None
+    try:
+        img = Image.open(percorso).convert("RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=90)
+        return buffer.getvalue(), img.width, img.height
+    except:
+        return None
+
+
+def _firma_logo():
+    try:
+        return os.path.getmtime(LOGO)
+    except OSError:
+        return None
+
+
+def _documento(contenuto, logo):
+    """Byte del PDF di una pagina: catalogo, pagine, pagina, contenuto, due font e il logo"""
+    flusso = zlib.compress(contenuto)
+    risorse = b"/Font << /F1 5 0 R /F2 6 0 R >>"
+    if logo is not None:
+        risorse += b" /XObject << /Logo 7 0 R >>"
+    oggetti = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Resources << %s >> /Contents 4 0 R >>"
+        % (LARGHEZZA, ALTEZZA, risorse),
+        b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(flusso), flusso),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    if logo is not None:
+        jpeg, larghezza, altezza = logo
+        oggetti.append(
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+            b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n%s\nendstream"
+            % (larghezza, altezza, len(jpeg), jpeg))
+    pdf = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    posizioni = []
+    for numero, oggetto in enumerate(oggetti, 1):
+        posizioni.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (numero, oggetto)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(oggetti) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % p for p in posizioni)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(oggetti) + 1, xref)
+    return bytes(pdf)
+
+
+def fattura_to_pdf(fattura, tipo):
+    """PDF (bytes) di una pagina con intestazione, controparte, importi, pagamento e note"""
+    p = _Pagina()
+    destra = LARGHEZZA - MARGINE
+    y = ALTEZZA - MARGINE
+
+    firma = _firma_logo()
+    logo = _logo(LOGO, firma) if firma is not None else None
+    if logo is not None:
+        larghezza = 160
+        altezza = larghezza * logo[2] / logo[1]
+        p.immagine(MARGINE, y - altezza, larghezza, altezza)
+
+    p.testo(340, y - 18, "FATTURA" if tipo == "Attiva" else "FATTURA RICEVUTA", 18, True)
+    p.testo(340, y - 40, f"n. {fattura.get('numero', '')}", 12, True)
+    p.testo(340, y - 56, f"del {fattura.get('data', '')}", 11)
+
+    y -= 120
+    p.grigio(0.4)
+    p.testo(MARGINE, y, "CLIENTE" if tipo == "Attiva" else "FORNITORE", 9, True)
+    p.grigio(0)
+    p.testo(MARGINE, y - 18, fattura.get("cliente_fornitore", ""), 13, True)
+    p.testo(MARGINE, y - 34, f"P.IVA {fattura.get('piva', '')}", 10)
+
+    # importi
+    y -= 80
+    p.grigio(0.4)
+    p.testo(MARGINE, y, "DESCRIZIONE", 9, True)
+    p.testo(destra, y, "IMPORTO", 9, True, destra=True)
+    p.grigio(0)
+    p.linea(MARGINE, y - 6, destra, y - 6)
+    p.testo(MARGINE, y - 24, "Imponibile", 11)
+    p.testo(destra, y - 24, _euro(fattura.get("imponibile")), 11, destra=True)
+    p.testo(MARGINE, y - 42, f"IVA {fattura.get('iva_perc', '')}%", 11)
+    p.testo(destra, y - 42, _euro(fattura.get("iva")), 11, destra=True)
+    p.linea(MARGINE, y - 52, destra, y - 52, 1)
+    p.testo(MARGINE, y - 72, "TOTALE", 13, True)
+    p.testo(destra, y - 72, _euro(fattura.get("totale")), 13, True, destra=True)
+
+    y -= 120
+    p.testo(MARGINE, y, "Pagamento:", 10, True)
+    p.testo(MARGINE + 70, y, fattura.get("pagamento", ""), 10)
+    if fattura.get("scadenza"):
+        p.testo(MARGINE, y - 16, "Scadenza:", 10, True)
+        p.testo(MARGINE + 70, y - 16, fattura["scadenza"], 10)
+
+    note = str(fattura.get("note") or "").strip()
+    if note:
+        y -= 50
+        p.testo(MARGINE, y, "Note", 10, True)
+        righe = [r for paragrafo in note.splitlines() for r in (textwrap.wrap(paragrafo, 95) or [""])]
+        for i, riga in enumerate(righe[:30]):
+            p.testo(MARGINE, y - 16 - i * 13, riga, 9)
+
+    p.grigio(0.5)
+    p.testo(MARGINE, MARGINE - 20, "Copia di cortesia: il documento fiscale è la fattura elettronica.", 8)
+    return _documento(p.contenuto(), logo)
+
+
+# ---------- cache ----------
+def chiave_pdf(fattura, tipo):
+    """Hash dei campi stampati (più tipo, impaginazione e logo): cambia solo se cambia il PDF"""
+    campi = [VERSIONE_PDF, tipo, _firma_logo(), [fattura.get(c) for c in CAMPI]]
+    return hashlib.sha256(json.dumps(campi, default=str, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def percorso_pdf(fattura, tipo):
+    return os.path.abspath(os.path.join(CARTELLA_PDF, chiave_pdf(fattura, tipo)[:40] + ".pdf"))
+
+
+def nome_file_pdf(fattura, tipo):
+    from esporta import nome_file_xml
+
+    return nome_file_xml(fattura, tipo)[:-4] + ".pdf"
+
+
+def _genera(fattura, tipo, percorso):
+    """Eseguita nei processi del pool: scrive il PDF (se manca) e ne restituisce il percorso"""
+    if not os.path.exists(percorso):
+        os.makedirs(os.path.dirname(percorso), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(percorso), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(fattura_to_pdf(fattura, tipo))
+            os.replace(tmp, percorso)
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return percorso
+
+
+def _genera_blocco(blocco):
+    """Eseguita nei processi del pool: [(fattura, tipo, percorso)] -> [percorso]"""
+    return [_genera(fattura, tipo, percorso) for fattura, tipo, percorso in blocco]
+
+
+def pota_cache(massimo=DIMENSIONE_CACHE):
+    """Elimina i PDF usati meno di recente finché la cartella supera massimo byte"""
+    try:
+        voci = [(v.stat().st_mtime, v.stat().st_size, v.path) for v in os.scandir(CARTELLA_PDF)
+                if v.name.endswith(".pdf")]
+    except OSError:
+        return 0
+    totale = sum(dimensione for _, dimensione, _ in voci)
+    eliminati = 0
+    for _, dimensione, percorso in sorted(voci):
+        if totale <= massimo:
+            break
+        try:
+            os.remove(percorso)
+        except OSError:
+            continue
+        totale -= dimensione
+        eliminati += 1
+    return eliminati
+
+
+def _usato(percorso):
+    """Segna il PDF come usato di recente (la potatura segue l'mtime)"""
+    try:
+        os.utime(percorso)
+        return True
+    except OSError:
+        return False
+
+
+# ---------- pool ----------
+_pool = None
+_zip = None
+_cartella_zip = None
+_in_corso = {}  # percorso -> Future delle richieste singole
+_zip_in_corso = {}  # (anno, mese) -> (versione archivio, Future)
+_lock = threading.RLock()
+
+
+def _pool_pdf():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn: il processo Streamlit ha più thread e fork potrebbe bloccarsi
+            _pool = ProcessPoolExecutor(max_workers=PROCESSI, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _invia(funzione, *argomenti):
+    """submit() sul pool, ricreato una volta se un processo è morto"""
+    global _pool
+    try:
+        return _pool_pdf().submit(funzione, *argomenti)
+    except BrokenProcessPool:
+        with _lock:
+            _pool = None
+        return _pool_pdf().submit(funzione, *argomenti)
+
+
+def _pronto(percorso):
+    futuro = Future()
+    futuro.set_result(percorso)
+    return futuro
+
+
+def richiedi_pdf(fattura, tipo):
+    """Future con il percorso del PDF, senza attendere: già concluso se il PDF è in cache,
+    altrimenti accodato al pool (una sola volta per fattura). None se la coda è piena."""
+    percorso = percorso_pdf(fattura, tipo)
+    if _usato(percorso):
+        return _pronto(percorso)
+    with _lock:
+        futuro = _in_corso.get(percorso)
+        if futuro is None:
+            if len(_in_corso) >= CODA_MASSIMA:
+                return None
+            futuro = _invia(_genera, dict(fattura), tipo, percorso)
+            _in_corso[percorso] = futuro
+            futuro.add_done_callback(lambda f: _in_corso.pop(percorso, None))
+    return futuro
+
+
+def pdf_zip(fatture, destinazione):
+    """Scrive in uno ZIP un PDF per fattura [(tipo, fattura)], generando nel pool solo
+    quelli che non sono in cache; restituisce il numero di fatture esportate"""
+    percorsi = [percorso_pdf(fattura, tipo) for tipo, fattura in fatture]
+    mancanti = [(dict(fattura), tipo, percorso) for (tipo, fattura), percorso in zip(fatture, percorsi)
+                if not _usato(percorso)]
+    if mancanti:
+        blocchi = [mancanti[i:i + BLOCCO_PDF] for i in range(0, len(mancanti), BLOCCO_PDF)]
+        for futuro in [_invia(_genera_blocco, blocco) for blocco in blocchi]:
+            futuro.result()
+    usati = set()
+    with zipfile.ZipFile(destinazione, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for (tipo, fattura), percorso in zip(fatture, percorsi):
+            nome = base = nome_file_pdf(fattura, tipo)
+            # numeri duplicati: dal secondo file un suffisso progressivo, finché il nome non è libero
+            n = 1
+            while nome in usati:
+                nome = f"{base[:-4]}_{n}.pdf"
+                n += 1
+            usati.add(nome)
+            zf.write(percorso, nome)
+    pota_cache()
+    return len(fatture)
+
+
+def _zip_periodo(anno, mese, versione):
+    from esporta import fatture_periodo
+
+    global _cartella_zip
+    with _lock:
+        if _cartella_zip is None:
+            _cartella_zip = tempfile.mkdtemp(prefix="invoicepro_pdf_")
+    percorso = os.path.join(_cartella_zip, f"Fatture_PDF_{anno}_{mese or 'anno'}_{versione}.zip")
+    try:
+        with open(percorso, "wb") as f:
+            pdf_zip(fatture_periodo(anno, mese), f)
+    except:
+        if os.path.exists(percorso):
+            os.remove(percorso)
+        raise
+    return percorso
+
+
+def _elimina_zip(futuro):
+    """Elimina lo ZIP del Future non più in uso (appena concluso, se è ancora in corso)"""
+    def elimina(f):
+        if not f.cancelled() and f.exception() is None and os.path.exists(f.result()):
+            os.remove(f.result())
+    futuro.add_done_callback(elimina)
+
+
+def zip_pdf_periodo(anno, mese=None):
+    """Future con il percorso di uno ZIP temporaneo dei PDF del periodo, costruito in
+    background; la stessa richiesta ad archivio invariato riusa il Future precedente"""
+    global _zip
+    import archivio
+
+    versione = archivio.versione_dati()
+    with _lock:
+        precedente = _zip_in_corso.pop((anno, mese), None)
+        if precedente is not None:
+            futuro = precedente[1]
+            if precedente[0] == versione and (not futuro.done() or (
+                    futuro.exception() is None and os.path.exists(futuro.result()))):
+                _zip_in_corso[(anno, mese)] = precedente  # in fondo: usato di recente
+                return futuro
+            _elimina_zip(futuro)  # archivio cambiato: lo ZIP vecchio non serve più
+        if _zip is None:
+            _zip = ThreadPoolExecutor(max_workers=1, thread_name_prefix="invoicepro-pdf")
+        futuro = _zip.submit(_zip_periodo, anno, mese, versione)
+        _zip_in_corso[(anno, mese)] = (versione, futuro)
+        # al massimo ZIP_TENUTI periodi su disco: si elimina quello richiesto meno di recente
+        while len(_zip_in_corso) > ZIP_TENUTI:
+            _elimina_zip(_zip_in_corso.pop(next(iter(_zip_in_corso)))[1])
+        return futuro
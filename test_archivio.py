@@ -0,0 +1,107 @@
+"""Journal dopo un crash: le righe incomplete non devono far perdere i salvataggi successivi."""
+import json
+import os
+import threading
+
+from archivio import ArchivioJournal
+
+
+def _archivio(cartella):
+    return ArchivioJournal(os.path.join(cartella, "fatture.json"), os.path.join(cartella, "fatture.journal.jsonl"))
+
+
+def test_riga_incompleta_non_fa_perdere_il_salvataggio_successivo(tmp_path):
+    archivio = _archivio(tmp_path)
+    assert archivio.aggiungi("Attiva", {"numero": "2026/1", "data": "01/01/2026", "totale": 10.0})
+    # crash a metà scrittura: l'ultima riga del journal resta senza "\n"
+    with open(archivio.percorso_journal, "ab") as f:
+        f.write(b'{"seq": 2, "op": "ins", "tipo": "Attiva", "id": "x", "fattura": {"num')
+
+    archivio = _archivio(tmp_path)
+    assert [f["numero"] for f in archivio.leggi()["Attiva"]] == ["2026/1"]
+    assert archivio.aggiungi("Attiva", {"numero": "2026/2", "data": "02/01/2026", "totale": 20.0})
+
+    # un processo nuovo rilegge snapshot e journal da disco
+    riletto = _archivio(tmp_path).leggi()
+    assert [f["numero"] for f in riletto["Attiva"]] == ["2026/1", "2026/2"]
+
+
+def test_journal_integro_dopo_il_troncamento(tmp_path):
+    archivio = _archivio(tmp_path)
+    archivio.aggiungi("Passiva", {"numero": "A", "data": "01/01/2026", "totale": 1.0})
+    with open(archivio.percorso_journal, "ab") as f:
+        f.write(b'{"seq": 2, "op"')
+    _archivio(tmp_path).aggiungi("Passiva", {"numero": "B", "data": "01/01/2026", "totale": 2.0})
+
+    with open(archivio.percorso_journal, "rb") as f:
+        righe = f.read().splitlines(keepends=True)
+    assert [json.loads(r)["fattura"]["numero"] for r in righe] == ["A", "B"]
+
+
+def test_lettura_non_attende_una_scrittura_in_corso(tmp_path):
+    archivio = _archivio(tmp_path)
+    archivio.aggiungi("Attiva", {"numero": "1", "data": "01/01/2026", "totale": 1.0})
+    archivio.leggi()
+    preso, libera = threading.Event(), threading.Event()
+
+    def scrittura_bloccata():
+        # come _accoda in attesa del lock su file di un altro processo
+        with archivio._lock:
+            preso.set()
+            libera.wait(5)
+
+    scrittore = threading.Thread(target=scrittura_bloccata)
+    scrittore.start()
+    preso.wait(5)
+    try:
+        assert [f["numero"] for f in archivio.leggi()["Attiva"]] == ["1"]
+        # un altro processo accoda: la lettura non attende e restituisce l'ultima vista completa
+        _archivio(tmp_path).aggiungi("Attiva", {"numero": "2", "data": "01/01/2026", "totale": 1.0})
+        assert [f["numero"] for f in archivio.leggi()["Attiva"]] == ["1"]
+    finally:
+        libera.set()
+        scrittore.join()
+    assert [f["numero"] for f in archivio.leggi()["Attiva"]] == ["1", "2"]
+
+
+class _Contatore:
+    """Indice minimo: quante fatture per tipo"""
+
+    def __init__(self):
+        self.n = {}
+
+    def ricostruisci(self, dati):
+        self.n = {tipo: len(fatture) for tipo, fatture in dati.items()}
+
+    def aggiorna(self, tipo, vecchia, nuova):
+        self.n[tipo] = self.n.get(tipo, 0) + (nuova is not None) - (vecchia is not None)
+
+
+def test_indici_per_anno_dopo_copy_on_write(tmp_path):
+    from archivio_anni import ArchivioAnni
+
+    archivio = ArchivioAnni(str(tmp_path / "fatture_anni"))
+    indice = _Contatore()
+    archivio.registra(indice)
+    archivio.aggiungi("Attiva", {"numero": "1", "data": "01/03/2026", "totale": 1.0})
+    vista = archivio.leggi_anno(2026)
+    archivio.aggiungi("Attiva", {"numero": "2", "data": "02/03/2026", "totale": 1.0})
+    assert len(vista["Attiva"]) == 1  # la vista già letta non cambia
+    assert indice.n["Attiva"] == 2
+    archivio.cancella()
+    assert archivio.leggi()["Attiva"] == [] and indice.n["Attiva"] == 0
+
+
+def test_sqlite_conserva_le_date_non_interpretabili(tmp_path):
+    from archivio_sqlite import ArchivioSqlite
+
+    fatture = [
+        {"numero": "1", "data": "01/03/2026", "scadenza": "31/03/2026", "totale": 1.0},
+        {"numero": "2", "data": "2026-03-02", "scadenza": "", "totale": 1.0},
+        {"numero": "3", "data": "fine marzo", "scadenza": "30/04", "totale": 1.0},
+        {"numero": "4", "data": "04/03/2026", "totale": 1.0},
+    ]
+    db = ArchivioSqlite(str(tmp_path / "fatture.db"))
+    assert db.scrivi({"Attiva": [dict(f) for f in fatture], "Passiva": []})
+    riletti = ArchivioSqlite(str(tmp_path / "fatture.db")).leggi()["Attiva"]
+    assert [{k: v for k, v in f.items() if k != "id"} for f in riletti] == fatture
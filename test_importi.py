@@ -0,0 +1,30 @@
+"""Stesso arrotondamento al centesimo per importi singoli, array e somme SQLite."""
+import numpy as np
+
+from archivio_sqlite import ArchivioSqlite
+from importi import centesimi, centesimi_array, euro, somma
+
+# mezzi centesimi: 1.005 e 2.675 in binario stanno appena sotto il mezzo, 0.125 esattamente sul mezzo
+MEZZI = [0.125, 1.005, 2.675, 0.015, 10.005, 1234.565, -0.125, -1.005]
+
+
+def test_array_come_scalare():
+    assert centesimi_array(MEZZI).tolist() == [centesimi(v) for v in MEZZI]
+    assert centesimi(0.125) == 13 and centesimi(1.005) == 101
+
+
+def test_array_come_scalare_su_importi_casuali():
+    valori = np.round(np.random.default_rng(0).uniform(-1e6, 1e6, 100_000), 3)
+    assert centesimi_array(valori).tolist() == [centesimi(v) for v in valori.tolist()]
+
+
+def test_somme_uguali_su_tutti_i_percorsi(tmp_path):
+    attese = sum(centesimi(v) for v in MEZZI)
+    assert somma(MEZZI) == euro(attese)
+    assert int(centesimi_array(MEZZI).sum()) == attese
+
+    db = ArchivioSqlite(str(tmp_path / "fatture.db"))
+    assert db.scrivi({"Attiva": [{"data": "01/01/2026", "numero": str(i), "totale": v}
+                                 for i, v in enumerate(MEZZI)], "Passiva": []})
+    assert db.riepilogo("Attiva") == (len(MEZZI), euro(attese))
+    assert db.riepilogo("Attiva", 2026) == (len(MEZZI), euro(attese))